@@ -1,5 +1,8 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, g, has_app_context, has_request_context, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
+from flask.cli import with_appcontext
 from flask_bcrypt import Bcrypt
 from flask_migrate import Migrate  # Import Flask-Migrate
 from sqlalchemy_serializer import SerializerMixin
@@ -7,30 +10,934 @@ import jwt
 from datetime import datetime, timedelta
 from functools import wraps
 from flask_cors import CORS
-from sqlalchemy import extract, func  # To filter by month
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import extract, func, event  # To filter by month
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import Pool, QueuePool
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import DBAPIError, IntegrityError, SQLAlchemyError
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
 import os
+import hashlib
+import hmac
+import io
+import json
+import math
+import random
+import secrets
+import socket
+import bisect
+import click
+import csv
 import requests
+import sqlite3
+import unicodedata
+import threading
+import time
+import weakref
+import prometheus_client as prom
+from prometheus_client import multiprocess
+
+try:
+    import orjson  # Optional: much faster encoder, falls back to the stdlib one
+except ImportError:
+    orjson = None
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError  # Optional: needed only for image uploads
+except ImportError:
+    Image = ImageOps = UnidentifiedImageError = None
 
 load_dotenv()
 
 
-app = Flask(__name__)
-CORS(app, supports_credentials=True, resources={r"/*": {"origins": os.getenv("CORS_ORIGINS", "*").split(",")}})
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("SQLALCHEMY_DATABASE_URI")
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = os.getenv("SECRET_KEY")
-restricted_words = os.getenv("RESTRICTED_WORDS", "").split(",")
-@app.route('/restricted_words', methods=['GET'])
+# ============================
+#   Blueprints
+# ============================
+# Always registered: auth, request hooks, metrics, batch and debug endpoints
+core_bp = Blueprint("core", __name__)
+
+# Subsystems, enabled per deployment through ENABLED_BLUEPRINTS (see create_app)
+karaoke_bp = Blueprint("karaoke", __name__)  # Live karaoke night: queue, form state, DJ notes
+finance_bp = Blueprint("finance", __name__)  # Expenses, income, mileage, hosting contracts
+public_bp = Blueprint("public", __name__)  # Public site: reviews, gallery, promotions, media
+admin_bp = Blueprint("admin", __name__)  # Admin CRM: contacts, bookings, inquiries (public forms post via public_bp)
+
+BLUEPRINTS = {
+    "karaoke": karaoke_bp,
+    "finance": finance_bp,
+    "public": public_bp,
+    "admin": admin_bp,
+}
+
+
+@karaoke_bp.route('/restricted_words', methods=['GET'])
 def get_restricted_words():
-    return jsonify(restricted_words) 
+    return jsonify(restricted_word_matcher().words) 
+
+
+# ============================
+#   Restricted words
+# ============================
+LEET_TRANSLATION = str.maketrans({
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t",
+    "@": "a", "$": "s", "!": "i", "+": "t",
+})
+
+
+def normalize_for_matching(text):
+    """Lowercase, strip accents, undo leetspeak and join spaced-out letters ("b a d" -> "bad")."""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode().lower()
+    text = text.translate(LEET_TRANSLATION)
+    tokens = "".join(ch if ch.isalnum() else " " for ch in text).split()
+    joined, run = [], []
+    for token in tokens:
+        if len(token) == 1:
+            run.append(token)
+            continue
+        if run:
+            joined.append("".join(run))
+            run = []
+        joined.append(token)
+    if run:
+        joined.append("".join(run))
+    return " ".join(joined)
+
+
+class RestrictedWordMatcher:
+    """
+    Aho-Corasick automaton over the normalized word list; find() is linear in the text.
+    A match only counts when it covers whole tokens, so "hell" doesn't hit "Hello".
+    """
+
+    def __init__(self, words):
+        self.words = [word.strip() for word in words if word.strip()]
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        for word in self.words:
+            state = 0
+            normalized = normalize_for_matching(word)
+            for ch in normalized:
+                if ch not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][ch] = len(self.goto) - 1
+                state = self.goto[state][ch]
+            if state:
+                self.output[state].append((word, len(normalized)))
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(ch, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find(self, text):
+        found = set()
+        state = 0
+        text = normalize_for_matching(text)
+        for end, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            if not self.output[state] or (end + 1 < len(text) and text[end + 1] != " "):
+                continue
+            for word, length in self.output[state]:
+                start = end - length + 1
+                if start == 0 or text[start - 1] == " ":
+                    found.add(word)
+        return sorted(found)
+
+    def check_fields(self, data, fields):
+        """Names of the fields in data that contain a restricted word."""
+        return [field for field in fields if data.get(field) and self.find(data[field])]
+
+
+def load_restricted_words(app):
+    words = list(app.config['RESTRICTED_WORDS'])
+    path = app.config['RESTRICTED_WORDS_FILE']
+    mtime = None
+    if path and os.path.exists(path):
+        mtime = os.path.getmtime(path)
+        with open(path) as f:
+            words += f.read().replace("\n", ",").split(",")
+    app.extensions["restricted_words"] = {
+        "matcher": RestrictedWordMatcher(words),
+        "mtime": mtime,
+        "checked_at": time.monotonic(),
+        "lock": threading.Lock(),
+    }
+
+
+def restricted_word_matcher():
+    """Current matcher, recompiled when RESTRICTED_WORDS_FILE changes on disk."""
+    app = current_app._get_current_object()
+    state = app.extensions["restricted_words"]
+    path = app.config['RESTRICTED_WORDS_FILE']
+    if path and time.monotonic() - state["checked_at"] >= app.config['RESTRICTED_WORDS_RELOAD_SECONDS']:
+        with state["lock"]:
+            state["checked_at"] = time.monotonic()
+            mtime = os.path.getmtime(path) if os.path.exists(path) else None
+            if mtime != state["mtime"]:
+                print("🔄 Restricted word list changed, recompiling")
+                load_restricted_words(app)
+                state = app.extensions["restricted_words"]
+    return state["matcher"]
+# ============================
+#   Metrics (Prometheus)
+# ============================
+# Under gunicorn, PROMETHEUS_MULTIPROC_DIR (see gunicorn.conf.py) aggregates all workers
+METRICS_MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+REQUEST_LATENCY = prom.Histogram(
+    "http_request_duration_seconds", "Request latency by route", ["method", "rule"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+# Error rate: sum(rate(http_requests_total{status=~"4..|5.."}[5m])) by (rule)
+REQUEST_COUNT = prom.Counter("http_requests_total", "Requests by route and status", ["method", "rule", "status"])
+REQUESTS_IN_FLIGHT = prom.Gauge("http_requests_in_flight", "Requests currently being handled", multiprocess_mode="livesum")
+DB_POOL_CHECKOUT_WAIT = prom.Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection (excludes opening new ones)",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_CHECKED_OUT = prom.Gauge("db_pool_checked_out_connections", "Connections checked out of the pool", multiprocess_mode="livesum")
+CACHE_LOOKUPS = prom.Counter("cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+JOB_RUNS = prom.Counter("job_runs_total", "Background job attempts by kind and outcome", ["kind", "outcome"])
+
+
+def record_cache_lookup(cache, hit):
+    """Count a lookup against an in-process cache; hit ratio = hit / (hit + miss)."""
+    CACHE_LOOKUPS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that reports how long each checkout waited for a free connection.
+    Time spent opening a new connection is subtracted, so the histogram shows
+    pool contention rather than connect latency.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._checkout_state = threading.local()
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            state = self._checkout_state
+            state.connect_seconds = getattr(state, "connect_seconds", 0.0) + time.perf_counter() - start
+
+    def _do_get(self):
+        # QueuePool._do_get() retries by calling itself; only the outermost call observes
+        state = self._checkout_state
+        outermost = not getattr(state, "depth", 0)
+        if outermost:
+            state.connect_seconds = 0.0
+            start = time.perf_counter()
+        state.depth = getattr(state, "depth", 0) + 1
+        try:
+            return super()._do_get()
+        finally:
+            state.depth -= 1
+            if outermost:
+                DB_POOL_CHECKOUT_WAIT.observe(max(0.0, time.perf_counter() - start - state.connect_seconds))
+
+
+@event.listens_for(Pool, "checkout")
+def pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_POOL_CHECKED_OUT.inc()
+
+
+@event.listens_for(Pool, "checkin")
+def pool_checkin(dbapi_connection, connection_record):
+    DB_POOL_CHECKED_OUT.dec()
+
+
+@core_bp.before_app_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc()
+
+
+@core_bp.after_app_request
+def record_request_metrics(response):
+    started = g.get("request_started")
+    if started is None:
+        return response
+    rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+    status = str(response.status_code)
+    REQUEST_LATENCY.labels(request.method, rule).observe(time.perf_counter() - started)
+    REQUEST_COUNT.labels(request.method, rule, status).inc()
+    return response
+
+
+@core_bp.teardown_app_request
+def finish_request_metrics(exc):
+    if g.pop("request_started", None) is not None:
+        REQUESTS_IN_FLIGHT.dec()
+
+
+@core_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    if METRICS_MULTIPROCESS:
+        registry = prom.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prom.REGISTRY
+    return Response(prom.generate_latest(registry), content_type=prom.CONTENT_TYPE_LATEST)
+
+
+# ============================
+#   Rate limiting
+# ============================
+# "METHOD rule" -> (burst capacity, seconds to refill it). Venue Wi-Fi puts many
+# phones behind one IP, so the signup limit is deliberately generous.
+DEFAULT_RATE_LIMITS = {
+    "POST /karaokesignup": (20, 60),
+    "POST /reviews": (5, 600),
+    "POST /contacts": (5, 600),
+    "POST /general_inquiries": (5, 600),
+}
+
+
+def parse_rate_limits(value):
+    """Parse "POST /reviews=5/600,POST /contacts=3/600" into DEFAULT_RATE_LIMITS form."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        route, _, limit = item.rpartition("=")
+        capacity, _, period = limit.partition("/")
+        limits[route.strip()] = (int(capacity), float(period))
+    return limits
+
+
+def take_token(tokens, updated, capacity, rate, now):
+    """Token bucket step: returns (tokens left, seconds until the next token if refused)."""
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryRateLimitBackend:
+    """Per-process buckets; each gunicorn worker enforces its own copy of the limit."""
+
+    def __init__(self, max_keys=10000):
+        self.buckets = {}
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        now = time.time()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (capacity, now))
+            tokens, retry_after = take_token(tokens, updated, capacity, rate, now)
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets = {k: v for k, v in self.buckets.items() if now - v[1] < 3600}
+        return retry_after
+
+
+class SQLiteRateLimitBackend:
+    """Buckets in a local SQLite file shared by every worker on the host."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.calls = 0
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork
+        if getattr(self.local, "pid", None) != os.getpid():
+            self.local.connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def take(self, key, capacity, rate):
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens, retry_after = take_token(tokens, updated, capacity, rate, now)
+            connection.execute(
+                "INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            self.calls += 1
+            if self.calls % 1000 == 0:
+                connection.execute("DELETE FROM rate_limit_buckets WHERE updated < ?", (now - 3600,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+def create_rate_limiter(app):
+    if app.config['RATE_LIMIT_BACKEND'] == "sqlite":
+        return SQLiteRateLimitBackend(app.config['RATE_LIMIT_SQLITE_PATH'])
+    if app.config['RATE_LIMIT_BACKEND'] == "memory":
+        return MemoryRateLimitBackend()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND '{app.config['RATE_LIMIT_BACKEND']}'")
+
+
+@core_bp.before_app_request
+def enforce_rate_limits():
+    if request.url_rule is None:
+        return
+    route = f"{request.method} {request.url_rule.rule}"
+    limit = current_app.config['RATE_LIMITS'].get(route)
+    limiter = current_app.extensions.get("rate_limiter")
+    if not limit or limiter is None:
+        return
+
+    capacity, period = limit
+    try:
+        retry_after = limiter.take(f"{request.remote_addr}|{route}", capacity, capacity / period)
+    except Exception as e:
+        print(f"Rate limiter unavailable, allowing request: {e}")  # Fail open
+        return
+    if retry_after:
+        response = jsonify({"error": "Too many requests. Please try again shortly."})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(math.ceil(retry_after))
+        return response
+
+
+# ============================
+#   Idempotency keys
+# ============================
+# Public forms retried on flaky venue Wi-Fi: a repeated Idempotency-Key gets the
+# first response back without running the view again, and an identical body
+# seen within DUPLICATE_WINDOW_SECONDS (with or without a key) is flagged.
+IDEMPOTENT_ROUTES = {"POST /karaokesignup", "POST /reviews", "POST /contacts", "POST /general_inquiries"}
+# Refusals like 403/409/429 depend on server state and must not outlive it
+REPLAYABLE_ERROR_STATUSES = {400, 422}
+
+
+class MemoryIdempotencyStore:
+    """Per-process records; a retry landing on another worker is not recognised."""
+
+    def __init__(self, max_keys=10000):
+        self.records = {}  # key -> (expires, record)
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            expires, record = self.records.get(key, (0, None))
+            return record if expires > time.time() else None
+
+    def add(self, key, record, ttl):
+        """Store record unless a live one exists; returns whether it was stored."""
+        now = time.time()
+        with self.lock:
+            if self.records.get(key, (0, None))[0] > now:
+                return False
+            self.records[key] = (now + ttl, record)
+            if len(self.records) > self.max_keys:
+                self.records = {k: v for k, v in self.records.items() if v[0] > now}
+            return True
+
+    def put(self, key, record, ttl):
+        with self.lock:
+            self.records[key] = (time.time() + ttl, record)
+
+    def delete(self, key):
+        with self.lock:
+            self.records.pop(key, None)
+
+
+class SQLiteIdempotencyStore:
+    """Records in a local SQLite file shared by every worker on the host."""
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.calls = 0
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency_keys "
+                "(key TEXT PRIMARY KEY, record TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+
+    def _connection(self):
+        if getattr(self.local, "pid", None) != os.getpid():
+            self.local.connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT record FROM idempotency_keys WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def add(self, key, record, ttl):
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = connection.execute(
+                "INSERT INTO idempotency_keys (key, record, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET record = excluded.record, expires = excluded.expires "
+                "WHERE idempotency_keys.expires <= ?",
+                (key, json.dumps(record), now + ttl, now),
+            )
+            self.calls += 1
+            if self.calls % 1000 == 0:
+                connection.execute("DELETE FROM idempotency_keys WHERE expires <= ?", (now,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def put(self, key, record, ttl):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO idempotency_keys (key, record, expires) VALUES (?, ?, ?)",
+            (key, json.dumps(record), time.time() + ttl),
+        )
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM idempotency_keys WHERE key = ?", (key,))
+
+
+def create_idempotency_store(app):
+    if app.config['IDEMPOTENCY_BACKEND'] == "sqlite":
+        return SQLiteIdempotencyStore(app.config['IDEMPOTENCY_SQLITE_PATH'])
+    if app.config['IDEMPOTENCY_BACKEND'] == "memory":
+        return MemoryIdempotencyStore()
+    raise ValueError(f"Unknown IDEMPOTENCY_BACKEND '{app.config['IDEMPOTENCY_BACKEND']}'")
+
+
+def request_body_hash(route):
+    body = request.get_json(silent=True)
+    canonical = json.dumps(body, sort_keys=True) if body is not None else request.get_data(as_text=True)
+    return hashlib.sha256(f"{route}\n{canonical}".encode()).hexdigest()
+
+
+@core_bp.before_app_request
+def replay_idempotent_requests():
+    if request.url_rule is None:
+        return
+    route = f"{request.method} {request.url_rule.rule}"
+    store = current_app.extensions.get("idempotency_store")
+    if route not in IDEMPOTENT_ROUTES or store is None:
+        return
+
+    config = current_app.config
+    body_hash = request_body_hash(route)
+    key = (request.headers.get("Idempotency-Key") or "").strip()[:200]
+    record = None
+    try:
+        if key:
+            scoped_key = f"key|{route}|{key}"
+            if store.add(scoped_key, {"body_hash": body_hash, "status": None}, config['IDEMPOTENCY_PENDING_SECONDS']):
+                g.idempotency = (scoped_key, body_hash)
+            else:
+                record = store.get(scoped_key)
+        if record is None:
+            if store.add(f"duplicate|{body_hash}", {}, config['DUPLICATE_WINDOW_SECONDS']):
+                g.duplicate_hash = f"duplicate|{body_hash}"
+            else:
+                g.duplicate_submission = True
+                print(f"⚠️ Duplicate {route} body within {config['DUPLICATE_WINDOW_SECONDS']}s")
+    except Exception as e:
+        print(f"Idempotency store unavailable, processing request: {e}")  # Fail open
+        return
+
+    if record is None:
+        return  # First use of the key (or it expired in between): run the view
+    if record["body_hash"] != body_hash:
+        return jsonify({"error": "Idempotency-Key was already used with a different request"}), 422
+    if record["status"] is None:
+        response = jsonify({"error": "A request with this Idempotency-Key is still being processed"})
+        response.status_code = 409
+        response.headers["Retry-After"] = "1"
+        return response
+    response = current_app.response_class(record["body"], status=record["status"], mimetype=record["mimetype"])
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+@core_bp.after_app_request
+def store_idempotent_response(response):
+    if g.get("duplicate_submission"):
+        response.headers["Duplicate-Submission"] = "true"
+    duplicate_hash = g.pop("duplicate_hash", None)
+    idempotency = g.pop("idempotency", None)
+    store = current_app.extensions.get("idempotency_store")
+    if store is None:
+        return response
+    try:
+        if duplicate_hash and not 200 <= response.status_code < 300:
+            store.delete(duplicate_hash)  # A refused request doesn't make its retry a duplicate
+        if idempotency is None:
+            return response
+        scoped_key, body_hash = idempotency
+        if not (200 <= response.status_code < 300 or response.status_code in REPLAYABLE_ERROR_STATUSES):
+            store.delete(scoped_key)  # Let the client retry for real
+        else:
+            store.put(scoped_key, {
+                "body_hash": body_hash,
+                "status": response.status_code,
+                "body": response.get_data(as_text=True),
+                "mimetype": response.mimetype,
+            }, current_app.config['IDEMPOTENCY_TTL_SECONDS'])
+    except Exception as e:
+        print(f"Could not store idempotent response: {e}")
+    return response
+
+
+# ============================
+#   Read replica routing
+# ============================
+# Safe GETs read from the "replica" bind (SQLALCHEMY_REPLICA_URI) unless the client
+# wrote recently, the route is @use_primary, or the replica is failing.
+READ_PRIMARY_COOKIE = "read_primary_until"
+replica_state = {"down_until": 0.0}
+replica_state_lock = threading.Lock()
+
+
+def use_primary(view):
+    """Keep a GET route on the primary (e.g. it creates rows on first read)."""
+    view.use_primary = True
+    return view
+
+
+def mark_replica_down():
+    with replica_state_lock:
+        replica_state["down_until"] = time.time() + current_app.config['REPLICA_RETRY_SECONDS']
+    print("⚠️ Read replica unavailable, falling back to primary")
+
+
+def should_read_from_replica():
+    if not has_request_context() or request.method not in ("GET", "HEAD"):
+        return False
+    if "read_from_replica" not in g:
+        view = current_app.view_functions.get(request.endpoint)
+        sticky_until = request.cookies.get(READ_PRIMARY_COOKIE, "")
+        g.read_from_replica = (
+            "replica" in current_app.config.get('SQLALCHEMY_BINDS', {})
+            and not getattr(view, "use_primary", False)
+            and not request.headers.get("X-Read-Primary")
+            and not (sticky_until.replace(".", "", 1).isdigit() and float(sticky_until) > time.time())
+            and replica_state["down_until"] <= time.time()
+        )
+    return g.read_from_replica
+
+
+class RoutingSession(FlaskSQLAlchemySession):
+    """
+    Sends reads in safe GET requests to the replica; flushes and DML always go to the primary.
+    A read that fails because the replica is unreachable is retried once on the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not getattr(clause, "is_dml", False):
+            if should_read_from_replica():
+                return self._db.engines["replica"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _with_primary_fallback(self, method, *args, **kwargs):
+        try:
+            return method(*args, **kwargs)
+        except DBAPIError:
+            if not (has_request_context() and g.pop("replica_failed", False)):
+                raise
+            g.read_from_replica = False  # Rest of this request reads the primary too
+            self.rollback()
+            return method(*args, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self._with_primary_fallback(super().execute, *args, **kwargs)
+
+    def scalar(self, *args, **kwargs):
+        return self._with_primary_fallback(super().scalar, *args, **kwargs)
+
+    def scalars(self, *args, **kwargs):
+        return self._with_primary_fallback(super().scalars, *args, **kwargs)
+
+
+@event.listens_for(Engine, "handle_error")
+def detect_replica_failure(context):
+    if not has_app_context() or context.engine is not db.engines.get("replica"):
+        return
+    if context.is_disconnect or context.connection is None:  # Lost connection or could not connect
+        mark_replica_down()
+        if has_request_context():
+            g.replica_failed = True  # RoutingSession replays the read on the primary
+
+
+@core_bp.after_app_request
+def stick_writers_to_primary(response):
+    # Read-your-writes: after a successful mutation this client reads the primary for a while
+    if (
+        request.method in ("POST", "PUT", "PATCH", "DELETE")
+        and response.status_code < 400
+        and "replica" in current_app.config.get('SQLALCHEMY_BINDS', {})
+    ):
+        window = current_app.config['READ_YOUR_WRITES_SECONDS']
+        response.set_cookie(
+            READ_PRIMARY_COOKIE, str(time.time() + window), max_age=window, httponly=True,
+            secure=request.is_secure, samesite="None" if request.is_secure else "Lax",
+        )
+    return response
+
+
+@click.command("sync-replica")
+@with_appcontext
+def sync_replica_command():
+    """Copy the primary SQLite file into the replica file (local stand-in for replication)."""
+    primary, replica = db.engines[None].url, db.engines["replica"].url
+    if primary.get_backend_name() != "sqlite" or replica.get_backend_name() != "sqlite":
+        raise click.ClickException("sync-replica only supports two SQLite files")
+    source, target = sqlite3.connect(primary.database), sqlite3.connect(replica.database)
+    with target:
+        source.backup(target)
+    source.close()
+    target.close()
+    click.echo(f"Copied {primary.database} -> {replica.database}")
+
+
 # Initialize Extensions
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-migrate = Migrate(app, db) 
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+bcrypt = Bcrypt()
+migrate = Migrate() 
+
+
+# ============================
+#   JSON encoding
+# ============================
+def _json_default(value):
+    # Stray datetimes are emitted as ISO 8601 (Flask's default is an HTTP date)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return DefaultJSONProvider.default(value)
+
+
+class StdJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_json_default)
+
+
+class OrjsonJSONProvider(DefaultJSONProvider):
+    """orjson-backed provider; datetimes are encoded natively in the same pass."""
+    default = staticmethod(_json_default)
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+JSON_PROVIDERS = {"std": StdJSONProvider}
+if orjson is not None:
+    JSON_PROVIDERS["orjson"] = OrjsonJSONProvider
+
+
+# Output formats models can declare once in __datetime_formats__
+DATETIME_FORMATTERS = {
+    "date": lambda value: value.isoformat()[:10],  # "%Y-%m-%d"
+    "datetime": lambda value: value.isoformat(" ", "seconds"),  # "%Y-%m-%d %H:%M:%S"
+    "iso": lambda value: value.isoformat(),
+}
+
+
+class DatetimeFormatMixin:
+    """Formats datetime columns by the model's {field: format} declaration."""
+    __datetime_formats__ = {}
+
+    def format_datetime(self, field):
+        value = getattr(self, field)
+        if value is None:
+            return None
+        return DATETIME_FORMATTERS[self.__datetime_formats__[field]](value)
+
+
+
+# ============================
+#   SQL instrumentation
+# ============================
+class RequestSQLStats:
+    """Statement count, DB time and repeated statements for one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_statement = None
+        self.statements = Counter()
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.statements[statement] += 1
+        if elapsed > self.slowest:
+            self.slowest = elapsed
+            self.slowest_statement = statement
+
+    def repeated(self, threshold):
+        return {stmt: n for stmt, n in self.statements.items() if n >= threshold}
+
+
+route_sql_history = {}
+route_sql_flags = {}
+route_sql_lock = threading.Lock()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def sql_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def sql_after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts or not has_request_context():
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if "sql_stats" not in g:
+        g.sql_stats = RequestSQLStats()
+    g.sql_stats.record(statement, elapsed)
+
+
+@core_bp.after_app_request
+def record_sql_stats(response):
+    config = current_app.config
+    stats = g.pop("sql_stats", None) or RequestSQLStats()
+    # Unmatched paths share one bucket so random 404s can't grow the history without bound
+    route = f"{request.method} {request.url_rule.rule if request.url_rule else '<unmatched>'}"
+    repeated = stats.repeated(config['SQL_REPEAT_THRESHOLD'])
+
+    with route_sql_lock:
+        history = route_sql_history.get(route)
+        if history is None:
+            history = route_sql_history[route] = deque(maxlen=config['SQL_SUMMARY_WINDOW'])
+        history.append((stats.count, stats.total, stats.slowest, stats.slowest_statement, bool(repeated)))
+        if repeated:
+            route_sql_flags[route] = repeated
+        elif not any(entry[4] for entry in history):
+            route_sql_flags.pop(route, None)  # The flag ages out with the window
+
+    if repeated:
+        for statement, n in repeated.items():
+            print(f"⚠️ {route} ran the same statement {n}x (N+1 / per-row loop?): {statement[:120]}")
+
+    if current_app.debug or config['SQL_DEBUG_HEADERS']:
+        response.headers["X-DB-Query-Count"] = str(stats.count)
+        response.headers["X-DB-Time-Ms"] = f"{stats.total * 1000:.2f}"
+        response.headers["X-DB-Slowest-Ms"] = f"{stats.slowest * 1000:.2f}"
+        response.headers["X-DB-Repeated-Statements"] = str(len(repeated))
+        response.headers["X-DB-Read-From"] = "replica" if g.get("read_from_replica") else "primary"
+    return response
+
+
+@core_bp.route("/debug/sql", methods=["GET"])
+def get_sql_summary():
+    """Rolling per-route SQL summary over the last SQL_SUMMARY_WINDOW requests."""
+    with route_sql_lock:
+        history = {route: list(entries) for route, entries in route_sql_history.items()}
+        flags = dict(route_sql_flags)
+
+    summary = {}
+    for route, entries in history.items():
+        counts = [entry[0] for entry in entries]
+        times = sorted(entry[1] for entry in entries)
+        slowest = max(entries, key=lambda entry: entry[2])
+        summary[route] = {
+            "requests": len(entries),
+            "avg_queries": round(sum(counts) / len(entries), 2),
+            "max_queries": max(counts),
+            "avg_db_ms": round(sum(times) / len(entries) * 1000, 2),
+            "p95_db_ms": round(times[int(0.95 * (len(times) - 1))] * 1000, 2),
+            "slowest_ms": round(slowest[2] * 1000, 2),
+            "slowest_statement": slowest[3],
+            "repeated_statements": flags.get(route, {}),
+        }
+    return jsonify(summary), 200
+
+
+# ============================
+#   Database engine profiles
+# ============================
+# Selected with DB_PROFILE; defaults to "local" for SQLite and "web" otherwise
+DB_PROFILES = {
+    "local": {
+        "pool_size": 2, "max_overflow": 2, "pool_timeout": 10,
+        "pool_pre_ping": False, "pool_recycle": -1, "statement_timeout_ms": None,
+    },
+    "web": {
+        "pool_size": 5, "max_overflow": 5, "pool_timeout": 10,
+        "pool_pre_ping": True, "pool_recycle": 1800, "statement_timeout_ms": 5000,
+    },
+    # Hosted Postgres tiers with a low connection cap and aggressive idle kills
+    "small": {
+        "pool_size": 2, "max_overflow": 2, "pool_timeout": 5,
+        "pool_pre_ping": True, "pool_recycle": 280, "statement_timeout_ms": 5000,
+    },
+    # One-off scripts and maintenance jobs
+    "batch": {
+        "pool_size": 1, "max_overflow": 0, "pool_timeout": 30,
+        "pool_pre_ping": True, "pool_recycle": 1800, "statement_timeout_ms": 120000,
+    },
+}
+POOL_OPTIONS = ("pool_size", "max_overflow", "pool_timeout", "pool_pre_ping", "pool_recycle")
+
+
+def statement_timeout(ms):
+    """Override the profile's statement timeout for one route."""
+    def decorator(view):
+        view.statement_timeout_ms = ms
+        return view
+    return decorator
+
+
+@event.listens_for(Session, "after_begin")
+def apply_route_statement_timeout(session, transaction, connection):
+    if connection.dialect.name != "postgresql" or not has_request_context():
+        return
+    view = current_app.view_functions.get(request.endpoint)
+    timeout = getattr(view, "statement_timeout_ms", None)
+    if timeout:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+
+def dispose_engines(app, close=True):
+    """Drop pooled connections; close=False in a forked child leaves the parent's sockets alone."""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+
 # User model (for admin users)
 # Before Request Hook
-@app.before_request
+@core_bp.before_app_request
 def before_request():
     print(f"Incoming request to: {request.path} [{request.method}]")
 
@@ -48,6 +955,8 @@ def before_request():
         "/expenses": ["POST", "PATCH", "DELETE", "GET"],
         "/signup": ["POST"],
         "/login": ["POST"],
+        "/token/refresh": ["POST"],
+        "/token/revoke": ["POST"],
         "/reviews": ["GET", "POST"],
         "/bookings/monthly-earnings": ["GET"],
         "/bookings/search": ["GET"],
@@ -81,7 +990,11 @@ def before_request():
         "/karaokesettings": ["GET","PATCH"],
         "/reviews/<int:id>/approve":["PATCH"],
         "/instagram-posts":["PATCH", "GET", "POST"],
-        "/slider-images":["POST", "GET", "PATCH", "DELETE"]
+        "/slider-images":["POST", "GET", "PATCH", "DELETE"],
+        "/metrics": ["GET"],
+        "/show-sessions/current": ["GET"],
+        "/song-catalog": ["GET"],
+        "/media": ["GET"],
 
 
         
@@ -91,8 +1004,21 @@ def before_request():
     if request.method == 'OPTIONS':
         return  # Let CORS handle it
 
+    # Exact paths that stay admin-only even though a public prefix above covers them
+    admin_only_endpoints = {
+        "/gallery/upload": ["POST"],
+        "/slider-images/upload": ["POST"],
+        "/formstate/pin": ["GET"],
+        "/formstate/set_pin": ["POST"],
+        "/formstate/update_pin": ["PATCH"],
+        "/formstate/delete_pin": ["DELETE"],
+        "/karaokesignup/rotation": ["PATCH"],
+        "/karaokesignup/order": ["PATCH"],
+    }
+    protected = request.method in admin_only_endpoints.get(request.path, [])
+
     for endpoint, methods in public_endpoints.items():
-        if request.path.startswith(endpoint) and request.method in methods:
+        if not protected and request.path.startswith(endpoint) and request.method in methods:
             print("Public endpoint, skipping token verification.")
             return
 
@@ -102,7 +1028,7 @@ def before_request():
     
     try:
         token = token.split(" ")[1]
-        decoded_token = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+        decoded_token = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
         current_user = User.query.filter_by(id=decoded_token['user_id']).first()
 
         if not current_user or not current_user.is_admin:
@@ -116,11 +1042,608 @@ class User(db.Model):
     password = db.Column(db.String(255), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
 
+
+class RefreshToken(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)  # sha256 of the token, never the token itself
+    family_id = db.Column(db.String(32), nullable=False, index=True)  # Every rotation of one login shares a family
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# ============================
+#   Password hashing
+# ============================
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread pool; callers past the queue limit are refused, not queued."""
+
+    def __init__(self, workers, max_pending, timeout):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.slots = threading.BoundedSemaphore(workers + max_pending)
+        self.timeout = timeout
+
+    def _run(self, func, *args):
+        if not self.slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            future = self.executor.submit(func, *args)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future.result(timeout=self.timeout)
+
+    def check(self, pw_hash, password):
+        return self._run(bcrypt.check_password_hash, pw_hash, password)
+
+    def hash(self, password):
+        return self._run(bcrypt.generate_password_hash, password).decode('utf-8')
+
+
+def password_hasher():
+    return current_app.extensions["password_hasher"]
+
+
+def password_needs_rehash(pw_hash):
+    """True when the stored hash was made with a different cost than BCRYPT_LOG_ROUNDS."""
+    try:
+        return int(pw_hash.split("$")[2]) != current_app.config['BCRYPT_LOG_ROUNDS']
+    except (IndexError, ValueError):
+        return False
+
+
+def hash_refresh_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_access_token(user):
+    return jwt.encode({
+        'user_id': user.id,
+        'is_admin': user.is_admin,  # Include is_admin field
+        'exp': datetime.utcnow() + timedelta(minutes=current_app.config['ACCESS_TOKEN_MINUTES'])
+    }, current_app.config['SECRET_KEY'], algorithm="HS256")
+
+
+def issue_refresh_token(user, family_id=None):
+    """Add a new refresh token row (caller commits) and return the raw token."""
+    token = secrets.token_urlsafe(48)
+    db.session.add(RefreshToken(
+        user_id=user.id,
+        token_hash=hash_refresh_token(token),
+        family_id=family_id or secrets.token_hex(16),
+        expires_at=datetime.utcnow() + timedelta(days=current_app.config['REFRESH_TOKEN_DAYS']),
+    ))
+    return token
+
+
+def token_response(user, refresh_token):
+    return jsonify({
+        "token": issue_access_token(user),
+        "refresh_token": refresh_token,
+        "expires_in": current_app.config['ACCESS_TOKEN_MINUTES'] * 60,
+        "is_admin": user.is_admin,
+    }), 200
+
+# ============================
+#   Background jobs
+# ============================
+# The job table is the queue: worker threads in each process claim rows with a
+# conditional UPDATE, so no broker is needed and queued work survives restarts.
+JOB_HANDLERS = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help (bad payload, missing record)."""
+
+
+def job_handler(kind):
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+class Job(DatetimeFormatMixin, db.Model):
+    __tablename__ = "job"
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # Key into JOB_HANDLERS
+    payload = db.Column(db.Text, nullable=True)  # JSON
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued, running, succeeded, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    idempotency_key = db.Column(db.String(120), unique=True, nullable=True)  # Same key -> same job, forever
+    coalesce_key = db.Column(db.String(120), nullable=True, index=True)  # Same key -> same job while queued
+    result = db.Column(db.Text, nullable=True)  # JSON returned by the handler
+    last_error = db.Column(db.Text, nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    __datetime_formats__ = {"run_after": "iso", "created_at": "iso", "finished_at": "iso"}
+    __table_args__ = (db.Index("ix_job_status_run_after", "status", "run_after"),)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "run_after": self.format_datetime("run_after"),
+            "idempotency_key": self.idempotency_key,
+            "result": json.loads(self.result) if self.result else None,
+            "last_error": self.last_error,
+            "created_at": self.format_datetime("created_at"),
+            "finished_at": self.format_datetime("finished_at"),
+        }
+
+
+def enqueue_job(kind, payload=None, idempotency_key=None, coalesce_key=None, max_attempts=None):
+    """Persist a job (committing the session) and wake this process's workers."""
+    if idempotency_key:
+        existing = Job.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing:
+            return existing
+    if coalesce_key:
+        existing = Job.query.filter_by(coalesce_key=coalesce_key, status="queued").first()
+        if existing:
+            return existing
+
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        idempotency_key=idempotency_key,
+        coalesce_key=coalesce_key,
+        max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # Lost a race on the idempotency key
+        return Job.query.filter_by(idempotency_key=idempotency_key).first()
+
+    queue = current_app.extensions["job_queue"]
+    queue.start()
+    queue.notify()
+    return job
+
+
+def job_backoff(attempts):
+    """Exponential backoff with jitter: base * 2^(attempts-1), capped, scaled by 0.5-1.0."""
+    base = current_app.config['JOB_BACKOFF_SECONDS'] * 2 ** (attempts - 1)
+    return min(base, current_app.config['JOB_BACKOFF_MAX_SECONDS']) * random.uniform(0.5, 1.0)
+
+
+def requeue_stale_jobs():
+    """Give jobs back to the queue when their worker died mid-run."""
+    lease_expired = datetime.utcnow() - timedelta(seconds=current_app.config['JOB_LEASE_SECONDS'])
+    requeued = Job.query.filter(Job.status == "running", Job.locked_at < lease_expired).update(
+        {"status": "queued", "locked_by": None, "locked_at": None}, synchronize_session=False
+    )
+    db.session.commit()
+    return requeued
+
+
+def run_next_job(worker_id):
+    """Claim and run one due job. Returns False when nothing was due."""
+    now = datetime.utcnow()
+    job_id = db.session.scalar(
+        db.select(Job.id).where(Job.status == "queued", Job.run_after <= now)
+        .order_by(Job.run_after, Job.id).limit(1)
+    )
+    if job_id is None:
+        return False
+    claimed = db.session.execute(
+        db.update(Job).where(Job.id == job_id, Job.status == "queued")
+        .values(status="running", locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+    ).rowcount
+    db.session.commit()
+    if claimed:
+        execute_job(db.session.get(Job, job_id))
+    return True
+
+
+def execute_job(job):
+    job_id, kind = job.id, job.kind
+    try:
+        handler = JOB_HANDLERS.get(kind)
+        if handler is None:
+            raise PermanentJobError(f"No handler for job kind '{kind}'")
+        result = handler(json.loads(job.payload or "{}"))
+        job = db.session.get(Job, job_id)
+        job.status = "succeeded"
+        job.result = json.dumps(result) if result is not None else None
+        job.last_error = None
+        outcome = "succeeded"
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.last_error = f"{type(e).__name__}: {e}"[:2000]
+        if isinstance(e, PermanentJobError) or job.attempts >= job.max_attempts:
+            job.status = "failed"
+            outcome = "failed"
+        else:
+            job.status = "queued"
+            job.run_after = datetime.utcnow() + timedelta(seconds=job_backoff(job.attempts))
+            outcome = "retried"
+        print(f"❌ Job {job_id} ({kind}) attempt {job.attempts} failed: {e}")
+    if job.status != "queued":
+        job.finished_at = datetime.utcnow()
+    job.locked_by = job.locked_at = None
+    db.session.commit()
+    JOB_RUNS.labels(kind=kind, outcome=outcome).inc()
+
+
+class JobQueue:
+    """Per-process worker threads; started lazily on first enqueue or by warm-up."""
+
+    def __init__(self, app, workers, poll_seconds):
+        self.app = app
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.pid = None
+
+    def start(self):
+        with self.lock:
+            # Threads do not survive fork, so a new pid means starting over
+            if self.workers <= 0 or (self.pid == os.getpid() and any(t.is_alive() for t in self.threads)):
+                return
+            self.pid = os.getpid()
+            self.stopping.clear()
+            self.threads = [
+                threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self.threads:
+                thread.start()
+
+    def notify(self):
+        self.wake.set()
+
+    def stop(self, timeout=5):
+        self.stopping.set()
+        self.wake.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _run(self):
+        worker_id = f"{os.getpid()}-{threading.current_thread().name}"
+        next_reap = 0.0
+        while not self.stopping.is_set():
+            ran = False
+            try:
+                with self.app.app_context():
+                    if time.monotonic() >= next_reap:
+                        requeue_stale_jobs()
+                        next_reap = time.monotonic() + self.app.config['JOB_LEASE_SECONDS'] / 2
+                    ran = run_next_job(worker_id)
+            except Exception as e:
+                print(f"❌ Job worker {worker_id} error: {e}")
+            if not ran:
+                self.wake.wait(self.poll_seconds)
+                self.wake.clear()
+
+
+@core_bp.route("/jobs/<int:id>", methods=["GET"])
+def get_job(id):
+    job = db.session.get(Job, id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@core_bp.route("/jobs", methods=["GET"])
+def get_jobs():
+    """Recent jobs, newest first. Query params: status, kind, limit (default 50)."""
+    query = Job.query
+    if request.args.get("status"):
+        query = query.filter(Job.status == request.args["status"])
+    if request.args.get("kind"):
+        query = query.filter(Job.kind == request.args["kind"])
+    limit = max(1, min(request.args.get("limit", 50, type=int), 500))
+    return jsonify([job.to_dict() for job in query.order_by(Job.id.desc()).limit(limit).all()]), 200
+
+
+@job_handler("bulk_delete")
+def run_bulk_delete(payload):
+    """Delete in short chunked transactions instead of one long table-locking DELETE."""
+    target = BULK_DELETE_TARGETS.get(payload.get("target"))
+    if target is None:
+        raise PermanentJobError(f"Unknown bulk delete target: {payload.get('target')}")
+    model, criteria = target(payload)
+    if payload.get("max_id") is not None:
+        criteria = criteria + [model.id <= payload["max_id"]]  # Nothing created after the request
+    deleted = 0
+    while True:
+        ids = db.session.scalars(db.select(model.id).where(*criteria).limit(500)).all()
+        if not ids:
+            break
+        db.session.execute(db.delete(model).where(model.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+    if model is Karaoke:
+        wait_estimator().forget(payload.get("session_id"))
+    return {"deleted": deleted}
+
+
+def wants_async():
+    """Client opted in to a 202 + job instead of waiting (RFC 7240 "Prefer: respond-async")."""
+    return "respond-async" in request.headers.get("Prefer", "").lower()
+
+
+def bulk_delete(target, message, **payload):
+    """
+    Delete now and answer 200 with message.format(deleted=n), or with
+    "Prefer: respond-async" queue a bulk_delete job and answer 202. Either way
+    only rows that existed when the request came in are deleted.
+    """
+    payload["target"] = target
+    model, _ = BULK_DELETE_TARGETS[target](payload)
+    payload["max_id"] = db.session.scalar(db.select(func.max(model.id))) or 0
+    if not wants_async():
+        result = run_bulk_delete(payload)
+        return jsonify({"message": message.format(deleted=result["deleted"])}), 200
+    job = enqueue_job("bulk_delete", payload, coalesce_key=f"bulk_delete:{json.dumps(payload, sort_keys=True)}")
+    return jsonify({"message": "Delete queued", "job": job.to_dict()}), 202
+
+
+# ============================
+#   Scheduler
+# ============================
+# One process at a time holds the scheduler lease (a row in scheduler_lease) and
+# turns due cron entries into jobs; the job table doubles as the run history.
+# Times are UTC. Override with SCHEDULES="name=cron expr;name=off".
+DEFAULT_SCHEDULES = {
+    "compact_karaoke": "0 10 * * *",
+    "rebuild_rollups": "30 10 * * *",
+    "purge_inactive_djnotes": "0 11 * * *",
+    "reset_show_state": "0 11 * * *",
+    "archive_promotions": "15 11 * * *",
+    "seed_song_catalog": "30 11 * * *",
+}
+SCHEDULED_TASKS = {}
+CRON_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 6))
+CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+
+
+def parse_schedules(value):
+    """Parse "compact_karaoke=0 9 * * *;purge_inactive_djnotes=off" into DEFAULT_SCHEDULES form."""
+    schedules = {}
+    for item in filter(None, (part.strip() for part in value.split(";"))):
+        name, _, expr = item.partition("=")
+        schedules[name.strip()] = expr.strip()
+    return schedules
+
+
+def parse_cron_field(text, name, low, high):
+    values = set()
+    for part in text.split(","):
+        spec, _, step = part.partition("/")
+        if spec == "*":
+            start, end = low, high
+        elif "-" in spec:
+            start, end = (int(v) for v in spec.split("-", 1))
+        else:
+            start = end = int(spec)
+            if step:
+                end = high
+        if name == "weekday" and end == 7:  # 7 is also Sunday
+            values.add(0)
+            if start == 7:
+                continue
+            end = 6
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron {name} out of range: {part}")
+        values.update(range(start, end + 1, int(step) if step else 1))
+    return frozenset(values)
+
+
+class CronExpression:
+    """Five-field cron: minute hour day-of-month month day-of-week (0 = Sunday)."""
+
+    def __init__(self, expr):
+        self.expr = CRON_ALIASES.get(expr.strip(), expr.strip())
+        parts = self.expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: '{expr}'")
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            parse_cron_field(part, *field) for part, field in zip(parts, CRON_FIELDS)
+        )
+        # Classic cron: when both day fields are restricted, either one may match.
+        # Like Vixie cron, a field starting with "*" (including "*/2") is unrestricted.
+        self.days_or_weekdays = not parts[2].startswith("*") and not parts[4].startswith("*")
+
+    def day_matches(self, dt):
+        day, weekday = dt.day in self.days, dt.isoweekday() % 7 in self.weekdays
+        return (day or weekday) if self.days_or_weekdays else (day and weekday)
+
+    def next_after(self, dt):
+        """First matching minute strictly after dt, skipping whole months/days/hours that cannot match."""
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=5 * 366)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self.day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron expression never matches: '{self.expr}'")
+
+
+def scheduled_task(name):
+    """Register func as the body of schedule `name`; it runs as job kind cron.<name>."""
+    def register(func):
+        SCHEDULED_TASKS[name] = func
+        JOB_HANDLERS[f"cron.{name}"] = lambda payload: func()
+        return func
+    return register
+
+
+class SchedulerLease(db.Model):
+    __tablename__ = "scheduler_lease"
+
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(120), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+
+def acquire_scheduler_lease(holder, ttl_seconds):
+    """Take or renew the lease; True when `holder` is the scheduler leader until the lease expires."""
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    renewed = db.session.execute(
+        db.update(SchedulerLease)
+        .where(
+            SchedulerLease.name == "scheduler",
+            (SchedulerLease.holder == holder) | (SchedulerLease.expires_at < now),
+        )
+        .values(holder=holder, expires_at=expires_at)
+    ).rowcount
+    db.session.commit()
+    if renewed:
+        return True
+    if db.session.get(SchedulerLease, "scheduler"):
+        return False
+    db.session.add(SchedulerLease(name="scheduler", holder=holder, expires_at=expires_at))
+    try:
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+
+class Scheduler:
+    """Per-process thread; only the lease holder enqueues due runs."""
+
+    def __init__(self, app, schedules):
+        self.app = app
+        self.crons = {name: CronExpression(expr) for name, expr in schedules.items() if expr != "off"}
+        unknown = set(self.crons) - set(SCHEDULED_TASKS)
+        if unknown:
+            raise ValueError(f"Unknown scheduled task(s): {', '.join(sorted(unknown))}")
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.is_leader = False
+        self.next_runs = {}  # name -> (scheduled_for, run_at with jitter)
+
+    def start(self):
+        with self.lock:
+            if not self.crons or (self.pid == os.getpid() and self.thread and self.thread.is_alive()):
+                return
+            self.pid = os.getpid()
+            self.holder = f"{socket.gethostname()}:{self.pid}"
+            self.is_leader = False
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=5):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join(timeout)
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                with self.app.app_context():
+                    self.tick()
+            except Exception as e:
+                print(f"❌ Scheduler tick failed: {e}")
+            self.stopping.wait(self.app.config['SCHEDULER_TICK_SECONDS'])
+
+    def plan(self, name, after):
+        scheduled_for = self.crons[name].next_after(after)
+        jitter = random.uniform(0, self.app.config['SCHEDULER_JITTER_SECONDS'])
+        self.next_runs[name] = (scheduled_for, scheduled_for + timedelta(seconds=jitter))
+
+    def tick(self, now=None):
+        now = now or datetime.utcnow()
+        lease_seconds = self.app.config['SCHEDULER_LEASE_SECONDS']
+        if not acquire_scheduler_lease(self.holder, lease_seconds):
+            self.is_leader = False
+            return
+        if not self.is_leader:
+            # New leader: look back one lease period so a run missed during handover still fires;
+            # the job idempotency key stops a run the old leader already queued from running twice
+            print(f"⏰ Scheduler leader is now {self.holder}")
+            self.is_leader = True
+            for name in self.crons:
+                self.plan(name, now - timedelta(seconds=lease_seconds))
+
+        for name, (scheduled_for, run_at) in list(self.next_runs.items()):
+            if now >= run_at:
+                stamp = scheduled_for.strftime("%Y-%m-%dT%H:%M")
+                enqueue_job(f"cron.{name}", {"scheduled_for": stamp}, idempotency_key=f"cron:{name}:{stamp}")
+                self.plan(name, max(scheduled_for, now - timedelta(seconds=lease_seconds)))
+
+
+@core_bp.route("/scheduler", methods=["GET"])
+def get_scheduler_status():
+    """Lease holder, next run per task and the last few runs (from the job table)."""
+    lease = db.session.get(SchedulerLease, "scheduler")
+    now = datetime.utcnow()
+    schedules = current_app.config['SCHEDULES']
+    recent = {name: [] for name in schedules}
+    for run in Job.query.filter(Job.kind.in_([f"cron.{name}" for name in schedules])).order_by(Job.id.desc()).limit(200):
+        runs = recent[run.kind[len("cron."):]]
+        if len(runs) < 5:
+            runs.append(run.to_dict())
+    tasks = [
+        {
+            "name": name,
+            "schedule": expr,
+            "next_run": CronExpression(expr).next_after(now).isoformat() if expr != "off" else None,
+            "recent_runs": recent[name],
+        }
+        for name, expr in schedules.items()
+    ]
+    return jsonify({
+        "leader": lease.holder if lease and lease.expires_at > now else None,
+        "lease_expires_at": lease.expires_at.isoformat() if lease else None,
+        "tasks": tasks,
+    }), 200
+
+
+@core_bp.route("/scheduler/<name>/run", methods=["POST"])
+def run_scheduled_task_now(name):
+    if name not in SCHEDULED_TASKS:
+        return jsonify({"error": f"Unknown task '{name}'"}), 404
+    job = enqueue_job(f"cron.{name}", {"manual": True})
+    return jsonify(job.to_dict()), 202
+
+
 # Review model
 
 
 # Review model (already defined)
-class Review(db.Model):
+class Review(DatetimeFormatMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
     rating = db.Column(db.Float, nullable=False)
@@ -130,6 +1653,7 @@ class Review(db.Model):
     description = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_approved = db.Column(db.Boolean, default=False, nullable=False)
+    __datetime_formats__ = {"created_at": "datetime"}
 
     def to_dict(self):
         return {
@@ -140,12 +1664,12 @@ class Review(db.Model):
             "image_url": self.image_url,
             "website_url": self.website_url,
             "description": self.description,
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "created_at": self.format_datetime("created_at"),
             "is_approved": self.is_approved,
         }
 
 # PATCH endpoint to update a review
-@app.route("/reviews/<int:review_id>", methods=["PATCH"])
+@public_bp.route("/reviews/<int:review_id>", methods=["PATCH"])
 def update_review(review_id):
     review = Review.query.get_or_404(review_id)  # Fetch the review or return 404
     
@@ -174,7 +1698,7 @@ def update_review(review_id):
 
 
 
-@app.route('/reviews/<int:id>/approve', methods=['PATCH'])
+@public_bp.route('/reviews/<int:id>/approve', methods=['PATCH'])
 def approve_review(id):
     """
     Approve a review by setting is_approved to True.
@@ -214,7 +1738,7 @@ def approve_review(id):
 
 
 # Admin signup route
-@app.route('/signup', methods=['POST'])
+@core_bp.route('/signup', methods=['POST'])
 def signup():
     data = request.get_json()
 
@@ -224,7 +1748,10 @@ def signup():
         return jsonify({"error": "Username already exists"}), 400
 
     # Proceed to create the new user
-    hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+    try:
+        hashed_password = password_hasher().hash(data['password'])
+    except (PasswordHasherBusy, FutureTimeoutError):
+        return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": "1"}
     new_user = User(
         username=data['username'],
         password=hashed_password,
@@ -236,35 +1763,93 @@ def signup():
     return jsonify({"message": "Admin user created successfully"}), 201
 
 
-@app.route('/login', methods=['POST'])
+@core_bp.route('/login', methods=['POST'])
 def login():
-    data = request.get_json()
-    print("Received login data:", data, flush=True)
-
-    user = User.query.filter_by(username=data['username']).first()
-    print("User found in DB:", user, flush=True)
+    data = request.get_json() or {}
+    username = data.get('username', '')
+    password = data.get('password', '')
+    print("Received login attempt for:", username, flush=True)
+
+    # Per-username throttle, checked before any bcrypt work
+    limiter = current_app.extensions.get("rate_limiter")
+    if limiter is not None and username:
+        capacity, period = current_app.config['LOGIN_ATTEMPTS_PER_USER']
+        try:
+            retry_after = limiter.take(f"login|{username.lower()}", capacity, capacity / period)
+        except Exception as e:
+            print(f"Rate limiter unavailable, allowing login: {e}", flush=True)
+            retry_after = 0
+        if retry_after:
+            return jsonify({"error": "Too many login attempts. Please wait."}), 429, {"Retry-After": str(math.ceil(retry_after))}
 
+    user = User.query.filter_by(username=username).first()
     if not user:
         print("User not found", flush=True)
         return jsonify({"error": "Invalid username or password"}), 401
 
-    print("Stored hashed password:", user.password, flush=True)
-    print("Entered password:", data['password'], flush=True)
+    try:
+        matched = password_hasher().check(user.password, password)
+    except (PasswordHasherBusy, FutureTimeoutError):
+        return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": "1"}
 
-    if bcrypt.check_password_hash(user.password, data['password']):
+    if matched:
         print("Password matched", flush=True)
-        token = jwt.encode({
-            'user_id': user.id,
-            'is_admin': user.is_admin,  # Include is_admin field
-            'exp': datetime.utcnow() + timedelta(hours=1)
-        }, app.config['SECRET_KEY'], algorithm="HS256")
-        return jsonify({"token": token, "is_admin": user.is_admin}), 200
+        if password_needs_rehash(user.password):
+            try:
+                user.password = password_hasher().hash(password)  # Cost factor changed: upgrade transparently
+            except (PasswordHasherBusy, FutureTimeoutError):
+                pass  # Try again on the next login
+        refresh_token = issue_refresh_token(user)
+        db.session.commit()
+        return token_response(user, refresh_token)
 
     print("Password mismatch", flush=True)
     return jsonify({"error": "Invalid username or password"}), 401
 
 
-@app.route('/reviews/<int:id>', methods=['DELETE'])
+@core_bp.route('/token/refresh', methods=['POST'])
+def refresh_access_token():
+    """Rotate a refresh token and issue a new access token, no password check needed."""
+    data = request.get_json() or {}
+    token = data.get('refresh_token')
+    if not token:
+        return jsonify({"error": "Missing refresh_token"}), 400
+
+    now = datetime.utcnow()
+    record = RefreshToken.query.filter_by(token_hash=hash_refresh_token(token)).first()
+    if not record or record.expires_at < now:
+        return jsonify({"error": "Invalid or expired refresh token"}), 401
+
+    # Conditional update so two concurrent refreshes can't both rotate the same token
+    rotated = RefreshToken.query.filter_by(id=record.id, revoked_at=None).update({"revoked_at": now})
+    if not rotated:
+        # A rotated token came back: assume it leaked and end the whole login
+        RefreshToken.query.filter_by(family_id=record.family_id, revoked_at=None).update({"revoked_at": now})
+        db.session.commit()
+        return jsonify({"error": "Refresh token reuse detected, please log in again"}), 401
+
+    user = db.session.get(User, record.user_id)
+    if not user:
+        db.session.commit()
+        return jsonify({"error": "Invalid or expired refresh token"}), 401
+
+    new_token = issue_refresh_token(user, record.family_id)
+    db.session.commit()
+    return token_response(user, new_token)
+
+
+@core_bp.route('/token/revoke', methods=['POST'])
+def revoke_refresh_token():
+    """Log out: revoke the refresh token and every rotation of it."""
+    data = request.get_json() or {}
+    record = RefreshToken.query.filter_by(token_hash=hash_refresh_token(data.get('refresh_token', ''))).first()
+    if record:
+        RefreshToken.query.filter_by(family_id=record.family_id, revoked_at=None).update({"revoked_at": datetime.utcnow()})
+        db.session.commit()
+    return jsonify({"message": "Logged out"}), 200
+
+
+@public_bp.route('/reviews/<int:id>', methods=['DELETE'])
 def delete_review(id):
     print(f"Attempting to delete review with ID: {id}")
 
@@ -279,7 +1864,7 @@ def delete_review(id):
 
 
 # Create a new review
-@app.route('/reviews', methods=['POST'])
+@public_bp.route('/reviews', methods=['POST'])
 def create_review():
     """
     Create a new review with 'is_approved' set to False by default.
@@ -290,6 +1875,10 @@ def create_review():
     if not all(key in data for key in ['name', 'rating', 'service', 'description']):
         return jsonify({"error": "Missing required fields: name, rating, service, description"}), 400
 
+    flagged_fields = restricted_word_matcher().check_fields(data, ['name', 'description'])
+    if flagged_fields:
+        return jsonify({"error": "Review contains restricted words", "fields": flagged_fields}), 400
+
     try:
         # Create a new review instance with 'is_approved' as False
         new_review = Review(
@@ -316,7 +1905,7 @@ def create_review():
 
 
 
-@app.route('/reviews/pending', methods=['GET'])
+@public_bp.route('/reviews/pending', methods=['GET'])
 def get_pending_reviews():
     pending_reviews = Review.query.filter(Review.is_approved == False).all()
     print("Pending Reviews Query:", [r.to_dict() for r in pending_reviews])  # Debug log
@@ -324,7 +1913,7 @@ def get_pending_reviews():
 
 
 
-@app.route('/reviews', methods=['GET'])
+@public_bp.route('/reviews', methods=['GET'])
 def get_reviews():
     search_term = request.args.get('service', '').strip()
 
@@ -350,7 +1939,7 @@ def get_reviews():
 
 
 # Contact model
-class Contact(db.Model):
+class Contact(DatetimeFormatMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     first_name = db.Column(db.String(80), nullable=False)
     last_name = db.Column(db.String(80), nullable=False)
@@ -359,6 +1948,7 @@ class Contact(db.Model):
     message = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(50), nullable=False, default="Pending")  # New status field
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __datetime_formats__ = {"created_at": "datetime"}
 
     def to_dict(self):
         return {
@@ -369,10 +1959,10 @@ class Contact(db.Model):
             "email": self.email,
             "message": self.message,
             "status": self.status,  # Include status
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S")
+            "created_at": self.format_datetime("created_at")
         }
 
-@app.route('/contacts', methods=['POST'])
+@public_bp.route('/contacts', methods=['POST'])  # The site's contact form; managed under admin_bp
 def save_contact():
     print("---- Incoming POST Request to /contacts ----")  # Log incoming request
     data = request.get_json()
@@ -407,12 +1997,11 @@ def save_contact():
         print("Error:", str(e))  # Log any other exceptions
         return jsonify({"error": str(e)}), 500
 
-@app.route('/contacts', methods=['GET'])
+@admin_bp.route('/contacts', methods=['GET'])
 def get_contacts():
-    contacts = Contact.query.all()
-    return jsonify([contact.to_dict() for contact in contacts]), 200
+    return jsonify(select_rows(Contact)), 200
 
-@app.route('/contacts/<int:id>', methods=['PATCH'])
+@admin_bp.route('/contacts/<int:id>', methods=['PATCH'])
 def update_contact(id):
     data = request.get_json()
     contact = Contact.query.get(id)
@@ -437,7 +2026,7 @@ def update_contact(id):
     return jsonify({"message": "Contact updated successfully!", "contact": contact.to_dict()}), 200
 
 # DELETE Contact Booking
-@app.route('/contacts/<int:id>', methods=['DELETE'])
+@admin_bp.route('/contacts/<int:id>', methods=['DELETE'])
 def delete_contact(id):
     contact = Contact.query.get(id)
     if not contact:
@@ -447,7 +2036,7 @@ def delete_contact(id):
     db.session.commit()
     return jsonify({"message": "Contact booking deleted successfully"}), 200
 # Engineering Booking model
-class EngineeringBooking(db.Model):
+class EngineeringBooking(DatetimeFormatMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     contact = db.Column(db.String(120), nullable=False)  # Stores contact name
     contact_phone = db.Column(db.String(20), nullable=True)  # ✅ New field for phone
@@ -458,6 +2047,7 @@ class EngineeringBooking(db.Model):
     notes = db.Column(db.Text, nullable=True)  # ✅ New field for additional notes
     date = db.Column(db.DateTime, nullable=True)  # ✅ NEW FIELD: Store the booking date
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __datetime_formats__ = {"created_at": "datetime", "date": "date"}
 
     def to_dict(self):
         return {
@@ -469,12 +2059,12 @@ class EngineeringBooking(db.Model):
             "price": self.price,
             "status": self.status,
             "notes": self.notes,
-            "date": self.date.strftime("%Y-%m-%d") if self.date else None,  # ✅ Convert date properly
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "date": self.format_datetime("date"),  # ✅ Convert date properly
+            "created_at": self.format_datetime("created_at"),
         }
 
 
-@app.route('/engineering-bookings', methods=['POST'])
+@admin_bp.route('/engineering-bookings', methods=['POST'])
 def save_engineering_booking():
     data = request.get_json()
     try:
@@ -517,7 +2107,7 @@ def save_engineering_booking():
 
 from datetime import datetime
 
-@app.route('/engineering-bookings/<int:id>', methods=['PATCH'])
+@admin_bp.route('/engineering-bookings/<int:id>', methods=['PATCH'])
 def update_engineering_booking(id):
     data = request.get_json()
     booking = EngineeringBooking.query.get(id)
@@ -563,7 +2153,7 @@ def update_engineering_booking(id):
 
 
 # DELETE Engineering Booking
-@app.route('/engineering-bookings/<int:id>', methods=['DELETE'])
+@admin_bp.route('/engineering-bookings/<int:id>', methods=['DELETE'])
 def delete_engineering_booking(id):
     booking = EngineeringBooking.query.get(id)
     if not booking:
@@ -573,7 +2163,7 @@ def delete_engineering_booking(id):
     db.session.commit()
     return jsonify({"message": "Engineering booking deleted successfully"}), 200
 
-@app.route('/engineering-bookings', methods=['GET'])
+@admin_bp.route('/engineering-bookings', methods=['GET'])
 def get_engineering_bookings():
     try:
         bookings = EngineeringBooking.query.all()
@@ -582,7 +2172,7 @@ def get_engineering_bookings():
         return jsonify({"error": str(e)}), 500
 
 
-class GeneralInquiry(db.Model):
+class GeneralInquiry(DatetimeFormatMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     contact_name = db.Column(db.String(120), nullable=False)
     contact_phone = db.Column(db.String(20), nullable=True)  # ✅ New phone field
@@ -591,6 +2181,7 @@ class GeneralInquiry(db.Model):
     notes = db.Column(db.Text, nullable=True)
     date = db.Column(db.DateTime, nullable=True)  # ✅ Change to DateTime
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __datetime_formats__ = {"created_at": "datetime", "date": "date"}
 
     def to_dict(self):
         return {
@@ -600,12 +2191,12 @@ class GeneralInquiry(db.Model):
             "request": self.request,
             "cost": self.cost,
             "notes": self.notes,
-            "date": self.date.strftime("%Y-%m-%d") if self.date else None,  # ✅ Now properly formatted
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "date": self.format_datetime("date"),  # ✅ Now properly formatted
+            "created_at": self.format_datetime("created_at"),
         }
 from datetime import datetime
 
-@app.route('/general_inquiries', methods=['POST'])
+@public_bp.route('/general_inquiries', methods=['POST'])  # The site's inquiry form; managed under admin_bp
 def create_general_inquiry():
     data = request.get_json()
 
@@ -642,7 +2233,7 @@ def create_general_inquiry():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/general_inquiries', methods=['GET'])
+@admin_bp.route('/general_inquiries', methods=['GET'])
 def get_general_inquiries():
     try:
         inquiries = GeneralInquiry.query.all()
@@ -652,7 +2243,7 @@ def get_general_inquiries():
 
 from datetime import datetime
 
-@app.route('/general_inquiries/<int:inquiry_id>', methods=['PATCH'])
+@admin_bp.route('/general_inquiries/<int:inquiry_id>', methods=['PATCH'])
 def update_general_inquiry(inquiry_id):
     data = request.get_json()
     inquiry = GeneralInquiry.query.get(inquiry_id)
@@ -686,7 +2277,7 @@ def update_general_inquiry(inquiry_id):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/general_inquiries/<int:inquiry_id>', methods=['DELETE'])
+@admin_bp.route('/general_inquiries/<int:inquiry_id>', methods=['DELETE'])
 def delete_general_inquiry(inquiry_id):
     inquiry = GeneralInquiry.query.get(inquiry_id)
 
@@ -703,7 +2294,7 @@ def delete_general_inquiry(inquiry_id):
         return jsonify({"error": str(e)}), 500
 
 
-class Expense(db.Model):
+class Expense(DatetimeFormatMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     item = db.Column(db.String(120), nullable=False)
     cost = db.Column(db.Float, nullable=False)
@@ -714,6 +2305,7 @@ class Expense(db.Model):
     card_used = db.Column(db.String(50), nullable=False)
     notes = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __datetime_formats__ = {"created_at": "datetime", "purchase_date": "date"}
 
     def to_dict(self):
         return {
@@ -721,16 +2313,16 @@ class Expense(db.Model):
             "item": self.item,
             "cost": self.cost,
             "frequency": self.frequency,
-            "purchase_date": self.purchase_date.strftime("%Y-%m-%d"),
+            "purchase_date": self.format_datetime("purchase_date"),
             "purchase_location": self.purchase_location,
             "image_url_receipt": self.image_url_receipt,
             "card_used": self.card_used,
             "notes": self.notes,
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "created_at": self.format_datetime("created_at"),
         }
 
 
-@app.route('/expenses', methods=['POST'])
+@finance_bp.route('/expenses', methods=['POST'])
 def create_expense():
     data = request.get_json()
 
@@ -761,15 +2353,14 @@ def create_expense():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/expenses', methods=['GET'])
+@finance_bp.route('/expenses', methods=['GET'])
 def get_expenses():
     try:
-        expenses = Expense.query.all()
-        return jsonify([expense.to_dict() for expense in expenses]), 200
+        return jsonify(select_rows(Expense)), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/expenses/<int:expense_id>', methods=['GET'])
+@finance_bp.route('/expenses/<int:expense_id>', methods=['GET'])
 def get_expense(expense_id):
     expense = Expense.query.get(expense_id)
     if not expense:
@@ -777,7 +2368,7 @@ def get_expense(expense_id):
 
     return jsonify(expense.to_dict()), 200
 
-@app.route('/expenses/<int:expense_id>', methods=['PATCH'])
+@finance_bp.route('/expenses/<int:expense_id>', methods=['PATCH'])
 def update_expense(expense_id):
     data = request.get_json()
     expense = Expense.query.get(expense_id)
@@ -812,7 +2403,7 @@ def update_expense(expense_id):
 
 
 
-@app.route('/expenses/<int:expense_id>', methods=['DELETE'])
+@finance_bp.route('/expenses/<int:expense_id>', methods=['DELETE'])
 def delete_expense(expense_id):
     expense = Expense.query.get(expense_id)
 
@@ -831,25 +2422,26 @@ def delete_expense(expense_id):
 
 
 
-class Income(db.Model):
+class Income(DatetimeFormatMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     income_name = db.Column(db.String(120), nullable=False)
     amount = db.Column(db.Integer, nullable=False)
     date = db.Column(db.DateTime, nullable=False)
     taxes = db.Column(db.Float, nullable=True)  # Optional field for taxes
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __datetime_formats__ = {"created_at": "datetime", "date": "date"}
 
     def to_dict(self):
         return {
             "id": self.id,
             "income_name": self.income_name,
             "amount": round(self.amount, 2),  # Ensuring proper decimal formatting
-            "date": self.date.strftime("%Y-%m-%d"),
+            "date": self.format_datetime("date"),
             "taxes": self.taxes,
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "created_at": self.format_datetime("created_at"),
         }
 
-@app.route('/income', methods=['POST'])
+@finance_bp.route('/income', methods=['POST'])
 def create_income():
     data = request.get_json()
     
@@ -882,16 +2474,15 @@ def create_income():
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/income', methods=['GET'])
+@finance_bp.route('/income', methods=['GET'])
 def get_incomes():
     try:
-        incomes = Income.query.all()
-        return jsonify([income.to_dict() for income in incomes]), 200
+        return jsonify(select_rows(Income)), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/income', methods=['PATCH'])
-@app.route('/income/<int:income_id>', methods=['PATCH'])
+@finance_bp.route('/income', methods=['PATCH'])
+@finance_bp.route('/income/<int:income_id>', methods=['PATCH'])
 def update_income(income_id=None):
     data = request.get_json()
 
@@ -937,7 +2528,7 @@ def update_income(income_id=None):
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
-@app.route('/income/<int:income_id>', methods=['DELETE'])
+@finance_bp.route('/income/<int:income_id>', methods=['DELETE'])
 def delete_income(income_id):
     print(f"Delete request received for income_id: {income_id}")  # Debugging
     income = Income.query.get(income_id)
@@ -959,7 +2550,8 @@ def delete_income(income_id):
 
 
 
-@app.route('/income/aggregate', methods=['GET'])
+@finance_bp.route('/income/aggregate', methods=['GET'])
+@statement_timeout(15000)
 def aggregate_income():
     try:
         # Fetch all manually added incomes
@@ -1016,18 +2608,15 @@ def aggregate_income():
         return jsonify({"error": str(e)}), 500
 
 
-GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
-HOME_ADDRESS = os.getenv("HOME_ADDRESS")
-
 def get_distance_from_google(start, end):
     url = "https://maps.googleapis.com/maps/api/distancematrix/json"
     params = {
         "origins": start,
         "destinations": end,
-        "key": GOOGLE_MAPS_API_KEY,
+        "key": current_app.config['GOOGLE_MAPS_API_KEY'],
         "units": "imperial"
     }
-    response = requests.get(url, params=params)
+    response = requests.get(url, params=params, timeout=10)
     data = response.json()
 
     if data["status"] != "OK":
@@ -1038,7 +2627,7 @@ def get_distance_from_google(start, end):
     return distance_value
 
 
-class MileageTracker(db.Model):
+class MileageTracker(DatetimeFormatMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     expense_name = db.Column(db.String(120), nullable=False)
     date = db.Column(db.DateTime, nullable=False)
@@ -1049,68 +2638,99 @@ class MileageTracker(db.Model):
     calculated_mileage = db.Column(db.Float, nullable=False)  # Auto-calculated at $0.67 per mile
     notes = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __datetime_formats__ = {"created_at": "datetime", "date": "date"}
 
     def to_dict(self):
         return {
             "id": self.id,
             "expense_name": self.expense_name,
-            "date": self.date.strftime("%Y-%m-%d"),
+            "date": self.format_datetime("date"),
             "start_location": self.start_location,
             "end_location": self.end_location,
             "distance_driven": self.distance_driven,  # ✅ No extra adjustments
             "is_round_trip": self.is_round_trip,
             "calculated_mileage": round(self.distance_driven * 0.67, 2),  # ✅ Uses already adjusted distance
             "notes": self.notes,
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "created_at": self.format_datetime("created_at"),
         }
 
-@app.route('/mileage', methods=['POST'])
+@finance_bp.route('/mileage', methods=['POST'])
 def create_mileage():
+    """
+    Create a mileage record (201). With "Prefer: respond-async" the Google Maps
+    lookup runs as a background job instead: 202 with the job, poll GET
+    /jobs/<id> for the record. An Idempotency-Key header makes async retries safe.
+    """
     data = request.get_json()
 
     required_fields = ['expense_name', 'date', 'end_location']
     missing_fields = [field for field in required_fields if field not in data]
     if missing_fields:
         return jsonify({"error": f"Missing fields: {', '.join(missing_fields)}"}), 400
+    try:
+        datetime.strptime(data['date'], "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return jsonify({"error": "date must be YYYY-MM-DD"}), 400
 
     try:
-        is_round_trip = data.get('is_round_trip', False)
-        end_location = data['end_location']
         start_location = data.get('start_location')
         if not start_location or start_location.strip().lower() == "home":
-            start_location = HOME_ADDRESS
-
-        # 🗺️ Auto-calculate distance using Google Maps
-        try:
-            one_way_distance = get_distance_from_google(start_location, end_location)
-        except Exception as api_error:
-            print("❌ Google Maps API Error:", api_error)
-            raise
-        adjusted_distance = one_way_distance * (2 if is_round_trip else 1)
-        calculated_mileage = round(adjusted_distance * 0.67, 2)
-
-        mileage = MileageTracker(
-            expense_name=data['expense_name'],
-            date=datetime.strptime(data['date'], "%Y-%m-%d"),
-            start_location=start_location,
-            end_location=end_location,
-            distance_driven=adjusted_distance,
-            is_round_trip=is_round_trip,
-            calculated_mileage=calculated_mileage,
-            notes=data.get('notes')
-        )
-
-        db.session.add(mileage)
-        db.session.commit()
+            start_location = current_app.config['HOME_ADDRESS']
+
+        payload = {
+            "expense_name": data['expense_name'],
+            "date": data['date'],
+            "start_location": start_location,
+            "end_location": data['end_location'],
+            "is_round_trip": bool(data.get('is_round_trip', False)),
+            "notes": data.get('notes'),
+        }
+        if not wants_async():
+            mileage = create_mileage_record(payload)
+            return jsonify({"message": "Mileage record created successfully!", "mileage": mileage.to_dict()}), 201
 
-        return jsonify({"message": "Mileage record created successfully!", "mileage": mileage.to_dict()}), 201
+        key = request.headers.get("Idempotency-Key")
+        job = enqueue_job("mileage.create", payload, idempotency_key=f"mileage:{key}" if key else None)
+        return jsonify({"message": "Mileage record queued", "job": job.to_dict()}), 202
 
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/mileage/<int:mileage_id>', methods=['PATCH'])
+def create_mileage_record(payload):
+    # 🗺️ Auto-calculate distance using Google Maps
+    try:
+        one_way_distance = get_distance_from_google(payload['start_location'], payload['end_location'])
+    except Exception as api_error:
+        print("❌ Google Maps API Error:", api_error)
+        raise
+    adjusted_distance = one_way_distance * (2 if payload['is_round_trip'] else 1)
+
+    mileage = MileageTracker(
+        expense_name=payload['expense_name'],
+        date=datetime.strptime(payload['date'], "%Y-%m-%d"),
+        start_location=payload['start_location'],
+        end_location=payload['end_location'],
+        distance_driven=adjusted_distance,
+        is_round_trip=payload['is_round_trip'],
+        calculated_mileage=round(adjusted_distance * 0.67, 2),
+        notes=payload.get('notes')
+    )
+    db.session.add(mileage)
+    db.session.commit()
+    return mileage
+
+
+@job_handler("mileage.create")
+def run_create_mileage(payload):
+    if not current_app.config['GOOGLE_MAPS_API_KEY']:
+        raise PermanentJobError("GOOGLE_MAPS_API_KEY is not configured")
+    mileage = create_mileage_record(payload)  # API errors are retried with backoff
+    return {"mileage_id": mileage.id, "mileage": mileage.to_dict()}
+
+
+@finance_bp.route('/mileage/<int:mileage_id>', methods=['PATCH'])
 def update_mileage(mileage_id):
     print(f"🔄 Incoming PATCH request for mileage ID: {mileage_id}")
     data = request.get_json()
@@ -1177,7 +2797,7 @@ def update_mileage(mileage_id):
 
 
 
-@app.route('/mileage', methods=['GET'])
+@finance_bp.route('/mileage', methods=['GET'])
 def get_mileages():
     try:
         mileages = MileageTracker.query.all()
@@ -1187,7 +2807,7 @@ def get_mileages():
 
 
 
-@app.route('/mileage/<int:mileage_id>', methods=['GET'])
+@finance_bp.route('/mileage/<int:mileage_id>', methods=['GET'])
 def get_mileage(mileage_id):
     mileage = MileageTracker.query.get(mileage_id)
     if not mileage:
@@ -1196,7 +2816,7 @@ def get_mileage(mileage_id):
     return jsonify(mileage.to_dict()), 200
 
 
-@app.route('/mileage/<int:mileage_id>', methods=['DELETE'])
+@finance_bp.route('/mileage/<int:mileage_id>', methods=['DELETE'])
 def delete_mileage(mileage_id):
     mileage = MileageTracker.query.get(mileage_id)
 
@@ -1211,7 +2831,8 @@ def delete_mileage(mileage_id):
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
-@app.route('/total_expenses_and_mileage', methods=['GET'])
+@finance_bp.route('/total_expenses_and_mileage', methods=['GET'])
+@statement_timeout(15000)
 def get_total_expenses_and_mileage():
     try:
         # Calculate total expenses
@@ -1236,7 +2857,7 @@ def get_total_expenses_and_mileage():
 
 
 
-class KaraokeHosting(db.Model):
+class KaraokeHosting(DatetimeFormatMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     company_name = db.Column(db.String(120), nullable=False)
     contact_name = db.Column(db.String(120), nullable=True)
@@ -1248,6 +2869,7 @@ class KaraokeHosting(db.Model):
     contract = db.Column(db.Text, nullable=True)  # Storing contract details or reference
     notes = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __datetime_formats__ = {"created_at": "datetime"}
 
     def to_dict(self):
         return {
@@ -1260,10 +2882,10 @@ class KaraokeHosting(db.Model):
             "frequency_date": self.frequency_date,
             "contract": self.contract,
             "notes": self.notes,
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "created_at": self.format_datetime("created_at"),
         }
 
-@app.route('/karaoke_hosting', methods=['POST'])
+@finance_bp.route('/karaoke_hosting', methods=['POST'])
 def create_karaoke_hosting():
     data = request.get_json()
 
@@ -1298,7 +2920,7 @@ def create_karaoke_hosting():
 
 
 
-@app.route('/karaoke_hosting/<int:k_id>', methods=['PATCH'])
+@finance_bp.route('/karaoke_hosting/<int:k_id>', methods=['PATCH'])
 def update_karaoke_hosting(k_id):
     data = request.get_json()
     print(f"🔧 Incoming PATCH for ID {k_id} with data:", data)  # 🛠 Incoming data
@@ -1347,7 +2969,7 @@ def update_karaoke_hosting(k_id):
 
 
 
-@app.route('/karaoke_hosting/<int:k_id>', methods=['DELETE'])
+@finance_bp.route('/karaoke_hosting/<int:k_id>', methods=['DELETE'])
 def delete_karaoke_hosting(k_id):
     karaoke_hosting = KaraokeHosting.query.get(k_id)
 
@@ -1364,7 +2986,7 @@ def delete_karaoke_hosting(k_id):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/karaoke_hosting', methods=['GET'])
+@finance_bp.route('/karaoke_hosting', methods=['GET'])
 def get_karaoke_hosting():
     try:
         karaoke_hostings = KaraokeHosting.query.all()
@@ -1378,7 +3000,7 @@ def get_karaoke_hosting():
 
 VALID_PHOTO_TYPES = {"portrait", "couples", "Candid", "Group","events", "cosplay", "misc"}
 
-class Gallery(db.Model):
+class Gallery(DatetimeFormatMixin, db.Model):
     __tablename__ = "gallery"
 
     id = db.Column(db.Integer, primary_key=True)
@@ -1387,6 +3009,11 @@ class Gallery(db.Model):
     category = db.Column(db.String(50), nullable=True)
     photo_type = db.Column(db.String(20), nullable=False)  # Type: portrait, couples, etc.
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __datetime_formats__ = {"created_at": "datetime"}
+    __table_args__ = (
+        db.Index("ix_gallery_category_photo_type", "category", "photo_type"),
+        db.Index("ix_gallery_photo_type", "photo_type"),
+    )
 
     def to_dict(self):
         return {
@@ -1395,15 +3022,78 @@ class Gallery(db.Model):
             "caption": self.caption,
             "category": self.category,
             "photo_type": self.photo_type,
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "created_at": self.format_datetime("created_at"),
         }
 
+GALLERY_FACETS = ("category", "photo_type")
+
+
+class GalleryFacetIndex:
+    """Per-process photo counts per category/photo_type.
+
+    Local uploads and deletes adjust the counts directly; a full GROUP BY
+    rebuild every max_age seconds picks up changes made by other workers.
+    """
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.counts = None
+        self.built_at = 0.0
+
+    def snapshot(self):
+        with self.lock:
+            hit = self.counts is not None and time.monotonic() - self.built_at < self.max_age
+            record_cache_lookup("gallery_facets", hit)
+            if not hit:
+                self._rebuild()
+            return {
+                "total": self.counts["total"],
+                **{facet: dict(sorted(self.counts[facet].items())) for facet in GALLERY_FACETS},
+            }
+
+    def _rebuild(self):
+        rows = db.session.query(Gallery.category, Gallery.photo_type, func.count()).group_by(
+            Gallery.category, Gallery.photo_type
+        ).all()
+        counts = {"total": 0, **{facet: Counter() for facet in GALLERY_FACETS}}
+        for category, photo_type, count in rows:
+            counts["total"] += count
+            for facet, value in (("category", category), ("photo_type", photo_type)):
+                if value is not None:
+                    counts[facet][value] += count
+        self.counts = counts
+        self.built_at = time.monotonic()
+
+    def record(self, photo, delta):
+        """Apply a committed insert (+1) or delete (-1)."""
+        with self.lock:
+            if self.counts is None:
+                return
+            self.counts["total"] += delta
+            for facet in GALLERY_FACETS:
+                value = getattr(photo, facet)
+                if value is None:
+                    continue
+                self.counts[facet][value] += delta
+                if self.counts[facet][value] <= 0:
+                    del self.counts[facet][value]
+
+    def invalidate(self):
+        with self.lock:
+            self.counts = None
+
+
+def gallery_facets():
+    return current_app.extensions["gallery_facets"]
+
+
 def validate_photo_type(photo_type):
     """Validate that the photo type matches the allowed types."""
     if photo_type not in VALID_PHOTO_TYPES:
         raise ValueError(f"Invalid photo type. Allowed types: {', '.join(VALID_PHOTO_TYPES)}")
 
-@app.route('/gallery', methods=['POST'])
+@public_bp.route('/gallery', methods=['POST'])
 def upload_photo():
     """
     Upload a new photo to the gallery.
@@ -1434,30 +3124,39 @@ def upload_photo():
     )
     db.session.add(new_photo)
     db.session.commit()
+    gallery_facets().record(new_photo, 1)
 
     return jsonify({"message": "Photo added successfully!", "photo": new_photo.to_dict()}), 201
 
 
-@app.route('/gallery', methods=['GET'])
+@public_bp.route('/gallery', methods=['GET'])
 def get_gallery():
     """
-    Fetch all gallery photos with optional filters: category, photo_type.
+    Fetch all gallery photos with optional exact-match filters: category, photo_type.
+    Values come from /gallery/facets; equality lets the (category, photo_type) indexes serve the filter.
     """
     category = request.args.get("category", "").strip()
-    photo_type = request.args.get("photo_type", "").strip()
+    photo_type = request.args.get("photo_type", "").strip().lower()
 
-    query = Gallery.query
+    criteria = []
 
     if category:
-        query = query.filter(Gallery.category.ilike(f"%{category}%"))
+        criteria.append(Gallery.category == category)
     if photo_type:
-        query = query.filter(Gallery.photo_type.ilike(f"%{photo_type}%"))
+        criteria.append(Gallery.photo_type == photo_type)
+
+    return jsonify(attach_media(select_rows(Gallery, *criteria), "gallery")), 200
 
-    photos = query.all()
-    return jsonify([photo.to_dict() for photo in photos]), 200
 
+@public_bp.route('/gallery/facets', methods=['GET'])
+def get_gallery_facets():
+    """
+    Photo counts per category and photo_type, for building filter chips without loading the gallery.
+    """
+    return jsonify(gallery_facets().snapshot()), 200
 
-@app.route('/gallery/<int:photo_id>', methods=['DELETE'])
+
+@public_bp.route('/gallery/<int:photo_id>', methods=['DELETE'])
 def delete_photo(photo_id):
     """
     Delete a photo from the gallery.
@@ -1466,12 +3165,144 @@ def delete_photo(photo_id):
     if not photo:
         return jsonify({"error": "Photo not found"}), 404
 
-    db.session.delete(photo)
-    db.session.commit()
+    try:
+        media_files = delete_media_for("gallery", photo.id)
+        db.session.delete(photo)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    remove_media_files(media_files)
+    gallery_facets().record(photo, -1)
     return jsonify({"message": "Photo deleted successfully"}), 200
 
 
-class Karaoke(db.Model):
+# ============================
+#   Show sessions
+# ============================
+# One row per karaoke night. Signups and DJ notes carry a session_id so live
+# queries only touch the current night and past nights stay queryable.
+class ShowSession(DatetimeFormatMixin, db.Model):
+    __tablename__ = "show_session"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=True)
+    hosting_id = db.Column(db.Integer, db.ForeignKey("karaoke_hosting.id"), nullable=True)  # Optional venue/contract
+    started_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    ended_at = db.Column(db.DateTime, nullable=True, index=True)  # NULL while the show is running
+    __datetime_formats__ = {"started_at": "iso", "ended_at": "iso"}
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "hosting_id": self.hosting_id,
+            "started_at": self.format_datetime("started_at"),
+            "ended_at": self.format_datetime("ended_at"),
+            "is_active": self.ended_at is None,
+        }
+
+
+def current_show_session_id():
+    """Id of the open show session (None when no show is running), looked up once per request."""
+    if "show_session_id" not in g:
+        g.show_session_id = db.session.scalar(
+            db.select(ShowSession.id).where(ShowSession.ended_at.is_(None))
+            .order_by(ShowSession.started_at.desc()).limit(1)
+        )
+    return g.show_session_id
+
+
+def requested_show_session_id():
+    """?session_id=N selects a past night for reads; otherwise the open session."""
+    requested = request.args.get("session_id", type=int)
+    return requested if requested is not None else current_show_session_id()
+
+
+def session_scope(model, session_id):
+    # Rows created with no show running (and pre-session data) have a NULL session_id
+    return model.session_id == session_id if session_id is not None else model.session_id.is_(None)
+
+
+@karaoke_bp.route("/show-sessions", methods=["POST"])
+def start_show_session():
+    """Start a new show; any session still open is ended first."""
+    data = request.get_json(silent=True) or {}
+    hosting_id = data.get("hosting_id")
+    if hosting_id is not None and not db.session.get(KaraokeHosting, hosting_id):
+        return jsonify({"error": "Karaoke hosting not found"}), 404
+
+    try:
+        now = datetime.utcnow()
+        ShowSession.query.filter(ShowSession.ended_at.is_(None)).update({"ended_at": now})
+        show = ShowSession(name=data.get("name"), hosting_id=hosting_id, started_at=now)
+        db.session.add(show)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+    g.pop("show_session_id", None)
+    return jsonify(show.to_dict()), 201
+
+
+@karaoke_bp.route("/show-sessions/<int:id>/end", methods=["PATCH"])
+def end_show_session(id):
+    show = db.session.get(ShowSession, id)
+    if not show:
+        return jsonify({"error": "Show session not found"}), 404
+    if show.ended_at is None:
+        show.ended_at = datetime.utcnow()
+        db.session.commit()
+    return jsonify(show.to_dict()), 200
+
+
+@karaoke_bp.route("/show-sessions/current", methods=["GET"])
+def get_current_show_session():
+    session_id = current_show_session_id()
+    show = db.session.get(ShowSession, session_id) if session_id is not None else None
+    return jsonify(show.to_dict() if show else None), 200
+
+
+@karaoke_bp.route("/show-sessions", methods=["GET"])
+def get_show_sessions():
+    """All show sessions, newest first, with signup counts from one GROUP BY."""
+    counts = dict(
+        db.session.query(Karaoke.session_id, func.count(Karaoke.id))
+        .filter(Karaoke.session_id.isnot(None))
+        .group_by(Karaoke.session_id)
+        .all()
+    )
+    # Compacted nights no longer have live rows; their count comes from the summary
+    counts.update(
+        db.session.query(KaraokeNightSummary.session_id, KaraokeNightSummary.songs)
+        .filter(KaraokeNightSummary.session_id.isnot(None))
+        .all()
+    )
+    sessions = ShowSession.query.order_by(ShowSession.started_at.desc()).all()
+    return jsonify([{**show.to_dict(), "signup_count": counts.get(show.id, 0)} for show in sessions]), 200
+
+
+@karaoke_bp.route("/show-sessions/<int:id>", methods=["GET"])
+def get_show_session(id):
+    show = db.session.get(ShowSession, id)
+    if not show:
+        return jsonify({"error": "Show session not found"}), 404
+
+    signups, singers, deleted = db.session.query(
+        func.count(Karaoke.id),
+        func.count(func.distinct(func.lower(Karaoke.name))),
+        func.count(Karaoke.id).filter(Karaoke.is_deleted == True),
+    ).filter(Karaoke.session_id == id).one()
+    summary = KaraokeNightSummary.query.filter_by(session_id=id).first()
+    return jsonify({
+        **show.to_dict(),
+        "stats": {"signups": signups, "singers": singers, "sung_or_removed": deleted},
+        "summary": summary.to_dict() if summary else None,  # Present once the night is compacted
+    }), 200
+
+
+class Karaoke(DatetimeFormatMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)  
     name = db.Column(db.String(25), nullable=False)
     song = db.Column(db.String(200), nullable=False)
@@ -1482,8 +3313,11 @@ class Karaoke(db.Model):
     position = db.Column(db.Integer, nullable=True)
     is_warning = db.Column(db.Boolean, default=False)  
     adjustment = db.Column(db.Float, nullable=True, default=0.0)
-
-
+    session_id = db.Column(db.Integer, db.ForeignKey("show_session.id"), nullable=True)  # Show night
+    deleted_at = db.Column(db.DateTime, nullable=True)  # Set when is_deleted flips on
+    catalog_song_id = db.Column(db.Integer, db.ForeignKey("song_catalog.id"), nullable=True)  # Picked from autocomplete
+    __datetime_formats__ = {"created_at": "iso", "deleted_at": "iso"}
+    __table_args__ = (db.Index("ix_karaoke_session_queue", "session_id", "is_deleted", "position"),)
 
     def to_dict(self):
         """Convert the Karaoke entry into a dictionary."""
@@ -1492,31 +3326,54 @@ class Karaoke(db.Model):
             "name": self.name,
             "song": self.song,
             "artist": self.artist,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "created_at": self.format_datetime("created_at"),
             "is_flagged": self.is_flagged,
             "is_deleted": self.is_deleted,  
             "position": self.position,
             "is_warning": self.is_warning, 
-            "adjustment": self.adjustment 
-
+            "adjustment": self.adjustment,
+            "session_id": self.session_id,
+            "deleted_at": self.format_datetime("deleted_at"),
+            "catalog_song_id": self.catalog_song_id,
         }
         print("Serialized Data Sent to Frontend:", data)  # ✅ Debugging log
         return data
-@app.route("/karaokesignup/flagged", methods=["GET"])
+@karaoke_bp.route("/karaokesignup/flagged", methods=["GET"])
 def get_flagged_karaoke_signups():
     """Retrieve all flagged karaoke signups"""
-    flagged_signups = Karaoke.query.filter_by(is_flagged=True, is_deleted=False).all()
+    flagged_signups = Karaoke.query.filter(
+        session_scope(Karaoke, requested_show_session_id()), Karaoke.is_flagged == True, Karaoke.is_deleted == False
+    ).all()
     return jsonify([signup.to_dict() for signup in flagged_signups]), 200
 
 
-@app.route("/karaokesignup", methods=["POST"])
+@karaoke_bp.route("/karaokesignup", methods=["POST"])
 def karaokesignup():
     data = request.get_json()
+    if current_app.config['SIGNUP_GATE_ENABLED']:
+        refused = signup_gate().check((data or {}).get("pin_code"))
+        if refused:
+            return jsonify({"error": refused}), 403
+    if data and data.get("catalog_song_id") is not None:
+        # Canonical spelling from the catalog replaces whatever was typed. Looked up
+        # in the database, not the trie: another worker may have added or deleted it.
+        try:
+            catalog_song = db.session.get(CatalogSong, int(data["catalog_song_id"]))
+        except (TypeError, ValueError):
+            catalog_song = None
+        if not catalog_song:
+            return jsonify({"error": "Unknown catalog_song_id"}), 400
+        data["catalog_song_id"], data["song"], data["artist"] = catalog_song.id, catalog_song.song, catalog_song.artist
     if not data or not all(key in data for key in ["name", "song", "artist"]):
         return jsonify({"error": "Missing required fields"}), 400
 
-    # Get the next available position
-    max_position = db.session.query(db.func.max(Karaoke.position)).scalar()
+    flagged_fields = restricted_word_matcher().check_fields(data, ["name", "song", "artist"])
+    if flagged_fields:
+        return jsonify({"error": "Signup contains restricted words", "fields": flagged_fields}), 400
+
+    # Get the next available position in tonight's queue
+    session_id = current_show_session_id()
+    max_position = db.session.query(db.func.max(Karaoke.position)).filter(session_scope(Karaoke, session_id)).scalar()
     next_position = (max_position + 1) if max_position is not None else 1  # Start from 1 if empty
     adjustment = data.get("adjustment", 0.0)
     try:
@@ -1530,14 +3387,23 @@ def karaokesignup():
         song=data["song"],
         artist=data["artist"],
         position=next_position,
-        adjustment=adjustment
+        adjustment=adjustment,
+        session_id=session_id,
+        catalog_song_id=data.get("catalog_song_id"),
+        is_flagged=g.get("duplicate_submission", False),  # Same signup posted again moments ago
     )
     db.session.add(new_entry)
+    if new_entry.catalog_song_id is not None:
+        CatalogSong.query.filter_by(id=new_entry.catalog_song_id).update(
+            {"times_requested": CatalogSong.times_requested + 1}, synchronize_session=False
+        )
     db.session.commit()
+    seconds = song_slot_seconds([song_key(new_entry.song, new_entry.artist)]).popitem()[1]
+    wait_estimator().update(session_id, lambda queue: queue.append(new_entry.id, seconds))
 
     return jsonify(new_entry.to_dict()), 201
 
-@app.route("/karaokesignup/<int:id>", methods=["PATCH"])
+@karaoke_bp.route("/karaokesignup/<int:id>", methods=["PATCH"])
 def update_karaoke_signup(id):
     print(f"🟡 Received PATCH request for ID: {id}")  # Log request ID
 
@@ -1560,6 +3426,8 @@ def update_karaoke_signup(id):
         print(f"✏️ Updating name: {entry.name} → {data['name']}")
         entry.name = data["name"]
         changes_made = True
+    if ("song" in data and entry.song != data["song"]) or ("artist" in data and entry.artist != data["artist"]):
+        entry.catalog_song_id = None  # Hand-edited, no longer the catalog spelling
     if "song" in data and entry.song != data["song"]:
         print(f"🎵 Updating song: {entry.song} → {data['song']}")
         entry.song = data["song"]
@@ -1596,6 +3464,9 @@ def update_karaoke_signup(id):
             # Fetch the updated entry
             updated_entry = Karaoke.query.get(id)
             print(f"🔍 AFTER COMMIT → ID: {updated_entry.id}, is_flagged: {updated_entry.is_flagged}")
+            if "song" in data or "artist" in data:
+                seconds = song_slot_seconds([song_key(updated_entry.song, updated_entry.artist)]).popitem()[1]
+                wait_estimator().update(updated_entry.session_id, lambda queue: queue.set_seconds(id, seconds))
 
             return jsonify(updated_entry.to_dict()), 200  # Return updated entry
 
@@ -1608,25 +3479,26 @@ def update_karaoke_signup(id):
         return jsonify({"is_flagged": entry.is_flagged, "is_warning": entry.is_warning}), 200  # ✅ Return correct data even if no change
 
 
-@app.route("/karaokesignup/count", methods=["GET"])
+@karaoke_bp.route("/karaokesignup/count", methods=["GET"])
 def get_active_karaoke_count():
     """Retrieve the number of active (not soft deleted) karaoke submissions for a specific singer."""
     singer_name = request.args.get("name", "").strip()
+    scope = session_scope(Karaoke, requested_show_session_id())
 
     if not singer_name:
         # Return total count if no specific name is provided
-        active_count = Karaoke.query.filter(Karaoke.is_deleted == False).count()
+        active_count = Karaoke.query.filter(scope, Karaoke.is_deleted == False).count()
         return jsonify({"active_count": active_count}), 200
 
     # Count active (non-deleted) signups for the specific singer
     active_singer_count = Karaoke.query.filter(
-        Karaoke.name.ilike(singer_name), Karaoke.is_deleted == False
+        scope, Karaoke.name.ilike(singer_name), Karaoke.is_deleted == False
     ).count()
 
     return jsonify({"active_count": active_singer_count}), 200
 
 
-@app.route("/karaokesignup/<int:id>", methods=["DELETE"])
+@karaoke_bp.route("/karaokesignup/<int:id>", methods=["DELETE"])
 def delete_karaoke_signup(id):
     entry = Karaoke.query.get(id)
 
@@ -1638,49 +3510,47 @@ def delete_karaoke_signup(id):
 
     return jsonify({"message": "Signup deleted successfully"}), 200
 
-@app.route("/karaokesignup", methods=["DELETE"])
+@karaoke_bp.route("/karaokesignup", methods=["DELETE"])
 def delete_all_karaoke_signups():
     try:
-        num_deleted = db.session.query(Karaoke).delete()
-        db.session.commit()
-        return jsonify({"message": f"Deleted {num_deleted} signups successfully"}), 200
+        # Only tonight's queue; past show sessions are kept
+        return bulk_delete(
+            "karaoke_signups", "Deleted {deleted} signups successfully", session_id=current_show_session_id()
+        )
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
-@app.route("/karaokesignup", methods=["GET"])
+@karaoke_bp.route("/karaokesignup", methods=["GET"])
 def get_all_karaoke_signups():
     search_term = request.args.get("search", "").strip().lower()
 
-    query = Karaoke.query.filter_by(is_deleted=False)  # Don't fetch deleted entries
+    criteria = [session_scope(Karaoke, requested_show_session_id()), Karaoke.is_deleted == False]  # Don't fetch deleted entries
 
     if search_term:
-        query = query.filter(
+        criteria.append(
             (Karaoke.name.ilike(f"%{search_term}%")) | 
             (Karaoke.song.ilike(f"%{search_term}%")) | 
             (Karaoke.artist.ilike(f"%{search_term}%"))
         )  
 
-    signups = query.order_by(Karaoke.position.asc()).all()
-    
-    # 🚀 Print EVERY signup to confirm is_flagged is being returned
-    print("📡 Sending Karaoke Signups to Frontend:", [s.to_dict() for s in signups])
-
-    return jsonify([signup.to_dict() for signup in signups]), 200
+    return jsonify(select_rows(Karaoke, *criteria, order_by=Karaoke.position.asc())), 200
 
 
 
-@app.route("/karaokesignup/<int:id>", methods=["GET"])
+@karaoke_bp.route("/karaokesignup/<int:id>", methods=["GET"])
 def get_karaoke_signup(id):
     signup = Karaoke.query.get(id)
     if not signup:
         return jsonify({"error": "Signup not found"}), 404
     return jsonify(signup.to_dict()), 200
-@app.route("/karaokesignup/deleted", methods=["GET"])
+@karaoke_bp.route("/karaokesignup/deleted", methods=["GET"])
 def get_deleted_karaoke_signups():
-    deleted_signups = Karaoke.query.filter_by(is_deleted=True).all()
+    deleted_signups = Karaoke.query.filter(
+        session_scope(Karaoke, requested_show_session_id()), Karaoke.is_deleted == True
+    ).all()
     return jsonify([signup.to_dict() for signup in deleted_signups]), 200
 
-@app.route("/karaokesignup/<int:id>/soft_delete", methods=["PATCH"])
+@karaoke_bp.route("/karaokesignup/<int:id>/soft_delete", methods=["PATCH"])
 def soft_delete_karaoke_signup(id):
     """Soft deletes a signup and updates positions"""
     entry = Karaoke.query.get(id)
@@ -1694,27 +3564,41 @@ def soft_delete_karaoke_signup(id):
     db.session.commit()
 
     print(f"Signup {id} marked as deleted.")  # Debugging log
+    wait_estimator().update(entry.session_id, lambda queue: queue.remove(id))
 
-    # Re-fetch remaining signups that are NOT deleted
-    signups = Karaoke.query.filter_by(is_deleted=False).order_by(Karaoke.position).all()
+    # Closing the gap is a background job; back-to-back deletes share one queued run
+    job = enqueue_job(
+        "karaoke.renumber", {"session_id": entry.session_id}, coalesce_key=f"karaoke.renumber:{entry.session_id}"
+    )
+
+    return jsonify({"message": f"Signup {id} soft deleted, positions updating", "job_id": job.id}), 200
 
-    # Recalculate positions (ensure no gaps in order)
-    for i, signup in enumerate(signups):
-        signup.position = i  # Update position sequentially
-        db.session.query(Karaoke).filter_by(id=signup.id).update({"position": i})
 
-    db.session.commit()  # ✅ Save updated positions
+@job_handler("karaoke.renumber")
+def run_karaoke_renumber(payload):
+    """Recalculate positions (ensure no gaps in order), writing only rows that changed."""
+    signups = Karaoke.query.filter(
+        session_scope(Karaoke, payload.get("session_id")), Karaoke.is_deleted == False
+    ).order_by(Karaoke.position).all()
 
-    return jsonify({"message": f"Signup {id} soft deleted and positions updated"}), 200
+    changed = 0
+    for i, signup in enumerate(signups):
+        if signup.position != i:
+            signup.position = i
+            changed += 1
+    db.session.commit()
+    return {"renumbered": changed}
 
-@app.route("/karaokesignup/active", methods=["GET"])
+@karaoke_bp.route("/karaokesignup/active", methods=["GET"])
 def get_active_karaoke_signups():
     """Retrieve all active (not soft deleted) karaoke signups."""
-    active_signups = Karaoke.query.filter_by(is_deleted=False).all()
+    active_signups = Karaoke.query.filter(
+        session_scope(Karaoke, requested_show_session_id()), Karaoke.is_deleted == False
+    ).all()
     return jsonify([signup.to_dict() for signup in active_signups]), 200
 
 
-@app.route("/karaokesignup/<int:id>/move", methods=["PATCH"])
+@karaoke_bp.route("/karaokesignup/<int:id>/move", methods=["PATCH"])
 def move_karaoke_signup(id):
     print(f"Received request to move signup with ID: {id}")  # Debugging log
 
@@ -1726,8 +3610,10 @@ def move_karaoke_signup(id):
         print(f"Signup with ID {id} not found")  # Debugging log
         return jsonify({"error": "Signup not found"}), 404
 
-    # Fetch all signups ordered by position
-    signups = Karaoke.query.filter_by(is_deleted=False).order_by(Karaoke.position).all()
+    # Fetch the entry's queue ordered by position
+    signups = Karaoke.query.filter(
+        session_scope(Karaoke, entry.session_id), Karaoke.is_deleted == False
+    ).order_by(Karaoke.position).all()
 
     # Find current position index
     current_index = next((i for i, s in enumerate(signups) if s.id == id), None)
@@ -1751,11 +3637,11 @@ def move_karaoke_signup(id):
     elif action == "up_next":
         new_index = min(1, len(signups) - 1)  # Move to second position
     elif action == "sort_by_time":
+        current = [(signup.id, signup.position) for signup in signups]
         signups.sort(key=lambda x: x.created_at)  # Assuming a timestamp field exists
-        for i, signup in enumerate(signups):
-            signup.position = i
-            db.session.query(Karaoke).filter_by(id=signup.id).update({"position": i})
+        write_queue_positions(plan_queue_positions(current, [signup.id for signup in signups]))
         db.session.commit()
+        wait_estimator().forget(entry.session_id)
         return jsonify({"message": "Signups sorted by time"}), 200
     else:
         print(f"Invalid action received: {action}")  # Debugging log
@@ -1766,6 +3652,7 @@ def move_karaoke_signup(id):
         return jsonify({"message": "No movement needed"}), 200
 
     # ✅ Fix: Ensure safe list removal and reordering
+    current = [(signup.id, signup.position) for signup in signups]
     moving_entry = signups.pop(current_index)  # Remove the entry from the list
 
     if new_index == 0:  # Moving to the first position
@@ -1773,23 +3660,24 @@ def move_karaoke_signup(id):
     else:
         signups.insert(new_index, moving_entry)  # Insert at the correct position
 
-    # ✅ Fix: Recalculate positions to prevent out-of-range errors
-    for i, signup in enumerate(signups):
-        signup.position = i
-        db.session.query(Karaoke).filter_by(id=signup.id).update({"position": i})
+    # Write only the signups that have to move
+    write_queue_positions(plan_queue_positions(current, [signup.id for signup in signups]))
 
     db.session.commit()
+    wait_estimator().update(entry.session_id, lambda queue: queue.move(id, new_index))
     
     return jsonify({"message": f"Signup moved {action}"}), 200
 
 
 
-@app.route("/karaokesignup/sort", methods=["PATCH"])
+@karaoke_bp.route("/karaokesignup/sort", methods=["PATCH"])
 def sort_karaoke_signups():
     print("Received request to sort signups by time.")  # Debugging log
 
-    # Fetch all signups, sort by `created_at`
-    signups = Karaoke.query.filter_by(is_deleted=False).order_by(Karaoke.created_at).all()
+    # Fetch tonight's signups, sort by `created_at`
+    signups = Karaoke.query.filter(
+        session_scope(Karaoke, current_show_session_id()), Karaoke.is_deleted == False
+    ).order_by(Karaoke.created_at).all()
 
     # Update positions sequentially
     for i, signup in enumerate(signups):
@@ -1797,13 +3685,261 @@ def sort_karaoke_signups():
         db.session.query(Karaoke).filter_by(id=signup.id).update({"position": i})
 
     db.session.commit()
+    wait_estimator().forget(current_show_session_id())
     print("Signups successfully sorted by time.")  # Debugging log
 
     return jsonify({"message": "Signups sorted by time"}), 200
 
 
+def longest_increasing_subsequence(values):
+    """Indices of one longest strictly increasing run of values (None is never part of it). O(n log n)."""
+    tails, tail_values = [], []  # tails[k]: index ending the best run of length k + 1
+    previous = [None] * len(values)
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        k = bisect.bisect_left(tail_values, value)
+        if k:
+            previous[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+            tail_values.append(value)
+        else:
+            tails[k], tail_values[k] = i, value
+    indices = []
+    i = tails[-1] if tails else None
+    while i is not None:
+        indices.append(i)
+        i = previous[i]
+    return indices[::-1]
+
+
+def plan_queue_positions(current, desired_ids):
+    """
+    New positions taking the queue from `current` [(id, position), ...] to
+    `desired_ids`, as {id: position} for the rows that must be written.
+
+    Signups on a longest increasing subsequence of their current positions keep
+    them; the rest are slotted into the gaps around them, or past either end.
+    If a gap is too narrow the queue's own position values are reassigned in
+    the new order instead, whichever touches fewer rows.
+    """
+    position_of = dict(current)
+    values = [position_of[signup_id] for signup_id in desired_ids]
+    kept = set(longest_increasing_subsequence(values))
+
+    sparse, run, low = {}, [], None
+    for i, signup_id in enumerate(desired_ids + [None]):
+        if signup_id is not None and i not in kept:
+            run.append(signup_id)
+            continue
+        high = values[i] if signup_id is not None else None
+        if run:
+            if low is None and high is None:
+                slots = range(1, len(run) + 1)
+            elif low is None:
+                slots = range(high - len(run), high)
+            elif high is None:
+                slots = range(low + 1, low + 1 + len(run))
+            elif high - low - 1 >= len(run):
+                slots = [low + (j + 1) * (high - low) // (len(run) + 1) for j in range(len(run))]
+            else:
+                sparse = None
+                break
+            sparse.update(zip(run, slots))
+            run = []
+        low = high
+
+    positions = sorted(value for value in values if value is not None)
+    if len(positions) != len(values) or len(set(positions)) != len(positions):
+        positions = list(range(1, len(values) + 1))  # Numbered from 1, like karaokesignup()
+    dense = {
+        signup_id: position
+        for signup_id, position in zip(desired_ids, positions)
+        if position_of[signup_id] != position
+    }
+    return sparse if sparse is not None and len(sparse) <= len(dense) else dense
+
+
+def queue_version(current):
+    """Short fingerprint of a queue's ids and positions, for conflict checks."""
+    return hashlib.sha1(",".join(f"{signup_id}:{position}" for signup_id, position in current).encode()).hexdigest()[:16]
+
+
+def load_queue_order(session_id, for_update=False):
+    query = db.select(Karaoke.id, Karaoke.position).where(
+        session_scope(Karaoke, session_id), Karaoke.is_deleted == False
+    ).order_by(Karaoke.position, Karaoke.id)
+    if for_update:
+        query = query.with_for_update()
+    return [tuple(row) for row in db.session.execute(query)]
+
+
+def write_queue_positions(changes):
+    if changes:
+        db.session.execute(
+            db.update(Karaoke), [{"id": signup_id, "position": position} for signup_id, position in changes.items()]
+        )
+
+
+@karaoke_bp.route("/karaokesignup/order", methods=["GET"])
+def get_karaoke_order():
+    current = load_queue_order(requested_show_session_id())
+    return jsonify({"order": [signup_id for signup_id, _ in current], "version": queue_version(current)}), 200
+
+
+@karaoke_bp.route("/karaokesignup/order", methods=["PATCH"])
+def reorder_karaoke_signups():
+    """
+    Set tonight's order. Body is either {"order": [id, ...]} with every queued
+    signup, or a drag-and-drop {"id": N, "to_index": i}. Pass the "version"
+    from GET /karaokesignup/order to get a 409 instead of overwriting a queue
+    that changed since it was read.
+    """
+    data = request.get_json() or {}
+    session_id = current_show_session_id()
+    current = load_queue_order(session_id, for_update=True)
+    current_ids = [signup_id for signup_id, _ in current]
+    conflict = {"error": "Queue changed, reload and try again", "order": current_ids, "version": queue_version(current)}
+
+    if data.get("version") is not None and data["version"] != queue_version(current):
+        db.session.rollback()
+        return jsonify(conflict), 409
+
+    if "order" in data:
+        desired = data["order"]
+        if not isinstance(desired, list) or not all(isinstance(signup_id, int) for signup_id in desired):
+            db.session.rollback()
+            return jsonify({"error": "order must be a list of signup ids"}), 400
+        if len(desired) != len(current_ids) or set(desired) != set(current_ids):
+            db.session.rollback()
+            return jsonify(conflict), 409
+    elif "id" in data and "to_index" in data:
+        if data["id"] not in current_ids:
+            db.session.rollback()
+            return jsonify(conflict), 409
+        try:
+            to_index = min(max(int(data["to_index"]), 0), len(current_ids) - 1)
+        except (TypeError, ValueError):
+            db.session.rollback()
+            return jsonify({"error": "to_index must be a number"}), 400
+        desired = [signup_id for signup_id in current_ids if signup_id != data["id"]]
+        desired.insert(to_index, data["id"])
+    else:
+        db.session.rollback()
+        return jsonify({"error": "Provide order, or id and to_index"}), 400
+
+    changes = plan_queue_positions(current, desired)
+    try:
+        write_queue_positions(changes)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+    if "order" in data:
+        wait_estimator().forget(session_id)
+    else:
+        wait_estimator().update(session_id, lambda queue: queue.move(data["id"], to_index))
+    position_of = dict(current)
+    updated = [(signup_id, changes.get(signup_id, position_of[signup_id])) for signup_id in desired]
+    return jsonify({"order": desired, "version": queue_version(updated), "changed": sorted(changes)}), 200
+
+
+def rotation_singer(name):
+    return " ".join((name or "").casefold().split())
+
+
+def fair_rotation_order(signups, sung_counts, keep_current=True):
+    """
+    Round-robin order: a singer's k-th song tonight is in round k, so nobody's
+    second song comes before everyone's first. Within a round, signup time
+    decides. `adjustment` shifts a signup by that many rounds (negative moves
+    it up), is_warning costs ROTATION_WARNING_ROUNDS and flagged signups wait
+    at the back. O(n log n).
+    """
+    if not signups:
+        return []
+    head = [signups[0]] if keep_current else []
+    rest = signups[len(head):]
+
+    penalty = current_app.config['ROTATION_WARNING_ROUNDS']
+    seen = Counter(sung_counts)
+    if head:
+        seen[rotation_singer(head[0].name)] += 1
+    keyed = []
+    for signup in sorted(rest, key=lambda s: (s.created_at or datetime.min, s.id)):
+        singer = rotation_singer(signup.name)
+        rotation_round = seen[singer]
+        seen[singer] += 1
+        rank = rotation_round + (signup.adjustment or 0) + (penalty if signup.is_warning else 0)
+        keyed.append(((bool(signup.is_flagged), rank, signup.created_at or datetime.min, signup.id), rotation_round, signup))
+    keyed.sort(key=lambda item: item[0])
+    return [(signup, 0) for signup in head] + [(signup, rotation_round) for _, rotation_round, signup in keyed]
+
+
+def rotation_sung_counts(session_id):
+    """
+    Songs each singer has already had tonight: soft-deleted signups in the
+    session, minus flagged duplicates. Nothing records why the DJ removed a
+    row, so a no-show still counts as sung. With no show session open, NULL
+    session rows span every past night, so only rows deleted in the last
+    ROTATION_HISTORY_HOURS count.
+    """
+    query = db.session.query(Karaoke.name, func.count()).filter(
+        session_scope(Karaoke, session_id), Karaoke.is_deleted == True, Karaoke.is_flagged == False
+    )
+    if session_id is None:
+        since = datetime.utcnow() - timedelta(hours=current_app.config['ROTATION_HISTORY_HOURS'])
+        query = query.filter(Karaoke.deleted_at >= since)
+    sung_counts = Counter()
+    for name, count in query.group_by(Karaoke.name):
+        sung_counts[rotation_singer(name)] += count
+    return sung_counts
+
+
+@karaoke_bp.route("/karaokesignup/rotation", methods=["PATCH"])
+def rotate_karaoke_signups():
+    """
+    Reorder tonight's queue by fair rotation. ?preview=true returns the new
+    order without saving; ?keep_current=false also moves the singer on stage.
+    Only signups whose position changes are written (see plan_queue_positions).
+    """
+    preview = request.args.get("preview", "").lower() in ("1", "true", "yes")
+    keep_current = request.args.get("keep_current", "true").lower() in ("1", "true", "yes")
+    session_id = current_show_session_id()
+
+    signups = Karaoke.query.filter(
+        session_scope(Karaoke, session_id), Karaoke.is_deleted == False
+    ).order_by(Karaoke.position, Karaoke.id).all()
+    order = fair_rotation_order(signups, rotation_sung_counts(session_id), keep_current)
+    changes = plan_queue_positions(
+        [(signup.id, signup.position) for signup in signups], [signup.id for signup, _ in order]
+    )
+    result = {
+        "preview": preview,
+        "changed": len(changes),
+        "order": [
+            {"id": signup.id, "name": signup.name, "song": signup.song, "round": rotation_round,
+             "from": signup.position, "to": changes.get(signup.id, signup.position)}
+            for signup, rotation_round in order
+        ],
+    }
+    if preview or not changes:
+        return jsonify(result), 200
+
+    try:
+        write_queue_positions(changes)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    wait_estimator().forget(session_id)
+    return jsonify(result), 200
+
+
 
-@app.route("/karaokesignup/singer_counts", methods=["GET"])
+@karaoke_bp.route("/karaokesignup/singer_counts", methods=["GET"])
 def get_singer_counts():
     """Retrieve the number of times each singer has performed throughout the entire night, including deleted entries, along with their songs."""
     results = (
@@ -1812,6 +3948,7 @@ def get_singer_counts():
             func.count(Karaoke.id), 
             func.string_agg(Karaoke.song, ', ')
         )
+        .filter(session_scope(Karaoke, requested_show_session_id()))
         .group_by(Karaoke.name)
         .order_by(func.count(Karaoke.id).desc())  # Order by most performances
         .all()
@@ -1827,135 +3964,924 @@ def get_singer_counts():
 
 
 
-class FormState(db.Model):
+# ============================
+#   Wait-time estimates
+# ============================
+class SongDuration(DatetimeFormatMixin, db.Model):
+    """Known song lengths; anything not listed is estimated at AVERAGE_SONG_SECONDS."""
+    __tablename__ = "song_duration"
+
     id = db.Column(db.Integer, primary_key=True)
-    show_form = db.Column(db.Boolean, default=False)
-    last_updated = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())  
-    pin_code = db.Column(db.String(4), nullable=True)  # 4-digit PIN stored as a string
+    song_key = db.Column(db.String(420), unique=True, nullable=False)  # song_key(song, artist)
+    song = db.Column(db.String(200), nullable=False)
+    artist = db.Column(db.String(200), nullable=False)
+    seconds = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __datetime_formats__ = {"updated_at": "iso"}
 
     def to_dict(self):
-        """Convert the FormState entry into a dictionary."""
         return {
             "id": self.id,
-            "show_form": self.show_form,
-            "last_updated": self.last_updated.isoformat() if self.last_updated else None,
-            "pin_code": self.pin_code,  # ✅ Include this to fix the issue
-
+            "song": self.song,
+            "artist": self.artist,
+            "seconds": self.seconds,
+            "updated_at": self.format_datetime("updated_at"),
         }
 
-# ============================
-#   GET: Fetch form state
-# ============================
-@app.route("/formstate", methods=["GET"])
-def get_form_state():
-    """Retrieve the current form state, creating a default entry if none exists."""
-    form_state = FormState.query.first()
-    
-    if not form_state:
-        form_state = FormState(show_form=False)
-        db.session.add(form_state)
-        db.session.commit()
-
-    return jsonify(form_state.to_dict()), 200
 
-# ============================
-#   POST: Set a New PIN
-# ============================
-@app.route("/formstate/set_pin", methods=["POST"])
-def set_pin():
-    data = request.get_json()
-    new_pin = data.get("pin_code")
+def song_key(song, artist):
+    return "|".join(" ".join(str(part or "").casefold().split()) for part in (song, artist))
+
+
+def song_slot_seconds(keys):
+    """Seconds each song occupies in the queue (duration + changeover), keyed by song_key."""
+    config = current_app.config
+    known = {}
+    if keys:
+        known = dict(db.session.query(SongDuration.song_key, SongDuration.seconds).filter(SongDuration.song_key.in_(set(keys))))
+    return {key: known.get(key, config['AVERAGE_SONG_SECONDS']) + config['SINGER_CHANGEOVER_SECONDS'] for key in keys}
+
+
+class QueueState:
+    """One night's queue as parallel lists plus prefix sums: prefix[i] = seconds queued ahead of entry i."""
+
+    def __init__(self, entries, head_since):
+        self.ids = [signup_id for signup_id, _ in entries]
+        self.seconds = [seconds for _, seconds in entries]
+        self.prefix = [0] * (len(entries) + 1)
+        self.index = {}
+        self.head_since = head_since  # When the entry at index 0 took the stage
+        self.built_at = time.monotonic()
+        self._refresh_from(0)
+
+    def _refresh_from(self, start):
+        # Entries before `start` are untouched, so only the tail is recomputed
+        del self.prefix[len(self.ids) + 1:]
+        self.prefix.extend([0] * (len(self.ids) + 1 - len(self.prefix)))
+        for i in range(start, len(self.ids)):
+            self.prefix[i + 1] = self.prefix[i] + self.seconds[i]
+            self.index[self.ids[i]] = i
+
+    def append(self, signup_id, seconds):
+        if not self.ids:
+            self.head_since = datetime.utcnow()
+        self.index[signup_id] = len(self.ids)
+        self.ids.append(signup_id)
+        self.seconds.append(seconds)
+        self.prefix.append(self.prefix[-1] + seconds)
+
+    def remove(self, signup_id):
+        i = self.index.pop(signup_id, None)
+        if i is None:
+            return
+        del self.ids[i], self.seconds[i]
+        if i == 0:
+            self.head_since = datetime.utcnow()
+        self._refresh_from(i)
+
+    def move(self, signup_id, new_index):
+        i = self.index.get(signup_id)
+        if i is None:
+            return
+        self.ids.insert(new_index, self.ids.pop(i))
+        self.seconds.insert(new_index, self.seconds.pop(i))
+        if min(i, new_index) == 0:
+            self.head_since = datetime.utcnow()
+        self._refresh_from(min(i, new_index))
+
+    def set_seconds(self, signup_id, seconds):
+        i = self.index.get(signup_id)
+        if i is not None and self.seconds[i] != seconds:
+            self.seconds[i] = seconds
+            self._refresh_from(i)
+
+
+def build_queue_state(session_id):
+    scope = session_scope(Karaoke, session_id)
+    rows = db.session.execute(
+        db.select(Karaoke.id, Karaoke.song, Karaoke.artist, Karaoke.created_at)
+        .where(scope, Karaoke.is_deleted == False)
+        .order_by(Karaoke.position, Karaoke.id)
+    ).all()
+    slots = song_slot_seconds([song_key(song, artist) for _, song, artist, _ in rows])
+    last_finished = db.session.scalar(db.select(func.max(Karaoke.deleted_at)).where(scope, Karaoke.is_deleted == True))
+    head_since = None
+    if rows:
+        head_since = max(filter(None, (last_finished, rows[0].created_at)), default=None)
+    return QueueState([(row.id, slots[song_key(row.song, row.artist)]) for row in rows], head_since)
+
+
+class WaitTimeEstimator:
+    """
+    Per-process queue states keyed by show session. Local writes update them in
+    place; a state older than WAIT_ESTIMATOR_MAX_AGE is rebuilt to pick up
+    writes made by other workers.
+    """
 
-    if not new_pin or len(new_pin) != 4 or not new_pin.isdigit():
-        return jsonify({"error": "PIN must be a 4-digit number"}), 400
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self.lock = threading.RLock()
+        self.queues = {}
+        self.music_break = None  # (break started at or None, loaded at)
+
+    def _fresh(self, state):
+        return state is not None and time.monotonic() - state.built_at < self.max_age
+
+    def queue(self, session_id):
+        with self.lock:
+            state = self.queues.get(session_id)
+            hit = self._fresh(state)
+            record_cache_lookup("wait_estimator", hit)
+            if not hit:
+                state = self.queues[session_id] = build_queue_state(session_id)
+            return state
+
+    def update(self, session_id, change):
+        """Apply change(state) if this process holds a fresh copy; a stale one is rebuilt on next read."""
+        with self.lock:
+            state = self.queues.get(session_id)
+            if self._fresh(state):
+                change(state)
+            else:
+                self.queues.pop(session_id, None)
+
+    def forget(self, session_id):
+        with self.lock:
+            self.queues.pop(session_id, None)
+
+    def invalidate(self):
+        with self.lock:
+            self.queues.clear()
+            self.music_break = None
+
+    def break_started_at(self):
+        with self.lock:
+            if self.music_break is None or time.monotonic() - self.music_break[1] >= self.max_age:
+                state = MusicBreakState.query.first()
+                started = state.last_updated if state and state.show_alert else None
+                self.music_break = (started, time.monotonic())
+            return self.music_break[0]
+
+    def set_music_break(self, started_at):
+        with self.lock:
+            self.music_break = (started_at, time.monotonic())
+
+    def find(self, signup_id):
+        with self.lock:
+            for session_id, state in self.queues.items():
+                if self._fresh(state) and signup_id in state.index:
+                    return state
+        return None
+
+
+def wait_estimator():
+    return current_app.extensions["wait_estimator"]
+
+
+def signup_wait_status(state, signup_id, now):
+    """ETA for one queued signup: O(1) from the prefix sums."""
+    config = current_app.config
+    i = state.index[signup_id]
+    break_started = wait_estimator().break_started_at()
+    if i == 0:
+        return {"id": signup_id, "status": "on_stage", "ahead": 0, "eta_seconds": 0,
+                "eta_at": now.replace(microsecond=0).isoformat(), "paused": break_started is not None}
+
+    # The clock on the current song stops while a music break is on
+    clock = break_started or now
+    elapsed = (clock - state.head_since).total_seconds() if state.head_since else 0
+    wait = state.prefix[i] - min(max(elapsed, 0), state.seconds[0])
+    if break_started:
+        wait += max(0, config['MUSIC_BREAK_SECONDS'] - (now - break_started).total_seconds())
+    return {
+        "id": signup_id,
+        "status": "waiting",
+        "ahead": i,
+        "eta_seconds": round(wait),
+        "eta_at": (now + timedelta(seconds=round(wait))).replace(microsecond=0).isoformat(),
+        "paused": break_started is not None,
+    }
 
-    form_state = FormState.query.first()
-    if not form_state:
-        # 🚀 Default to opening signups when setting a new PIN
-        form_state = FormState(pin_code=new_pin, show_form=True)  
-        db.session.add(form_state)
-    else:
-        form_state.pin_code = new_pin
-        form_state.show_form = True  # 🚀 Ensure signups open when setting a PIN
 
+@karaoke_bp.route("/karaokesignup/<int:id>/status", methods=["GET"])
+def get_signup_wait_status(id):
+    """
+    "My status" for a singer: songs ahead and estimated wait, served from the in-memory queue.
+    """
+    now = datetime.utcnow()
+    state = wait_estimator().find(id)
+    if state is None:
+        signup = db.session.get(Karaoke, id)
+        if not signup:
+            return jsonify({"error": "Signup not found"}), 404
+        if signup.is_deleted:
+            return jsonify({"id": id, "status": "done"}), 200
+        state = wait_estimator().queue(signup.session_id)
+        if id not in state.index:
+            # Added by another worker since this copy was built
+            wait_estimator().forget(signup.session_id)
+            state = wait_estimator().queue(signup.session_id)
+    if id not in state.index:
+        return jsonify({"id": id, "status": "done"}), 200
+    return jsonify(signup_wait_status(state, id, now)), 200
+
+
+@karaoke_bp.route("/song-durations", methods=["GET"])
+def get_song_durations():
+    durations = SongDuration.query.order_by(SongDuration.artist, SongDuration.song).all()
+    return jsonify([duration.to_dict() for duration in durations]), 200
+
+
+@karaoke_bp.route("/song-durations", methods=["POST"])
+def upsert_song_duration():
+    """Add or update the length of a song: {"song", "artist", "seconds"}."""
+    data = request.get_json() or {}
+    if not data.get("song") or not data.get("artist"):
+        return jsonify({"error": "song and artist are required"}), 400
+    try:
+        seconds = int(data.get("seconds"))
+        if not 30 <= seconds <= 1800:
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({"error": "seconds must be a whole number between 30 and 1800"}), 400
+
+    key = song_key(data["song"], data["artist"])
+    duration = SongDuration.query.filter_by(song_key=key).first()
+    created = duration is None
+    if created:
+        duration = SongDuration(song_key=key, song=data["song"], artist=data["artist"])
+        db.session.add(duration)
+    duration.seconds = seconds
     db.session.commit()
-    return jsonify({"message": "PIN set successfully, signups are now OPEN"}), 201
-
-# ============================
-#   PATCH: Update Existing PIN
-# ============================
-@app.route("/formstate/update_pin", methods=["PATCH"])
-def update_pin():
-    data = request.get_json()
-    new_pin = data.get("pin_code")
+    wait_estimator().invalidate()
+    return jsonify(duration.to_dict()), 201 if created else 200
 
-    if not new_pin or len(new_pin) != 4 or not new_pin.isdigit():
-        return jsonify({"error": "PIN must be a 4-digit number"}), 400
-
-    form_state = FormState.query.first()
-    if not form_state:
-        return jsonify({"error": "No PIN found. Use POST to create one."}), 404
 
-    form_state.pin_code = new_pin
+@karaoke_bp.route("/song-durations/<int:id>", methods=["DELETE"])
+def delete_song_duration(id):
+    duration = db.session.get(SongDuration, id)
+    if not duration:
+        return jsonify({"error": "Song duration not found"}), 404
+    db.session.delete(duration)
     db.session.commit()
-    
-    return jsonify({"message": "PIN updated successfully"}), 200
+    wait_estimator().invalidate()
+    return jsonify({"message": "Song duration deleted"}), 200
+
 
 # ============================
-#   DELETE: Remove PIN
+#   Song catalog & autocomplete
 # ============================
-@app.route("/formstate/delete_pin", methods=["DELETE"])
-def delete_pin():
-    form_state = FormState.query.first()
-    if not form_state:
-        return jsonify({"error": "No PIN found"}), 404
-
-    form_state.pin_code = None
-    form_state.show_form = False  # 👈 Hides form when PIN is deleted
-    db.session.commit()
-
-    return jsonify({"message": "PIN deleted successfully"}), 200
-
+class CatalogSong(DatetimeFormatMixin, db.Model):
+    """Canonical song/artist spellings offered to singers by the signup autocomplete."""
+    __tablename__ = "song_catalog"
 
-class DJNotes(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    alert_type = db.Column(db.String(50), nullable=False)  # Type of alert
-    alert_details = db.Column(db.Text, nullable=False)  # Description/details of the alert
-    created_at = db.Column(db.DateTime, default=db.func.now())  # Timestamp when alert is created
-    is_active = db.Column(db.Boolean, default=True)  # Allows soft deletion or hiding alerts
-    position = db.Column(db.Integer, nullable=False, default=0)  # NEW: Position for sorting
+    song_key = db.Column(db.String(420), unique=True, nullable=False)  # song_key(song, artist)
+    song = db.Column(db.String(200), nullable=False)
+    artist = db.Column(db.String(200), nullable=False)
+    times_requested = db.Column(db.Integer, nullable=False, default=0)  # Ranks autocomplete results
+    source = db.Column(db.String(20), nullable=False, default="admin")  # file, signups or admin
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __datetime_formats__ = {"created_at": "iso"}
 
     def to_dict(self):
-        """Convert DJ Notes entry into a dictionary."""
         return {
             "id": self.id,
-            "alert_type": self.alert_type,
-            "alert_details": self.alert_details,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "is_active": self.is_active,
-            "position": self.position,  # Include position in response
-
+            "song": self.song,
+            "artist": self.artist,
+            "times_requested": self.times_requested,
+            "source": self.source,
+            "created_at": self.format_datetime("created_at"),
         }
-@app.route("/djnotes", methods=["POST"])
-def create_dj_note():
-    data = request.get_json()
-
-    # Validate required fields
-    if not data or "alert_type" not in data or "alert_details" not in data:
-        return jsonify({"error": "Missing required fields"}), 400
 
-    # Create new DJ Note
-    new_note = DJNotes(
-        alert_type=data["alert_type"],
-        alert_details=data["alert_details"],
-    )
 
-    db.session.add(new_note)
-    db.session.commit()
+def catalog_tokens(text):
+    """Accent-free lowercase words; unlike normalize_for_matching, digits stay digits ("Blink-182")."""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode().lower()
+    return "".join(ch if ch.isalnum() else " " for ch in text).split()
 
-    return jsonify(new_note.to_dict()), 201
 
-@app.route("/djnotes/<int:id>", methods=["PATCH"])
+class SongCatalogIndex:
+    """
+    Prefix trie over every word of each song title and artist. Each node keeps
+    the ids of the best-ranked songs having a word with that prefix (at most
+    SONG_CATALOG_NODE_LIMIT), so a lookup is one walk down the trie plus a
+    filter over that short list.
+    """
+
+    def __init__(self, max_age, node_limit):
+        self.max_age = max_age
+        self.node_limit = node_limit
+        self.lock = threading.Lock()
+        self.goto = None
+        self.ids = None
+        self.entries = {}  # id -> (song, artist, words)
+        self.built_at = 0.0
+
+    def _fresh(self):
+        return self.goto is not None and time.monotonic() - self.built_at < self.max_age
+
+    def _rebuild(self):
+        self.goto, self.ids, self.entries = [{}], [[]], {}
+        rows = db.session.execute(
+            db.select(CatalogSong.id, CatalogSong.song, CatalogSong.artist)
+            .order_by(CatalogSong.times_requested.desc(), CatalogSong.song, CatalogSong.id)
+        ).all()
+        for row in rows:
+            self._insert(row.id, row.song, row.artist)
+        self.built_at = time.monotonic()
+
+    def _insert(self, song_id, song, artist):
+        words = set(catalog_tokens(song)) | set(catalog_tokens(artist))
+        self.entries[song_id] = (song, artist, words)
+        touched = set()
+        for word in words:
+            node = 0
+            for ch in word:
+                if ch not in self.goto[node]:
+                    self.goto[node][ch] = len(self.goto)
+                    self.goto.append({})
+                    self.ids.append([])
+                node = self.goto[node][ch]
+                # A song with two words sharing a prefix is listed once per node
+                if node not in touched and len(self.ids[node]) < self.node_limit:
+                    self.ids[node].append(song_id)
+                touched.add(node)
+
+    def _node(self, prefix):
+        node = 0
+        for ch in prefix:
+            node = self.goto[node].get(ch)
+            if node is None:
+                return None
+        return node
+
+    def _ensure_built(self):
+        hit = self._fresh()
+        record_cache_lookup("song_catalog", hit)
+        if not hit:
+            self._rebuild()
+
+    def warm(self):
+        with self.lock:
+            self._ensure_built()
+
+    def search(self, query, limit):
+        words = catalog_tokens(query)
+        if not words:
+            return []
+        with self.lock:
+            self._ensure_built()
+            nodes = [self._node(word) for word in words]
+            if None in nodes:
+                return []
+            # Filter the shortest candidate list; below the cap it holds every match
+            node = min(nodes, key=lambda node: len(self.ids[node]))
+            results = []
+            for song_id in self.ids[node]:
+                song, artist, entry_words = self.entries[song_id]
+                if all(any(entry_word.startswith(word) for entry_word in entry_words) for word in words):
+                    results.append({"id": song_id, "song": song, "artist": artist})
+                    if len(results) >= limit:
+                        break
+            return results
+
+    def add(self, song):
+        """Index a committed insert; it ranks last until the next rebuild."""
+        with self.lock:
+            if self.goto is not None:
+                self._insert(song.id, song.song, song.artist)
+
+    def invalidate(self):
+        with self.lock:
+            self.goto = None
+
+
+def song_catalog():
+    return current_app.extensions["song_catalog"]
+
+
+def read_song_catalog_file(path):
+    """(song, artist) pairs from a CSV with "song" and "artist" columns."""
+    if not path or not os.path.exists(path):
+        print(f"⚠️ Song catalog file not found: {path}")
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        return [
+            (row["song"].strip(), row["artist"].strip())
+            for row in csv.DictReader(f)
+            if (row.get("song") or "").strip() and (row.get("artist") or "").strip()
+        ]
+
+
+def seed_song_catalog(path=None):
+    """
+    Add songs from the catalog file and from every past signup (live and
+    history). A spelling is chosen per song_key by how often it was used;
+    existing rows keep their spelling. Returns counts of added/updated rows.
+    """
+    requested = Counter()
+    spellings = {}
+    pairs = [("file", song, artist) for song, artist in read_song_catalog_file(path or current_app.config['SONG_CATALOG_PATH'])]
+    for model in (Karaoke, KaraokeHistory):
+        pairs += [("signups", song, artist) for song, artist in db.session.execute(db.select(model.song, model.artist))]
+
+    for source, song, artist in pairs:
+        key = song_key(song, artist)
+        if not key.strip("|"):
+            continue
+        spellings.setdefault(key, {"source": source, "counts": Counter()})["counts"][(song.strip(), artist.strip())] += 1
+        if source == "signups":
+            requested[key] += 1
+
+    existing = {song.song_key: song for song in CatalogSong.query.all()}
+    new_rows = []
+    updated = 0
+    for key, seen in spellings.items():
+        song = existing.get(key)
+        if song is None:
+            (title, artist), _ = seen["counts"].most_common(1)[0]
+            new_rows.append({
+                "song_key": key, "song": title, "artist": artist,
+                "times_requested": requested[key], "source": seen["source"], "created_at": datetime.utcnow(),
+            })
+        elif requested[key] > song.times_requested:
+            song.times_requested = requested[key]
+            updated += 1
+    if new_rows:
+        db.session.execute(db.insert(CatalogSong), new_rows)
+    db.session.commit()
+    song_catalog().invalidate()
+    return {"added": len(new_rows), "updated": updated}
+
+
+@click.command("seed-song-catalog")
+@click.option("--path", default=None, help="CSV with song,artist columns (default: SONG_CATALOG_PATH)")
+@with_appcontext
+def seed_song_catalog_command(path):
+    """Fill song_catalog from the catalog file and past signups."""
+    result = seed_song_catalog(path)
+    click.echo(f"Added {result['added']} songs, updated {result['updated']}")
+
+
+@karaoke_bp.route("/song-catalog/autocomplete", methods=["GET"])
+def autocomplete_songs():
+    """Catalog songs matching every word of ?q= as a word prefix, most requested first."""
+    limit = max(1, min(request.args.get("limit", 10, type=int), 50))
+    return jsonify(song_catalog().search(request.args.get("q", ""), limit)), 200
+
+
+@karaoke_bp.route("/song-catalog", methods=["GET"])
+def get_song_catalog():
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = max(1, min(request.args.get("per_page", 100, type=int), 500))
+    songs = CatalogSong.query.order_by(CatalogSong.artist, CatalogSong.song).offset((page - 1) * per_page).limit(per_page)
+    return jsonify([song.to_dict() for song in songs]), 200
+
+
+@karaoke_bp.route("/song-catalog", methods=["POST"])
+def add_catalog_song():
+    data = request.get_json() or {}
+    if not (data.get("song") or "").strip() or not (data.get("artist") or "").strip():
+        return jsonify({"error": "song and artist are required"}), 400
+    key = song_key(data["song"], data["artist"])
+    if CatalogSong.query.filter_by(song_key=key).first():
+        return jsonify({"error": "Song already in catalog"}), 409
+
+    song = CatalogSong(song_key=key, song=data["song"].strip(), artist=data["artist"].strip(), source="admin")
+    db.session.add(song)
+    db.session.commit()
+    song_catalog().add(song)
+    return jsonify(song.to_dict()), 201
+
+
+@karaoke_bp.route("/song-catalog/<int:id>", methods=["DELETE"])
+def delete_catalog_song(id):
+    song = db.session.get(CatalogSong, id)
+    if not song:
+        return jsonify({"error": "Song not found"}), 404
+    Karaoke.query.filter_by(catalog_song_id=id).update({"catalog_song_id": None}, synchronize_session=False)
+    db.session.delete(song)
+    db.session.commit()
+    song_catalog().invalidate()
+    return jsonify({"message": "Song removed from catalog"}), 200
+
+
+@karaoke_bp.route("/song-catalog/seed", methods=["POST"])
+def seed_song_catalog_route():
+    try:
+        return jsonify(seed_song_catalog()), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+# ============================
+#   Karaoke history & nightly compaction
+# ============================
+@event.listens_for(Karaoke.is_deleted, "set")
+def stamp_karaoke_deleted_at(target, value, oldvalue, initiator):
+    # When a singer left the queue; used for the nightly peak-queue figure
+    if value and target.deleted_at is None:
+        target.deleted_at = datetime.utcnow()
+    elif not value:
+        target.deleted_at = None
+
+
+class KaraokeHistory(DatetimeFormatMixin, db.Model):
+    """Append-only copy of finished signups; the live karaoke table only holds the current night."""
+    __tablename__ = "karaoke_history"
+
+    id = db.Column(db.Integer, primary_key=True)
+    original_id = db.Column(db.Integer, nullable=False)  # Karaoke.id before the move
+    session_id = db.Column(db.Integer, db.ForeignKey("show_session.id"), nullable=True)
+    show_date = db.Column(db.Date, nullable=False)
+    name = db.Column(db.String(25), nullable=False)
+    song = db.Column(db.String(200), nullable=False)
+    artist = db.Column(db.String(200), nullable=False)
+    position = db.Column(db.Integer, nullable=True)
+    adjustment = db.Column(db.Float, nullable=True)
+    is_flagged = db.Column(db.Boolean, default=False)
+    is_warning = db.Column(db.Boolean, default=False)
+    was_deleted = db.Column(db.Boolean, default=False)  # Sung or removed, vs. still queued at close
+    created_at = db.Column(db.DateTime)
+    deleted_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=db.func.now())
+    __datetime_formats__ = {"show_date": "date", "created_at": "iso", "deleted_at": "iso", "archived_at": "iso"}
+    __table_args__ = (
+        db.Index("ix_karaoke_history_show_date", "show_date", "session_id"),
+        db.Index("ix_karaoke_history_session", "session_id"),
+    )
+
+
+class KaraokeNightSummary(DatetimeFormatMixin, db.Model):
+    __tablename__ = "karaoke_night_summary"
+
+    id = db.Column(db.Integer, primary_key=True)
+    show_date = db.Column(db.Date, nullable=False, index=True)
+    session_id = db.Column(db.Integer, db.ForeignKey("show_session.id"), nullable=True, unique=True)
+    singers = db.Column(db.Integer, nullable=False, default=0)  # Distinct names
+    songs = db.Column(db.Integer, nullable=False, default=0)  # Signups
+    sung = db.Column(db.Integer, nullable=False, default=0)  # Signups that left the queue
+    peak_queue = db.Column(db.Integer, nullable=False, default=0)  # Most singers waiting at once
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __datetime_formats__ = {"show_date": "date", "updated_at": "iso"}
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "show_date": self.format_datetime("show_date"),
+            "session_id": self.session_id,
+            "singers": self.singers,
+            "songs": self.songs,
+            "sung": self.sung,
+            "peak_queue": self.peak_queue,
+            "updated_at": self.format_datetime("updated_at"),
+        }
+
+
+def karaoke_peak_queue(rows, night_end):
+    """Most signups waiting at once: +1 at created_at, -1 at deleted_at (night end when unknown)."""
+    events = []
+    for row in rows:
+        events.append((row.created_at or night_end, 1))
+        events.append((row.deleted_at or night_end, -1))
+    events.sort()  # At the same instant, leaving (-1) sorts before joining
+    peak = waiting = 0
+    for _, delta in events:
+        waiting += delta
+        peak = max(peak, waiting)
+    return peak
+
+
+def compact_karaoke_night(session_id, show_date, night_end, criteria):
+    """Move one night's rows into karaoke_history and fold them into its summary row."""
+    rows = Karaoke.query.filter(*criteria).order_by(Karaoke.position).all()
+    if not rows:
+        return 0
+
+    try:
+        db.session.execute(db.insert(KaraokeHistory), [
+            {
+                "original_id": row.id, "session_id": row.session_id, "show_date": show_date,
+                "name": row.name, "song": row.song, "artist": row.artist,
+                "position": row.position, "adjustment": row.adjustment,
+                "is_flagged": bool(row.is_flagged), "is_warning": bool(row.is_warning),
+                "was_deleted": bool(row.is_deleted), "created_at": row.created_at, "deleted_at": row.deleted_at,
+            }
+            for row in rows
+        ])
+        ids = [row.id for row in rows]
+        for start in range(0, len(ids), 500):
+            db.session.execute(db.delete(Karaoke).where(Karaoke.id.in_(ids[start:start + 500])))
+
+        summary = KaraokeNightSummary.query.filter_by(show_date=show_date, session_id=session_id).first()
+        if not summary:
+            summary = KaraokeNightSummary(show_date=show_date, session_id=session_id, singers=0, songs=0, sung=0, peak_queue=0)
+            db.session.add(summary)
+        summary.songs += len(rows)
+        summary.sung += sum(1 for row in rows if row.is_deleted)
+        summary.peak_queue = max(summary.peak_queue, karaoke_peak_queue(rows, night_end))
+        db.session.flush()
+        summary.singers = db.session.scalar(
+            db.select(func.count(func.distinct(func.lower(KaraokeHistory.name))))
+            .where(KaraokeHistory.show_date == show_date, session_scope(KaraokeHistory, session_id))
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    print(f"🗜️ Compacted {len(rows)} signups for {show_date} (session {session_id})")
+    return len(rows)
+
+
+def compact_karaoke_signups(now=None):
+    """
+    Nightly compaction: every signup of an ended show session, plus soft-deleted
+    signups made with no session running that are older than KARAOKE_COMPACT_AFTER_HOURS.
+    Returns the number of rows moved.
+    """
+    now = now or datetime.utcnow()
+    moved = 0
+
+    ended_sessions = db.session.execute(
+        db.select(ShowSession.id, ShowSession.started_at, ShowSession.ended_at).where(
+            ShowSession.ended_at.isnot(None),
+            ShowSession.id.in_(db.select(Karaoke.session_id).where(Karaoke.session_id.isnot(None)).distinct()),
+        )
+    ).all()
+    for session_id, started_at, ended_at in ended_sessions:
+        moved += compact_karaoke_night(session_id, started_at.date(), ended_at, [Karaoke.session_id == session_id])
+
+    cutoff = now - timedelta(hours=current_app.config['KARAOKE_COMPACT_AFTER_HOURS'])
+    legacy = [Karaoke.session_id.is_(None), Karaoke.is_deleted == True, Karaoke.created_at < cutoff]
+    show_dates = sorted({created.date() for created in db.session.scalars(db.select(Karaoke.created_at).where(*legacy))})
+    for show_date in show_dates:
+        day_start = datetime.combine(show_date, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+        moved += compact_karaoke_night(
+            None, show_date, min(day_end, cutoff), legacy + [Karaoke.created_at >= day_start, Karaoke.created_at < day_end]
+        )
+    return moved
+
+
+def rebuild_night_summaries(days):
+    """Recompute summary rows from karaoke_history for the last `days` days (repairs drift)."""
+    since = (datetime.utcnow() - timedelta(days=days)).date()
+    nights = {}
+    for row in KaraokeHistory.query.filter(KaraokeHistory.show_date >= since).all():
+        nights.setdefault((row.show_date, row.session_id), []).append(row)
+    session_ends = dict(
+        db.session.query(ShowSession.id, ShowSession.ended_at)
+        .filter(ShowSession.id.in_({session_id for _, session_id in nights if session_id is not None}))
+        .all()
+    )
+
+    for (show_date, session_id), rows in nights.items():
+        night_end = session_ends.get(session_id) or datetime.combine(show_date, datetime.min.time()) + timedelta(days=1)
+        summary = KaraokeNightSummary.query.filter_by(show_date=show_date, session_id=session_id).first()
+        if not summary:
+            summary = KaraokeNightSummary(show_date=show_date, session_id=session_id)
+            db.session.add(summary)
+        summary.songs = len(rows)
+        summary.sung = sum(1 for row in rows if row.was_deleted)
+        summary.singers = len({row.name.lower() for row in rows})
+        summary.peak_queue = karaoke_peak_queue(rows, night_end)
+    db.session.commit()
+    return len(nights)
+
+
+@click.command("compact-karaoke")
+@with_appcontext
+def compact_karaoke_command():
+    """Move finished karaoke nights into karaoke_history and summarise them."""
+    click.echo(f"Compacted {compact_karaoke_signups()} signups")
+
+
+@karaoke_bp.route("/karaoke/history", methods=["GET"])
+def get_karaoke_history():
+    """
+    Signups of compacted nights. Filter with ?session_id=N or ?date=YYYY-MM-DD (one is required).
+    """
+    criteria = []
+    if request.args.get("session_id", type=int) is not None:
+        criteria.append(KaraokeHistory.session_id == request.args.get("session_id", type=int))
+    if request.args.get("date"):
+        try:
+            criteria.append(KaraokeHistory.show_date == datetime.strptime(request.args["date"], "%Y-%m-%d").date())
+        except ValueError:
+            return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+    if not criteria:
+        return jsonify({"error": "Pass session_id or date"}), 400
+    return jsonify(select_rows(KaraokeHistory, *criteria, order_by=KaraokeHistory.position)), 200
+
+
+@karaoke_bp.route("/karaoke/nights", methods=["GET"])
+def get_karaoke_night_summaries():
+    """Per-night summary rows, newest first. Query param: limit (default 30)."""
+    limit = max(1, min(request.args.get("limit", 30, type=int), 365))
+    summaries = KaraokeNightSummary.query.order_by(KaraokeNightSummary.show_date.desc()).limit(limit).all()
+    return jsonify([summary.to_dict() for summary in summaries]), 200
+
+
+
+class FormState(DatetimeFormatMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    show_form = db.Column(db.Boolean, default=False)
+    last_updated = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())  
+    pin_code = db.Column(db.String(4), nullable=True)  # 4-digit PIN stored as a string
+    __datetime_formats__ = {"last_updated": "iso"}
+
+    def to_dict(self):
+        """Convert the FormState entry into a dictionary."""
+        return {
+            "id": self.id,
+            "show_form": self.show_form,
+            "last_updated": self.format_datetime("last_updated"),
+            "has_pin": self.pin_code is not None,  # The PIN itself is only served by /formstate/pin (admin)
+        }
+
+# ============================
+#   GET: Fetch form state
+# ============================
+@karaoke_bp.route("/formstate", methods=["GET"])
+@use_primary
+def get_form_state():
+    """Retrieve the current form state, creating a default entry if none exists."""
+    form_state = FormState.query.first()
+    
+    if not form_state:
+        form_state = FormState(show_form=False)
+        db.session.add(form_state)
+        db.session.commit()
+
+    return jsonify(form_state.to_dict()), 200
+
+# ============================
+#   POST: Set a New PIN
+# ============================
+@karaoke_bp.route("/formstate/set_pin", methods=["POST"])
+def set_pin():
+    data = request.get_json()
+    new_pin = data.get("pin_code")
+
+    if not new_pin or len(new_pin) != 4 or not new_pin.isdigit():
+        return jsonify({"error": "PIN must be a 4-digit number"}), 400
+
+    form_state = FormState.query.first()
+    if not form_state:
+        # 🚀 Default to opening signups when setting a new PIN
+        form_state = FormState(pin_code=new_pin, show_form=True)  
+        db.session.add(form_state)
+    else:
+        form_state.pin_code = new_pin
+        form_state.show_form = True  # 🚀 Ensure signups open when setting a PIN
+
+    db.session.commit()
+    signup_gate().update(form_state)
+    return jsonify({"message": "PIN set successfully, signups are now OPEN"}), 201
+
+# ============================
+#   PATCH: Update Existing PIN
+# ============================
+@karaoke_bp.route("/formstate/update_pin", methods=["PATCH"])
+def update_pin():
+    data = request.get_json()
+    new_pin = data.get("pin_code")
+
+    if not new_pin or len(new_pin) != 4 or not new_pin.isdigit():
+        return jsonify({"error": "PIN must be a 4-digit number"}), 400
+
+    form_state = FormState.query.first()
+    if not form_state:
+        return jsonify({"error": "No PIN found. Use POST to create one."}), 404
+
+    form_state.pin_code = new_pin
+    db.session.commit()
+    signup_gate().update(form_state)
+    
+    return jsonify({"message": "PIN updated successfully"}), 200
+
+# ============================
+#   DELETE: Remove PIN
+# ============================
+@karaoke_bp.route("/formstate/delete_pin", methods=["DELETE"])
+def delete_pin():
+    form_state = FormState.query.first()
+    if not form_state:
+        return jsonify({"error": "No PIN found"}), 404
+
+    form_state.pin_code = None
+    form_state.show_form = False  # 👈 Hides form when PIN is deleted
+    db.session.commit()
+    signup_gate().update(form_state)
+
+    return jsonify({"message": "PIN deleted successfully"}), 200
+
+
+# ============================
+#   Signup gate
+# ============================
+class SignupGate:
+    """
+    Cached (show_form, pin_code) so karaokesignup() can turn away closed-form
+    and wrong-PIN requests without touching the database. Local PIN changes
+    update it directly; other workers' changes show up within max_age seconds.
+    """
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.state = None
+        self.loaded_at = 0.0
+
+    def current(self):
+        with self.lock:
+            hit = self.state is not None and time.monotonic() - self.loaded_at < self.max_age
+            record_cache_lookup("signup_gate", hit)
+            if not hit:
+                form_state = FormState.query.first()
+                self._store(form_state)
+            return self.state
+
+    def _store(self, form_state):
+        self.state = (bool(form_state and form_state.show_form), form_state.pin_code if form_state else None)
+        self.loaded_at = time.monotonic()
+
+    def update(self, form_state):
+        """Apply a committed FormState change."""
+        with self.lock:
+            self._store(form_state)
+
+    def invalidate(self):
+        with self.lock:
+            self.state = None
+
+    def check(self, pin_code):
+        """None if a signup may proceed, else the reason it may not."""
+        show_form, expected = self.current()
+        if not show_form:
+            return "Signups are closed"
+        # Compare every time, in constant time, so response timing says nothing about the PIN
+        matches = hmac.compare_digest(str(pin_code if pin_code is not None else "").encode(), (expected or "").encode())
+        if expected and not matches:
+            return "Invalid PIN"
+        return None
+
+
+def signup_gate():
+    return current_app.extensions["signup_gate"]
+
+
+@karaoke_bp.route("/formstate/pin", methods=["GET"])
+def get_form_pin():
+    """The PIN itself, for the host's screen; /formstate only says whether one is set."""
+    form_state = FormState.query.first()
+    return jsonify({"pin_code": form_state.pin_code if form_state else None}), 200
+
+class DJNotes(DatetimeFormatMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    alert_type = db.Column(db.String(50), nullable=False)  # Type of alert
+    alert_details = db.Column(db.Text, nullable=False)  # Description/details of the alert
+    created_at = db.Column(db.DateTime, default=db.func.now())  # Timestamp when alert is created
+    is_active = db.Column(db.Boolean, default=True)  # Allows soft deletion or hiding alerts
+    position = db.Column(db.Integer, nullable=False, default=0)  # NEW: Position for sorting
+    session_id = db.Column(db.Integer, db.ForeignKey("show_session.id"), nullable=True)  # Show night
+    __datetime_formats__ = {"created_at": "iso"}
+    __table_args__ = (db.Index("ix_djnotes_session_active", "session_id", "is_active", "position"),)
+
+    def to_dict(self):
+        """Convert DJ Notes entry into a dictionary."""
+        return {
+            "id": self.id,
+            "alert_type": self.alert_type,
+            "alert_details": self.alert_details,
+            "created_at": self.format_datetime("created_at"),
+            "is_active": self.is_active,
+            "position": self.position,  # Include position in response
+            "session_id": self.session_id,
+        }
+@karaoke_bp.route("/djnotes", methods=["POST"])
+def create_dj_note():
+    data = request.get_json()
+
+    # Validate required fields
+    if not data or "alert_type" not in data or "alert_details" not in data:
+        return jsonify({"error": "Missing required fields"}), 400
+
+    # Create new DJ Note
+    new_note = DJNotes(
+        alert_type=data["alert_type"],
+        alert_details=data["alert_details"],
+        session_id=current_show_session_id(),
+    )
+
+    db.session.add(new_note)
+    db.session.commit()
+
+    return jsonify(new_note.to_dict()), 201
+
+@karaoke_bp.route("/djnotes/<int:id>", methods=["PATCH"])
 def update_dj_note(id):
     data = request.get_json()
 
@@ -1976,26 +4902,30 @@ def update_dj_note(id):
     
     return jsonify(note.to_dict()), 200
 
-@app.route("/djnotesactive", methods=["GET"])
+@karaoke_bp.route("/djnotesactive", methods=["GET"])
 def get_all_dj_notes():
-    notes = DJNotes.query.filter_by(is_active=True).order_by(DJNotes.position).all()
+    notes = DJNotes.query.filter(
+        session_scope(DJNotes, requested_show_session_id()), DJNotes.is_active == True
+    ).order_by(DJNotes.position).all()
     return jsonify([note.to_dict() for note in notes]), 200
 
 
-@app.route("/djnotes/deleted", methods=["GET"])
+@karaoke_bp.route("/djnotes/deleted", methods=["GET"])
 def get_deleted_dj_notes():
-    deleted_notes = DJNotes.query.filter_by(is_active=False).order_by(DJNotes.created_at.desc()).all()
+    deleted_notes = DJNotes.query.filter(
+        session_scope(DJNotes, requested_show_session_id()), DJNotes.is_active == False
+    ).order_by(DJNotes.created_at.desc()).all()
     return jsonify([note.to_dict() for note in deleted_notes]), 200
 
 
-@app.route("/djnotesactive/<int:id>", methods=["GET"])
+@karaoke_bp.route("/djnotesactive/<int:id>", methods=["GET"])
 def get_dj_note(id):
     note = DJNotes.query.get(id)
     if not note:
         return jsonify({"error": "DJ Note not found"}), 404
     return jsonify(note.to_dict()), 200
 
-@app.route("/djnotes/<int:id>", methods=["DELETE"])
+@karaoke_bp.route("/djnotes/<int:id>", methods=["DELETE"])
 def soft_delete_dj_note(id):
     note = DJNotes.query.get(id)
     if not note:
@@ -2006,7 +4936,7 @@ def soft_delete_dj_note(id):
 
     return jsonify({"message": f"DJ Note {id} has been soft deleted"}), 200
 
-@app.route("/djnotes/<int:id>/hard_delete", methods=["DELETE"])
+@karaoke_bp.route("/djnotes/<int:id>/hard_delete", methods=["DELETE"])
 def hard_delete_dj_note(id):
     note = DJNotes.query.get(id)
     if not note:
@@ -2017,29 +4947,29 @@ def hard_delete_dj_note(id):
 
     return jsonify({"message": f"DJ Note {id} has been permanently deleted"}), 200
 
-@app.route("/djnotes/hard_delete_all", methods=["DELETE"])
+@karaoke_bp.route("/djnotes/hard_delete_all", methods=["DELETE"])
 def hard_delete_all_dj_notes():
     """Permanently delete all DJ Notes from the database."""
     try:
-        num_deleted = DJNotes.query.delete()
-        db.session.commit()
-        return jsonify({"message": f"Successfully deleted {num_deleted} DJ Notes permanently."}), 200
+        return bulk_delete(
+            "dj_notes", "Successfully deleted {deleted} DJ Notes permanently.", session_id=requested_show_session_id()
+        )
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Failed to delete DJ Notes: {str(e)}"}), 500
-@app.route("/karaokesignup/hard_delete", methods=["DELETE"])
+@karaoke_bp.route("/karaokesignup/hard_delete", methods=["DELETE"])
 def hard_delete_soft_deleted_karaoke_signups():
     """Permanently deletes only the signups that have been soft deleted"""
     try:
         # Delete entries where `is_deleted` is True
-        num_deleted = Karaoke.query.filter_by(is_deleted=True).delete()
-        db.session.commit()
-
-        return jsonify({"message": f"Permanently deleted {num_deleted} soft-deleted signups"}), 200
+        return bulk_delete(
+            "karaoke_soft_deleted", "Permanently deleted {deleted} soft-deleted signups",
+            session_id=requested_show_session_id(),
+        )
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
-@app.route("/djnotes/reorder", methods=["PATCH"])
+@karaoke_bp.route("/djnotes/reorder", methods=["PATCH"])
 def reorder_dj_notes():
     """Move a specific alert to the top by updating its position."""
     try:
@@ -2051,10 +4981,11 @@ def reorder_dj_notes():
         if not note:
             return jsonify({"error": "DJ Note not found"}), 404
 
-        # Find the current alert at position 0
-        current_top_note = DJNotes.query.filter_by(position=0).first()
+        # Find the current alert at position 0 in the same show session
+        scope = session_scope(DJNotes, note.session_id)
+        current_top_note = DJNotes.query.filter(scope, DJNotes.position == 0).first()
         if current_top_note and current_top_note.id != note.id:
-            current_top_note.position = db.session.query(db.func.max(DJNotes.position)).scalar() + 1  # Move it down
+            current_top_note.position = db.session.query(db.func.max(DJNotes.position)).filter(scope).scalar() + 1  # Move it down
 
         # Move selected alert to position 0
         note.position = 0
@@ -2075,7 +5006,7 @@ def reorder_dj_notes():
 
 
 
-class Promotions(db.Model):
+class Promotions(DatetimeFormatMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     event_type = db.Column(db.String(50), nullable=False)  # "performance" or "karaoke"
     event_date = db.Column(db.DateTime, nullable=False)  # Date and time of event
@@ -2083,22 +5014,24 @@ class Promotions(db.Model):
     image_url = db.Column(db.String(500), nullable=True)  # Optional: Photo reference
     description = db.Column(db.Text, nullable=False)  # Brief event description
     created_at = db.Column(db.DateTime, default=db.func.now())  # Timestamp when added
+    __datetime_formats__ = {"event_date": "iso", "created_at": "iso"}
+    __table_args__ = (db.Index("ix_promotions_event_date", "event_date"),)
 
     def to_dict(self):
         """Convert the Promotions entry into a dictionary."""
         data = {
             "id": self.id,
             "event_type": self.event_type,
-            "event_date": self.event_date.isoformat() if self.event_date else None,
+            "event_date": self.format_datetime("event_date"),
             "location": self.location,
             "image_url": self.image_url,
             "description": self.description,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "created_at": self.format_datetime("created_at"),
         }
         print("Serialized Data Sent to Frontend:", data)  # ✅ Debugging log
         return data
 
-@app.route("/promotions", methods=["POST"])  # 🎯 Add "POST" explicitly!
+@public_bp.route("/promotions", methods=["POST"])  # 🎯 Add "POST" explicitly!
 def create_promotion():
     """Create a new promotion"""
     data = request.get_json()
@@ -2117,13 +5050,14 @@ def create_promotion():
         )
         db.session.add(new_promotion)
         db.session.commit()
+        invalidate_promotions_feed()
 
         return jsonify(new_promotion.to_dict()), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Database error: {str(e)}"}), 500
     
-@app.route("/promotions/<int:id>", methods=["PATCH"])
+@public_bp.route("/promotions/<int:id>", methods=["PATCH"])
 def update_promotion(id):
     """Update a promotion"""
     data = request.get_json()
@@ -2145,12 +5079,13 @@ def update_promotion(id):
             promotion.description = data["description"]
 
         db.session.commit()
+        invalidate_promotions_feed()
         return jsonify(promotion.to_dict()), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
-@app.route("/promotions", methods=["GET"])
+@public_bp.route("/promotions", methods=["GET"])
 def get_all_promotions():
     """Retrieve all promotions"""
     try:
@@ -2159,7 +5094,7 @@ def get_all_promotions():
     except Exception as e:
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
-@app.route("/promotions/<int:id>", methods=["GET"])
+@public_bp.route("/promotions/<int:id>", methods=["GET"])
 def get_promotion(id):
     """Retrieve a specific promotion by ID"""
     promotion = Promotions.query.get(id)
@@ -2168,7 +5103,7 @@ def get_promotion(id):
         return jsonify({"error": "Promotion not found"}), 404
     
     return jsonify(promotion.to_dict()), 200
-@app.route("/promotions/<int:id>", methods=["DELETE"])
+@public_bp.route("/promotions/<int:id>", methods=["DELETE"])
 def delete_promotion(id):
     """Delete a specific promotion by ID"""
     promotion = Promotions.query.get(id)
@@ -2179,49 +5114,224 @@ def delete_promotion(id):
     try:
         db.session.delete(promotion)
         db.session.commit()
+        invalidate_promotions_feed()
         return jsonify({"message": f"Promotion {id} deleted successfully"}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
-@app.route("/promotions", methods=["DELETE"])
+@public_bp.route("/promotions", methods=["DELETE"])
 def delete_all_promotions():
     """Delete ALL promotions (Hard Delete)"""
     try:
         num_deleted = db.session.query(Promotions).delete()
         db.session.commit()
+        invalidate_promotions_feed()
         return jsonify({"message": f"Deleted {num_deleted} promotions successfully"}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
-@app.route("/karaokesignup/all", methods=["GET"])
+# ============================
+#   Promotions upcoming, archive & calendar feed
+# ============================
+@public_bp.route("/promotions/upcoming", methods=["GET"])
+def get_upcoming_promotions():
+    """
+    Upcoming promotions for the public events widget.
+    Query params: days (window, default 60), limit (default 5), event_type (optional).
+    """
+    try:
+        days = max(0, min(int(request.args.get("days", 60)), 366))
+        limit = max(1, min(int(request.args.get("limit", 5)), 50))
+    except ValueError:
+        return jsonify({"error": "days and limit must be integers"}), 400
+
+    start = datetime.utcnow() - timedelta(hours=current_app.config['PROMOTIONS_GRACE_HOURS'])
+    criteria = [Promotions.event_date >= start, Promotions.event_date < start + timedelta(days=days)]
+    if request.args.get("event_type"):
+        criteria.append(Promotions.event_type == request.args["event_type"])
+    return jsonify(select_rows(Promotions, *criteria, order_by=Promotions.event_date, limit=limit)), 200
+
+
+@public_bp.route("/promotions/calendar.ics", methods=["GET"])
+def get_promotions_calendar():
+    """
+    iCalendar feed of upcoming promotions, served from an in-process cache.
+    """
+    body, etag = promotions_feed()
+    response = Response(body, mimetype="text/calendar")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = int(current_app.config['PROMOTIONS_FEED_MAX_AGE'])
+    return response.make_conditional(request)
+
+
+@public_bp.route("/promotions/archive", methods=["GET"])
+def get_archived_promotions():
+    """Archived (past) promotions, newest first. Query param: limit (default 50)."""
+    try:
+        limit = max(1, min(int(request.args.get("limit", 50)), 500))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    archived = PromotionArchive.query.order_by(PromotionArchive.event_date.desc()).limit(limit).all()
+    return jsonify([promo.to_dict() for promo in archived]), 200
+
+
+class PromotionArchive(DatetimeFormatMixin, db.Model):
+    """Past promotions, moved out of the live table by archive_past_promotions()."""
+    __tablename__ = "promotions_archive"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Same id as in promotions
+    event_type = db.Column(db.String(50), nullable=False)
+    event_date = db.Column(db.DateTime, nullable=False, index=True)
+    location = db.Column(db.String(255), nullable=False)
+    image_url = db.Column(db.String(500), nullable=True)
+    description = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=db.func.now())
+    __datetime_formats__ = {"event_date": "iso", "created_at": "iso", "archived_at": "iso"}
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "event_type": self.event_type,
+            "event_date": self.format_datetime("event_date"),
+            "location": self.location,
+            "image_url": self.image_url,
+            "description": self.description,
+            "created_at": self.format_datetime("created_at"),
+            "archived_at": self.format_datetime("archived_at"),
+        }
+
+
+def archive_past_promotions(before=None):
+    """Move promotions dated before `before` into promotions_archive. Returns how many moved."""
+    if before is None:
+        before = datetime.utcnow() - timedelta(hours=current_app.config['PROMOTIONS_ARCHIVE_AFTER_HOURS'])
+    ids = db.session.scalars(db.select(Promotions.id).where(Promotions.event_date < before)).all()
+    if not ids:
+        return 0
+
+    keys = [column.key for column in Promotions.__table__.columns]
+    try:
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            db.session.execute(
+                db.insert(PromotionArchive).from_select(
+                    keys, db.select(*[getattr(Promotions, key) for key in keys]).where(Promotions.id.in_(chunk))
+                )
+            )
+            db.session.execute(db.delete(Promotions).where(Promotions.id.in_(chunk)))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    invalidate_promotions_feed()
+    print(f"🗄️ Archived {len(ids)} past promotions")
+    return len(ids)
+
+
+@click.command("archive-promotions")
+@with_appcontext
+def archive_promotions_command():
+    """Move past promotions into the archive table."""
+    click.echo(f"Archived {archive_past_promotions()} promotions")
+
+
+def ics_escape(text):
+    return (text or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\r", "").replace("\n", "\\n")
+
+
+def ics_fold(line):
+    """Fold a content line at 75 octets (RFC 5545 3.1) without splitting UTF-8 characters."""
+    parts, current, size = [], "", 0
+    for ch in line:
+        width = len(ch.encode("utf-8"))
+        if size + width > (75 if not parts else 74):
+            parts.append(current)
+            current, size = "", 0
+        current += ch
+        size += width
+    parts.append(current)
+    return "\r\n ".join(parts)
+
+
+def build_promotions_calendar(promotions, host):
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    duration = current_app.config['PROMOTIONS_EVENT_HOURS']
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//PortfolioBackend//Promotions//EN",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{ics_escape(current_app.config['PROMOTIONS_FEED_NAME'])}",
+    ]
+    for promo in promotions:
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:promotion-{promo.id}@{host}",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{promo.event_date:%Y%m%dT%H%M%S}",  # Floating local time, as entered
+            f"DURATION:PT{duration}H",
+            f"SUMMARY:{ics_escape(f'{promo.event_type.title()} at {promo.location}')}",
+            f"LOCATION:{ics_escape(promo.location)}",
+            f"DESCRIPTION:{ics_escape(promo.description)}",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(ics_fold(line) for line in lines) + "\r\n"
+
+
+def promotions_feed():
+    """(body, etag) of the iCalendar feed; rebuilt after writes or PROMOTIONS_FEED_MAX_AGE seconds."""
+    state = current_app.extensions["promotions_feed"]
+    with state["lock"]:
+        hit = state["body"] is not None and time.monotonic() - state["built_at"] < current_app.config['PROMOTIONS_FEED_MAX_AGE']
+        record_cache_lookup("promotions_feed", hit)
+        if not hit:
+            start = datetime.utcnow() - timedelta(hours=current_app.config['PROMOTIONS_GRACE_HOURS'])
+            promotions = Promotions.query.filter(Promotions.event_date >= start).order_by(
+                Promotions.event_date
+            ).limit(current_app.config['PROMOTIONS_FEED_LIMIT']).all()
+            state["body"] = build_promotions_calendar(promotions, request.host)
+            state["etag"] = hashlib.sha256(state["body"].encode("utf-8")).hexdigest()[:32]
+            state["built_at"] = time.monotonic()
+        return state["body"], state["etag"]
+
+
+def invalidate_promotions_feed():
+    current_app.extensions["promotions_feed"]["body"] = None
+
+
+@karaoke_bp.route("/karaokesignup/all", methods=["GET"])
 def get_all_signups():
     """Retrieve all karaoke signups, including soft-deleted ones"""
     try:
-        signups = Karaoke.query.all()  # ✅ Fetch everything, including soft-deleted
-        return jsonify([signup.to_dict() for signup in signups]), 200
+        return jsonify(select_rows(Karaoke)), 200  # ✅ Fetch everything, including soft-deleted
     except Exception as e:
         return jsonify({"error": f"Database error: {str(e)}"}), 500
 
 
 
 
-class MusicBreakState(db.Model):
+class MusicBreakState(DatetimeFormatMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     show_alert = db.Column(db.Boolean, default=False)
     last_updated = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+    __datetime_formats__ = {"last_updated": "iso"}
 
     def to_dict(self):
         """Convert the MusicBreakState entry into a dictionary."""
         return {
             "id": self.id,
             "show_alert": self.show_alert,
-            "last_updated": self.last_updated.isoformat() if self.last_updated else None,
+            "last_updated": self.format_datetime("last_updated"),
         }
 
 
-@app.route("/music-break", methods=["GET"])
+@karaoke_bp.route("/music-break", methods=["GET"])
+@use_primary
 def get_music_break_state():
     state = MusicBreakState.query.first()
     if not state:
@@ -2232,7 +5342,7 @@ def get_music_break_state():
     
     return jsonify(state.to_dict()), 200
 
-@app.route("/music-break", methods=["PATCH"])
+@karaoke_bp.route("/music-break", methods=["PATCH"])
 def toggle_music_break():
     state = MusicBreakState.query.first()
     if not state:
@@ -2244,6 +5354,7 @@ def toggle_music_break():
         state.show_alert = data["show_alert"]  # Toggle based on request body
         state.last_updated = datetime.utcnow()
         db.session.commit()
+        wait_estimator().set_music_break(state.last_updated if state.show_alert else None)
         return jsonify(state.to_dict()), 200
 
     return jsonify({"error": "Invalid request"}), 400
@@ -2260,7 +5371,8 @@ class KaraokeSettings(db.Model):
             "max_songs_per_singer": self.max_songs_per_singer
         }
 
-@app.route("/karaokesettings", methods=["GET"])
+@karaoke_bp.route("/karaokesettings", methods=["GET"])
+@use_primary
 def get_karaoke_settings():
     settings = KaraokeSettings.query.first()
     if not settings:
@@ -2269,7 +5381,7 @@ def get_karaoke_settings():
         db.session.commit()
     return jsonify(settings.to_dict()), 200
 
-@app.route("/karaokesettings", methods=["PATCH"])
+@karaoke_bp.route("/karaokesettings", methods=["PATCH"])
 def update_karaoke_settings():
     data = request.get_json()
     settings = KaraokeSettings.query.first()
@@ -2284,52 +5396,132 @@ def update_karaoke_settings():
 
 
 
-class InstagramPosts(db.Model):
+class InstagramPosts(DatetimeFormatMixin, db.Model):
+    # Legacy comma-separated blob; migrate_instagram_post_blob() moves it into InstagramPost rows
     id = db.Column(db.Integer, primary_key=True)
     post_urls = db.Column(db.Text, nullable=True)  # Comma-separated string
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __datetime_formats__ = {"updated_at": "datetime"}
 
     def to_dict(self):
         return {
             "id": self.id,
             "post_urls": self.post_urls,
-            "updated_at": self.updated_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "updated_at": self.format_datetime("updated_at"),
         }
 
-@app.route("/instagram-posts", methods=["GET"])
+
+# Positions are spaced out so a move or insert usually rewrites just one row
+INSTAGRAM_POSITION_GAP = 1024
+
+
+class InstagramPost(DatetimeFormatMixin, db.Model):
+    __tablename__ = "instagram_post"
+
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(500), unique=True, nullable=False)
+    position = db.Column(db.Integer, nullable=False, index=True)  # Sort key, ties broken by id
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __datetime_formats__ = {"created_at": "datetime", "updated_at": "datetime"}
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "url": self.url,
+            "position": self.position,
+            "created_at": self.format_datetime("created_at"),
+        }
+
+
+def ordered_instagram_posts():
+    return InstagramPost.query.order_by(InstagramPost.position, InstagramPost.id).all()
+
+
+def instagram_posts_payload(posts=None):
+    """Collection response; post_urls keeps the old comma-separated shape for existing clients."""
+    posts = ordered_instagram_posts() if posts is None else posts
+    updated_at = max((post.updated_at for post in posts if post.updated_at), default=None)
+    return {
+        "post_urls": ",".join(post.url for post in posts),
+        "posts": [post.to_dict() for post in posts],
+        "updated_at": DATETIME_FORMATTERS["datetime"](updated_at) if updated_at else None,
+    }
+
+
+def place_instagram_post(post, index, others):
+    """Give post a position so it lands at index among others (already ordered, post excluded)."""
+    index = max(0, min(index, len(others)))
+    before = others[index - 1].position if index > 0 else None
+    after = others[index].position if index < len(others) else None
+
+    if before is None and after is None:
+        post.position = INSTAGRAM_POSITION_GAP
+    elif after is None:
+        post.position = before + INSTAGRAM_POSITION_GAP
+    elif before is None:
+        post.position = after - INSTAGRAM_POSITION_GAP
+    elif after - before > 1:
+        post.position = (before + after) // 2
+    else:
+        # No room left between neighbours: respace the whole list once
+        ordered = others[:index] + [post] + others[index:]
+        for i, item in enumerate(ordered, start=1):
+            if item.position != i * INSTAGRAM_POSITION_GAP:
+                item.position = i * INSTAGRAM_POSITION_GAP
+
+
+def parse_instagram_urls(value):
+    urls = value.split(",") if isinstance(value, str) else (value or [])
+    seen = []
+    for url in (str(url).strip() for url in urls):
+        if url and url not in seen:
+            seen.append(url)
+    return seen
+
+
+@public_bp.route("/instagram-posts", methods=["GET"])
 def get_instagram_posts():
-    posts = InstagramPosts.query.first()
-    if not posts:
-        posts = InstagramPosts(post_urls="")
-        db.session.add(posts)
-        db.session.commit()
-    return jsonify(posts.to_dict()), 200
+    return jsonify(instagram_posts_payload()), 200
+
 
-@app.route("/instagram-posts", methods=["PATCH"])
+@public_bp.route("/instagram-posts", methods=["PATCH"])
 def update_instagram_posts():
-    data = request.get_json()
-    post_urls = data.get("post_urls", "")
-    posts = InstagramPosts.query.first()
-    if not posts:
-        posts = InstagramPosts(post_urls=post_urls)
-        db.session.add(posts)
-    else:
-        posts.post_urls = post_urls
-    db.session.commit()
-    return jsonify(posts.to_dict()), 200
+    """
+    Replace the whole list. Only rows that were added, removed or moved are written.
+    """
+    data = request.get_json() or {}
+    urls = parse_instagram_urls(data.get("post_urls", ""))
+    try:
+        existing = {post.url: post for post in InstagramPost.query.all()}
+        for url in set(existing) - set(urls):
+            db.session.delete(existing.pop(url))
+        for i, url in enumerate(urls, start=1):
+            post = existing.get(url)
+            if not post:
+                db.session.add(InstagramPost(url=url, position=i * INSTAGRAM_POSITION_GAP))
+            elif post.position != i * INSTAGRAM_POSITION_GAP:
+                post.position = i * INSTAGRAM_POSITION_GAP
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "Instagram posts changed concurrently, retry"}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    return jsonify(instagram_posts_payload()), 200
 
-@app.route("/instagram-posts", methods=["DELETE"])
-def delete_instagram_posts():
-    posts = InstagramPosts.query.first()
-    if not posts:
-        return jsonify({"message": "No Instagram post data to delete."}), 200
 
-    db.session.delete(posts)
+@public_bp.route("/instagram-posts", methods=["DELETE"])
+def delete_instagram_posts():
+    deleted = InstagramPost.query.delete()
     db.session.commit()
+    if not deleted:
+        return jsonify({"message": "No Instagram post data to delete."}), 200
     return jsonify({"message": "Instagram post URLs deleted successfully."}), 200
 
 
-@app.route("/instagram-posts/delete-one", methods=["PATCH"])
+@public_bp.route("/instagram-posts/delete-one", methods=["PATCH"])
 def delete_single_instagram_post():
     data = request.get_json()
     url_to_delete = data.get("url")
@@ -2337,36 +5529,127 @@ def delete_single_instagram_post():
     if not url_to_delete:
         return jsonify({"error": "Missing URL to delete"}), 400
 
-    posts = InstagramPosts.query.first()
-    if not posts or not posts.post_urls:
-        return jsonify({"message": "No posts available"}), 200
+    InstagramPost.query.filter_by(url=url_to_delete.strip()).delete()
+    db.session.commit()
+    return jsonify({"message": "Post URL deleted successfully", "post_urls": instagram_posts_payload()["post_urls"]}), 200
+
+
+@public_bp.route("/instagram-posts/items", methods=["POST"])
+def add_instagram_post():
+    """
+    Add one URL. Optional "index" inserts it at that position, otherwise it goes last.
+    """
+    data = request.get_json() or {}
+    url = str(data.get("url") or "").strip()
+    if not url:
+        return jsonify({"error": "Missing URL"}), 400
+    if len(url) > 500:
+        return jsonify({"error": "URL is too long"}), 400
+
+    try:
+        others = ordered_instagram_posts()
+        post = InstagramPost(url=url)
+        place_instagram_post(post, int(data.get("index", len(others))), others)
+        db.session.add(post)
+        db.session.commit()
+    except (TypeError, ValueError):
+        db.session.rollback()
+        return jsonify({"error": "index must be an integer"}), 400
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "That URL is already in the list"}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    return jsonify(post.to_dict()), 201
 
-    # Remove matching URL
-    urls = [url.strip() for url in posts.post_urls.split(",") if url.strip() != url_to_delete]
-    posts.post_urls = ",".join(urls)
 
+@public_bp.route("/instagram-posts/items/<int:id>", methods=["DELETE"])
+def remove_instagram_post(id):
+    post = db.session.get(InstagramPost, id)
+    if not post:
+        return jsonify({"error": "Post not found"}), 404
+
+    db.session.delete(post)
     db.session.commit()
-    return jsonify({"message": "Post URL deleted successfully", "post_urls": posts.post_urls}), 200
+    return jsonify({"message": "Post URL deleted successfully"}), 200
+
+
+@public_bp.route("/instagram-posts/items/<int:id>/move", methods=["PATCH"])
+def move_instagram_post(id):
+    """
+    Move one URL to "index" (0-based) in the current order.
+    """
+    data = request.get_json() or {}
+    post = db.session.get(InstagramPost, id)
+    if not post:
+        return jsonify({"error": "Post not found"}), 404
+    try:
+        index = int(data["index"])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "index must be an integer"}), 400
+
+    try:
+        others = [other for other in ordered_instagram_posts() if other.id != post.id]
+        place_instagram_post(post, index, others)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    return jsonify(instagram_posts_payload()), 200
+
+
+def migrate_instagram_post_blob():
+    """Copy URLs from the legacy comma-separated blob into instagram_post rows. Safe to re-run."""
+    legacy_rows = InstagramPosts.query.filter(
+        InstagramPosts.post_urls.isnot(None), InstagramPosts.post_urls != ""
+    ).all()
+    if not legacy_rows:
+        return 0
+
+    posts = ordered_instagram_posts()
+    known = {post.url for post in posts}
+    position = posts[-1].position if posts else 0
+    added = 0
+    for legacy in legacy_rows:
+        for url in parse_instagram_urls(legacy.post_urls):
+            if url in known:
+                continue
+            position += INSTAGRAM_POSITION_GAP
+            db.session.add(InstagramPost(url=url, position=position))
+            known.add(url)
+            added += 1
+        legacy.post_urls = ""  # Emptied so a later boot cannot resurrect deleted URLs
+    db.session.commit()
+    return added
+
+
+@click.command("migrate-instagram-posts")
+@with_appcontext
+def migrate_instagram_posts_command():
+    """Convert the legacy InstagramPosts.post_urls blob into ordered instagram_post rows."""
+    click.echo(f"Migrated {migrate_instagram_post_blob()} Instagram post URLs")
 
 
-class PhotoSliderImage(db.Model):
+class PhotoSliderImage(DatetimeFormatMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     image_url = db.Column(db.String(500), nullable=False)
     created_at = db.Column(db.DateTime, default=db.func.now())
+    __datetime_formats__ = {"created_at": "iso"}
 
     def to_dict(self):
         return {
             "id": self.id,
             "image_url": self.image_url,
-            "created_at": self.created_at.isoformat()
+            "created_at": self.format_datetime("created_at")
         }
 
-@app.route("/slider-images/public", methods=["GET"])
+@public_bp.route("/slider-images/public", methods=["GET"])
 def get_slider_images_public():
     images = PhotoSliderImage.query.order_by(PhotoSliderImage.created_at.desc()).all()
-    return jsonify([img.to_dict() for img in images]), 200
+    return jsonify(attach_media([img.to_dict() for img in images], "slider")), 200
 
-@app.route("/slider-images", methods=["POST"])
+@public_bp.route("/slider-images", methods=["POST"])
 def add_slider_image():
     data = request.get_json()
     image_url = data.get("image_url")
@@ -2380,21 +5663,883 @@ def add_slider_image():
     return jsonify(new_image.to_dict()), 201
 
 
-@app.route("/slider-images/<int:id>", methods=["DELETE"])
+@public_bp.route("/slider-images/<int:id>", methods=["DELETE"])
 def delete_slider_image(id):
     image = PhotoSliderImage.query.get(id)
     if not image:
         return jsonify({"error": "Image not found"}), 404
 
-    db.session.delete(image)
-    db.session.commit()
+    try:
+        media_files = delete_media_for("slider", image.id)
+        db.session.delete(image)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+    remove_media_files(media_files)
     return jsonify({"message": "Image deleted"}), 200
 
 
 
 
+# ============================
+#   Media pipeline
+# ============================
+# Uploaded originals are stored under MEDIA_ROOT with content-hashed names, so every
+# file (and every resized variant) is immutable and can be cached forever.
+MEDIA_FORMATS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+MEDIA_VARIANT_WIDTHS = (320, 640, 1280, 1920)
+MEDIA_CACHE_SECONDS = 365 * 24 * 3600
+BLURHASH_CHARACTERS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+class MediaAsset(DatetimeFormatMixin, db.Model):
+    __tablename__ = "media_asset"
+
+    id = db.Column(db.Integer, primary_key=True)
+    owner_type = db.Column(db.String(20), nullable=False)  # "gallery" or "slider"
+    owner_id = db.Column(db.Integer, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False, index=True)  # sha256 of the original bytes
+    original_name = db.Column(db.String(255), nullable=False)  # File name under MEDIA_ROOT
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    placeholder = db.Column(db.String(64), nullable=True)  # BlurHash, decoded client-side
+    variants = db.Column(db.Text, nullable=True)  # JSON: {"640": {"webp": name, "jpg": name}, ...}
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending, ready, failed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __datetime_formats__ = {"created_at": "datetime"}
+    __table_args__ = (db.Index("ix_media_asset_owner", "owner_type", "owner_id"),)
+
+    def to_dict(self):
+        return media_asset_dict(self)
+
+
+def media_url(name):
+    base_url = current_app.config['MEDIA_BASE_URL'] or request.host_url.rstrip("/") + "/media"
+    return f"{base_url}/{name}"
+
+
+def media_asset_dict(asset):
+    """Serialize a MediaAsset instance or a Core row with the same column names."""
+    variants = json.loads(asset.variants) if asset.variants else {}
+    return {
+        "original_url": media_url(asset.original_name),
+        "width": asset.width,
+        "height": asset.height,
+        "placeholder": asset.placeholder,
+        "variants": {
+            width: {ext: media_url(name) for ext, name in files.items()}
+            for width, files in variants.items()
+        },
+        "status": asset.status,
+    }
+
+
+def media_assets_for(owner_type, owner_ids):
+    """One column-only query for the assets of the given owners, keyed by owner id."""
+    if not owner_ids:
+        return {}
+    rows = db.session.execute(
+        db.select(
+            MediaAsset.owner_id, MediaAsset.original_name, MediaAsset.width, MediaAsset.height,
+            MediaAsset.placeholder, MediaAsset.variants, MediaAsset.status,
+        ).where(MediaAsset.owner_type == owner_type, MediaAsset.owner_id.in_(owner_ids))
+    )
+    return {row.owner_id: media_asset_dict(row) for row in rows}
+
+
+def attach_media(items, owner_type):
+    assets = media_assets_for(owner_type, {item["id"] for item in items})
+    for item in items:
+        item["image"] = assets.get(item["id"])
+    return items
+
+
+def store_original(data):
+    """Validate uploaded bytes and write them under their content hash. Returns (hash, name, width, height)."""
+    if Image is None:
+        raise RuntimeError("Image uploads require Pillow")
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format = image.format
+            width, height = image.size
+            if image.getexif().get(0x0112) in (5, 6, 7, 8):  # EXIF orientation rotated by 90 degrees
+                width, height = height, width
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise ValueError("File is not a readable image")
+    if image_format not in MEDIA_FORMATS:
+        raise ValueError(f"Unsupported image format. Allowed: {', '.join(MEDIA_FORMATS)}")
+
+    content_hash = hashlib.sha256(data).hexdigest()
+    name = f"{content_hash[:16]}.{MEDIA_FORMATS[image_format]}"
+    path = os.path.join(current_app.config['MEDIA_ROOT'], name)
+    if not os.path.exists(path):
+        os.makedirs(current_app.config['MEDIA_ROOT'], exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return content_hash, name, width, height
+
+
+def create_media_asset(owner_type, owner_id, content_hash, name, width, height):
+    """Add the asset row; identical bytes uploaded before reuse the finished variants."""
+    asset = MediaAsset(
+        owner_type=owner_type, owner_id=owner_id, content_hash=content_hash,
+        original_name=name, width=width, height=height,
+    )
+    processed = MediaAsset.query.filter_by(content_hash=content_hash, status="ready").first()
+    if processed:
+        asset.placeholder = processed.placeholder
+        asset.variants = processed.variants
+        asset.status = "ready"
+    db.session.add(asset)
+    return asset
+
+
+def schedule_media_processing(asset):
+    if asset.status == "pending":
+        app = current_app._get_current_object()
+        app.extensions["media_executor"].submit(process_media_asset, app, asset.id)
+
+
+def delete_media_for(owner_type, owner_id):
+    """
+    Drop an owner's asset rows and return the file names no other asset shares
+    a content hash with. Pass them to remove_media_files() after the commit, so
+    a failed commit doesn't leave rows pointing at deleted files.
+    """
+    names = []
+    for asset in MediaAsset.query.filter_by(owner_type=owner_type, owner_id=owner_id).all():
+        db.session.delete(asset)
+        shared = MediaAsset.query.filter(
+            MediaAsset.content_hash == asset.content_hash, MediaAsset.id != asset.id
+        ).count()
+        if shared:
+            continue
+        names.append(asset.original_name)
+        for files in (json.loads(asset.variants) if asset.variants else {}).values():
+            names.extend(files.values())
+    return names
+
+
+def remove_media_files(names):
+    for name in names:
+        try:
+            os.remove(os.path.join(current_app.config['MEDIA_ROOT'], name))
+        except FileNotFoundError:
+            pass
+
+
+def srgb_to_linear(value):
+    value = value / 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def linear_to_srgb(value):
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def base83(value, length):
+    return "".join(BLURHASH_CHARACTERS[value // 83 ** (length - i - 1) % 83] for i in range(length))
+
+
+def blurhash_encode(image, x_components=4, y_components=3):
+    """Encode an RGB image as a BlurHash string (https://blurha.sh)."""
+    small = image.copy()
+    small.thumbnail((32, 32))
+    width, height = small.size
+    pixels = [tuple(srgb_to_linear(channel) for channel in pixel) for pixel in small.getdata()]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            r = g_ = b = 0.0
+            for y in range(height):
+                basis_y = math.cos(math.pi * j * y / height)
+                for x in range(width):
+                    basis = normalisation * math.cos(math.pi * i * x / width) * basis_y
+                    pr, pg, pb = pixels[y * width + x]
+                    r += basis * pr
+                    g_ += basis * pg
+                    b += basis * pb
+            scale = 1 / (width * height)
+            factors.append((r * scale, g_ * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, int(max(abs(v) for factor in ac for v in factor) * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1
+    result += base83(quantised_max, 1)
+    result += base83((linear_to_srgb(dc[0]) << 16) + (linear_to_srgb(dc[1]) << 8) + linear_to_srgb(dc[2]), 4)
+
+    def quantise(value):
+        value /= max_value
+        return max(0, min(18, int(math.copysign(abs(value) ** 0.5, value) * 9 + 9.5)))
+
+    for r, g_, b in ac:
+        result += base83(quantise(r) * 19 * 19 + quantise(g_) * 19 + quantise(b), 2)
+    return result
+
+
+def process_media_asset(app, asset_id):
+    """Background worker: resized JPEG + WebP variants and the BlurHash placeholder."""
+    with app.app_context():
+        asset = db.session.get(MediaAsset, asset_id)
+        if not asset or asset.status != "pending":
+            return
+        media_root = app.config['MEDIA_ROOT']
+        try:
+            with Image.open(os.path.join(media_root, asset.original_name)) as original:
+                image = ImageOps.exif_transpose(original).convert("RGB")
+            largest = min(image.width, MEDIA_VARIANT_WIDTHS[-1])
+            widths = sorted({w for w in MEDIA_VARIANT_WIDTHS if w < image.width} | {largest})
+            variants = {}
+            for width in widths:
+                resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+                for image_format, ext, options in (
+                    ("WEBP", "webp", {"quality": 80, "method": 4}),
+                    ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+                ):
+                    name = f"{asset.content_hash[:16]}-{width}.{ext}"
+                    resized.save(os.path.join(media_root, name), image_format, **options)
+                    variants.setdefault(str(width), {})[ext] = name
+            asset.placeholder = blurhash_encode(image)
+            asset.variants = json.dumps(variants)
+            asset.status = "ready"
+            print(f"🖼️ Processed media asset {asset_id}: {len(widths)} sizes")
+        except Exception as e:
+            asset.status = "failed"
+            print(f"❌ Media processing failed for asset {asset_id}: {e}")
+        db.session.commit()
+
+
+def handle_image_upload(create_owner):
+    """Shared body of the upload endpoints; create_owner() adds the owning row and returns it."""
+    file = request.files.get("file")
+    if not file:
+        return jsonify({"error": "Missing image file."}), 400
+    try:
+        content_hash, name, width, height = store_original(file.read())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 501
+
+    try:
+        owner, owner_type = create_owner(media_url(name))
+        db.session.flush()
+        asset = create_media_asset(owner_type, owner.id, content_hash, name, width, height)
+        db.session.commit()
+        if owner_type == "gallery":
+            gallery_facets().record(owner, 1)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+    schedule_media_processing(asset)
+    return jsonify({**owner.to_dict(), "image": asset.to_dict()}), 201
+
+
+@public_bp.route('/gallery/upload', methods=['POST'])
+def upload_gallery_file():
+    """
+    Upload image bytes (multipart field "file") as a new gallery photo.
+    """
+    caption = request.form.get("caption", "")
+    category = request.form.get("category", "Uncategorized")
+    photo_type = request.form.get("photo_type", "").lower()
+    try:
+        validate_photo_type(photo_type)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def create_photo(image_url):
+        photo = Gallery(image_url=image_url, caption=caption, category=category, photo_type=photo_type)
+        db.session.add(photo)
+        return photo, "gallery"
+
+    return handle_image_upload(create_photo)
+
+
+@public_bp.route('/slider-images/upload', methods=['POST'])
+def upload_slider_file():
+    """
+    Upload image bytes (multipart field "file") as a new slider image.
+    """
+    def create_slide(image_url):
+        slide = PhotoSliderImage(image_url=image_url)
+        db.session.add(slide)
+        return slide, "slider"
+
+    return handle_image_upload(create_slide)
+
+
+@public_bp.route('/media/<path:filename>', methods=['GET'])
+def serve_media(filename):
+    # Names are content hashes, so a given URL never changes content
+    response = send_from_directory(current_app.config['MEDIA_ROOT'], filename, max_age=MEDIA_CACHE_SECONDS)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+# ============================
+#   Scheduled maintenance
+# ============================
+@scheduled_task("compact_karaoke")
+def compact_karaoke_task():
+    """Clear finished and soft-deleted signups into karaoke_history (summaries are built on the way)."""
+    return {"moved": compact_karaoke_signups()}
+
+
+@scheduled_task("rebuild_rollups")
+def rebuild_rollups_task():
+    return {"nights": rebuild_night_summaries(current_app.config['ROLLUP_REBUILD_DAYS'])}
+
+
+@scheduled_task("purge_inactive_djnotes")
+def purge_inactive_djnotes_task():
+    """Hard-delete DJ notes that have been inactive for DJNOTES_RETENTION_DAYS."""
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['DJNOTES_RETENTION_DAYS'])
+    deleted = DJNotes.query.filter(DJNotes.is_active == False, DJNotes.created_at < cutoff).delete(
+        synchronize_session=False
+    )
+    db.session.commit()
+    return {"deleted": deleted}
+
+
+@scheduled_task("reset_show_state")
+def reset_show_state_task():
+    """After a show: end sessions left open too long, close the signup form and clear the music break."""
+    stale = datetime.utcnow() - timedelta(hours=current_app.config['SHOW_SESSION_MAX_HOURS'])
+    ended = ShowSession.query.filter(ShowSession.ended_at.is_(None), ShowSession.started_at < stale).update(
+        {"ended_at": datetime.utcnow()}, synchronize_session=False
+    )
+    db.session.commit()
+    g.pop("show_session_id", None)
+    if current_show_session_id() is not None:
+        return {"ended_sessions": ended, "reset": False}  # A show is still running
+
+    FormState.query.update({"show_form": False}, synchronize_session=False)
+    MusicBreakState.query.update({"show_alert": False}, synchronize_session=False)
+    db.session.commit()
+    signup_gate().invalidate()
+    return {"ended_sessions": ended, "reset": True}
+
+
+@scheduled_task("archive_promotions")
+def archive_promotions_task():
+    return {"archived": archive_past_promotions()}
+
+
+@scheduled_task("seed_song_catalog")
+def seed_song_catalog_task():
+    """Pick up songs sung last night so they autocomplete from now on."""
+    return seed_song_catalog()
+
+
+# Targets of the bulk_delete job: payload -> (model, criteria); bulk_delete() adds the max_id cutoff
+BULK_DELETE_TARGETS = {
+    "karaoke_signups": lambda payload: (Karaoke, [session_scope(Karaoke, payload.get("session_id"))]),
+    "karaoke_soft_deleted": lambda payload: (
+        Karaoke, [session_scope(Karaoke, payload.get("session_id")), Karaoke.is_deleted == True]
+    ),
+    "dj_notes": lambda payload: (DJNotes, [session_scope(DJNotes, payload.get("session_id"))]),
+}
+
+
+# ============================
+#   Read-only row serializers
+# ============================
+# Models served by the list endpoints through select_rows()
+ROW_MODELS = (Review, Contact, Expense, Income, Gallery, Karaoke, Promotions, KaraokeHistory)
+
+
+def compile_row_serializer(model):
+    """Build (columns, serialize) so list endpoints can skip ORM instances entirely."""
+    keys = tuple(column.key for column in model.__table__.columns)
+    columns = tuple(getattr(model, key) for key in keys)
+    formats = model.__datetime_formats__
+    converters = tuple(
+        (i, DATETIME_FORMATTERS[formats[key]]) for i, key in enumerate(keys) if key in formats
+    )
+
+    if not converters:
+        return columns, lambda row: dict(zip(keys, row))
+
+    def serialize(row):
+        values = list(row)
+        for i, convert in converters:
+            if values[i] is not None:
+                values[i] = convert(values[i])
+        return dict(zip(keys, values))
+
+    return columns, serialize
+
+
+ROW_SERIALIZERS = {model: compile_row_serializer(model) for model in ROW_MODELS}
+
+
+def select_rows(model, *criteria, order_by=None, limit=None):
+    """Run a column-only SELECT and serialize the Core rows directly."""
+    columns, serialize = ROW_SERIALIZERS[model]
+    stmt = db.select(*columns).where(*criteria)
+    if order_by is not None:
+        stmt = stmt.order_by(order_by)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return [serialize(row) for row in db.session.execute(stmt)]
+
+
+
+# ============================
+#   Batch mutations
+# ============================
+def _parse_iso_datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _parse_bool(value):
+    # bool("false") is True, so only real booleans and "true"/"false" are accepted
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    raise ValueError(f"Not a boolean: {value!r}")
+
+
+def _parse_photo_type(value):
+    # Same rules as the upload routes, so /gallery?photo_type= can still find the row
+    photo_type = str(value).strip().lower()
+    validate_photo_type(photo_type)
+    return photo_type
+
+
+# resource name -> (model, {field: coercer}) for everything /batch may touch
+BATCH_RESOURCES = {
+    "reviews": (Review, {
+        "name": str, "rating": float, "service": str, "image_url": str,
+        "website_url": str, "description": str, "is_approved": _parse_bool,
+    }),
+    "gallery": (Gallery, {
+        "image_url": str, "caption": str, "category": str, "photo_type": _parse_photo_type,
+    }),
+    "karaokesignup": (Karaoke, {
+        "name": str, "song": str, "artist": str, "is_flagged": _parse_bool,
+        "is_warning": _parse_bool, "is_deleted": _parse_bool, "adjustment": float,
+    }),
+    "contacts": (Contact, {
+        "first_name": str, "last_name": str, "phone": str, "email": str,
+        "message": str, "status": str,
+    }),
+    "general_inquiries": (GeneralInquiry, {
+        "contact_name": str, "contact_phone": str, "request": str,
+        "cost": int, "notes": str,
+    }),
+    "djnotes": (DJNotes, {
+        "alert_type": str, "alert_details": str, "is_active": _parse_bool,
+    }),
+    "promotions": (Promotions, {
+        "event_type": str, "event_date": _parse_iso_datetime, "location": str,
+        "image_url": str, "description": str,
+    }),
+}
+
+class BatchOperationError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def apply_batch_operation(op):
+    """Apply one batch operation to the session without committing."""
+    if not isinstance(op, dict):
+        raise BatchOperationError("Operation must be an object")
+
+    method = str(op.get("method", "")).upper()
+    resource = op.get("resource")
+    if resource not in BATCH_RESOURCES:
+        raise BatchOperationError(f"Unknown resource: {resource}")
+    model, fields = BATCH_RESOURCES[resource]
+
+    record = db.session.get(model, op.get("id")) if op.get("id") is not None else None
+    if not record:
+        raise BatchOperationError(f"{resource} {op.get('id')} not found", 404)
+
+    if method == "DELETE":
+        db.session.delete(record)
+        return {"id": record.id, "deleted": True}
+
+    if method == "PATCH":
+        data = op.get("data") or {}
+        unknown = [key for key in data if key not in fields]
+        if unknown:
+            raise BatchOperationError(f"Fields not allowed: {', '.join(unknown)}")
+        for key, value in data.items():
+            try:
+                setattr(record, key, fields[key](value) if value is not None else None)
+            except (TypeError, ValueError):
+                raise BatchOperationError(f"Invalid value for '{key}'")
+        db.session.flush()
+        return record.to_dict()
+
+    raise BatchOperationError(f"Unsupported method: {method}")
+
+
+@core_bp.route("/batch", methods=["POST"])
+def batch_mutations():
+    """
+    Run an ordered list of PATCH/DELETE operations in a single transaction.
+
+    mode "atomic" (default) rolls everything back on the first failure,
+    mode "best_effort" isolates each operation in a savepoint and commits the rest.
+    """
+    data = request.get_json() or {}
+    operations = data.get("operations")
+    mode = data.get("mode", "atomic")
+
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "operations must be a non-empty list"}), 400
+    max_operations = current_app.config['BATCH_MAX_OPERATIONS']
+    if len(operations) > max_operations:
+        return jsonify({"error": f"At most {max_operations} operations per batch"}), 400
+    if mode not in ("atomic", "best_effort"):
+        return jsonify({"error": "mode must be 'atomic' or 'best_effort'"}), 400
+
+    results = []
+    try:
+        for index, op in enumerate(operations):
+            if mode == "atomic":
+                try:
+                    result = apply_batch_operation(op)
+                except BatchOperationError as e:
+                    db.session.rollback()
+                    results.append({"index": index, "status": e.status, "error": str(e)})
+                    results.extend(
+                        {"index": i, "status": 409, "error": "Not applied"}
+                        for i in range(index + 1, len(operations))
+                    )
+                    for done in results[:index]:
+                        done.update({"status": 409, "error": "Rolled back"})
+                        done.pop("result", None)
+                    return jsonify({"mode": mode, "committed": False, "results": results}), e.status
+            else:
+                savepoint = db.session.begin_nested()
+                try:
+                    result = apply_batch_operation(op)
+                    savepoint.commit()
+                except BatchOperationError as e:
+                    savepoint.rollback()
+                    results.append({"index": index, "status": e.status, "error": str(e)})
+                    continue
+                except SQLAlchemyError as e:
+                    # Constraint violations etc. surface on flush; only this operation is undone
+                    savepoint.rollback()
+                    status = 409 if isinstance(e, IntegrityError) else 500
+                    results.append({"index": index, "status": status, "error": str(getattr(e, "orig", None) or e)})
+                    continue
+            results.append({"index": index, "status": 200, "result": result})
+
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+    touched = {op.get("resource") for op in operations if isinstance(op, dict)}
+    if "gallery" in touched:
+        gallery_facets().invalidate()
+    if "promotions" in touched:
+        invalidate_promotions_feed()
+    if "karaokesignup" in touched:
+        wait_estimator().invalidate()
+    return jsonify({"mode": mode, "committed": True, "results": results}), 200
+
+
+
+# ============================
+#   Schema upgrades
+# ============================
+# db.create_all() only creates missing tables, so columns added to existing
+# tables are listed here and added by upgrade_schema() on boot, which also
+# creates any index a model declares that an existing table lacks.
+ADDED_COLUMNS = [
+    (Karaoke, "session_id"),
+    (DJNotes, "session_id"),
+    (Karaoke, "deleted_at"),
+    (Karaoke, "catalog_song_id"),
+]
+
+
+def upgrade_schema():
+    """ALTER existing tables to add ADDED_COLUMNS and every declared index. Safe to re-run; returns the columns added."""
+    engine = db.engine
+    quote = engine.dialect.identifier_preparer.quote
+    inspector = db.inspect(engine)
+    added = []
+    for model, column_name in ADDED_COLUMNS:
+        table = model.__table__
+        if not inspector.has_table(table.name):
+            continue  # create_all() makes it complete
+        if column_name in {column["name"] for column in inspector.get_columns(table.name)}:
+            continue
+        column = table.c[column_name]
+        ddl = f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=engine.dialect)}"
+        for foreign_key in column.foreign_keys:
+            ddl += f" REFERENCES {quote(foreign_key.column.table.name)} ({quote(foreign_key.column.name)})"
+        with engine.begin() as connection:
+            connection.execute(db.text(ddl))
+        print(f"🛠️ Added column {table.name}.{column.name}")
+        added.append(f"{table.name}.{column.name}")
+
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    return added
+
+
+@click.command("upgrade-schema")
+@with_appcontext
+def upgrade_schema_command():
+    """Add columns introduced since the tables were created (run before starting new code)."""
+    added = upgrade_schema()
+    click.echo(f"Added {len(added)} columns" + (f": {', '.join(added)}" if added else ""))
+
+
+# ============================
+#   App factory
+# ============================
+def config_from_env():
+    """Settings read from the environment when an app is created, not at import."""
+    return {
+        'SQLALCHEMY_DATABASE_URI': os.getenv("SQLALCHEMY_DATABASE_URI"),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'SECRET_KEY': os.getenv("SECRET_KEY"),
+        'CORS_ORIGINS': os.getenv("CORS_ORIGINS", "*").split(","),
+        'RESTRICTED_WORDS': os.getenv("RESTRICTED_WORDS", "").split(","),
+        'RESTRICTED_WORDS_FILE': os.getenv("RESTRICTED_WORDS_FILE"),  # Hot-reloaded when it changes
+        'RESTRICTED_WORDS_RELOAD_SECONDS': float(os.getenv("RESTRICTED_WORDS_RELOAD_SECONDS", "5")),
+        'GOOGLE_MAPS_API_KEY': os.getenv("GOOGLE_MAPS_API_KEY"),
+        'HOME_ADDRESS': os.getenv("HOME_ADDRESS"),
+        'ENABLED_BLUEPRINTS': os.getenv("ENABLED_BLUEPRINTS", ",".join(BLUEPRINTS)).split(","),
+        'JSON_PROVIDER': os.getenv("JSON_PROVIDER", "orjson" if orjson is not None else "std"),
+        'BATCH_MAX_OPERATIONS': int(os.getenv("BATCH_MAX_OPERATIONS", "100")),
+        'SQL_REPEAT_THRESHOLD': int(os.getenv("SQL_REPEAT_THRESHOLD", "5")),  # Same statement N times = N+1 suspect
+        'SQL_SUMMARY_WINDOW': int(os.getenv("SQL_SUMMARY_WINDOW", "200")),  # Requests kept per route
+        'SQL_DEBUG_HEADERS': os.getenv("SQL_DEBUG_HEADERS", "").lower() in ("1", "true", "yes"),
+        'WARMUP_POOL_CONNECTIONS': int(os.getenv("WARMUP_POOL_CONNECTIONS", "2")),
+        'DB_PROFILE': os.getenv("DB_PROFILE"),
+        'SQLALCHEMY_BINDS': {"replica": os.getenv("SQLALCHEMY_REPLICA_URI")} if os.getenv("SQLALCHEMY_REPLICA_URI") else {},
+        'READ_YOUR_WRITES_SECONDS': int(os.getenv("READ_YOUR_WRITES_SECONDS", "5")),
+        'REPLICA_RETRY_SECONDS': int(os.getenv("REPLICA_RETRY_SECONDS", "30")),
+        'RATE_LIMITS': {**DEFAULT_RATE_LIMITS, **parse_rate_limits(os.getenv("RATE_LIMITS", ""))},
+        'RATE_LIMIT_BACKEND': os.getenv("RATE_LIMIT_BACKEND", "sqlite"),
+        'RATE_LIMIT_SQLITE_PATH': os.getenv("RATE_LIMIT_SQLITE_PATH", "/tmp/portfolio-ratelimit.db"),
+        'IDEMPOTENCY_BACKEND': os.getenv("IDEMPOTENCY_BACKEND", os.getenv("RATE_LIMIT_BACKEND", "sqlite")),
+        'IDEMPOTENCY_SQLITE_PATH': os.getenv("IDEMPOTENCY_SQLITE_PATH", "/tmp/portfolio-idempotency.db"),
+        'IDEMPOTENCY_TTL_SECONDS': int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")),
+        'IDEMPOTENCY_PENDING_SECONDS': int(os.getenv("IDEMPOTENCY_PENDING_SECONDS", "60")),
+        'DUPLICATE_WINDOW_SECONDS': int(os.getenv("DUPLICATE_WINDOW_SECONDS", "120")),
+        'TRUSTED_PROXY_COUNT': int(os.getenv("TRUSTED_PROXY_COUNT", "0")),  # Proxies setting X-Forwarded-For
+        'ACCESS_TOKEN_MINUTES': int(os.getenv("ACCESS_TOKEN_MINUTES", "60")),
+        'REFRESH_TOKEN_DAYS': int(os.getenv("REFRESH_TOKEN_DAYS", "14")),
+        'BCRYPT_LOG_ROUNDS': int(os.getenv("BCRYPT_LOG_ROUNDS", "12")),
+        'BCRYPT_WORKERS': int(os.getenv("BCRYPT_WORKERS", "2")),
+        'BCRYPT_MAX_PENDING': int(os.getenv("BCRYPT_MAX_PENDING", "4")),
+        'BCRYPT_TIMEOUT_SECONDS': float(os.getenv("BCRYPT_TIMEOUT_SECONDS", "10")),
+        'LOGIN_ATTEMPTS_PER_USER': parse_rate_limits("login=" + os.getenv("LOGIN_ATTEMPTS_PER_USER", "5/300"))["login"],
+        'MEDIA_ROOT': os.getenv("MEDIA_ROOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "media")),
+        'MEDIA_BASE_URL': os.getenv("MEDIA_BASE_URL"),  # e.g. a CDN in front of /media; defaults to this host
+        'MEDIA_WORKERS': int(os.getenv("MEDIA_WORKERS", "1")),
+        'GALLERY_FACETS_MAX_AGE': float(os.getenv("GALLERY_FACETS_MAX_AGE", "60")),
+        'PROMOTIONS_GRACE_HOURS': int(os.getenv("PROMOTIONS_GRACE_HOURS", "6")),  # Tonight's show stays "upcoming"
+        'PROMOTIONS_ARCHIVE_AFTER_HOURS': int(os.getenv("PROMOTIONS_ARCHIVE_AFTER_HOURS", "48")),
+        'PROMOTIONS_EVENT_HOURS': int(os.getenv("PROMOTIONS_EVENT_HOURS", "3")),
+        'PROMOTIONS_FEED_LIMIT': int(os.getenv("PROMOTIONS_FEED_LIMIT", "100")),
+        'PROMOTIONS_FEED_MAX_AGE': float(os.getenv("PROMOTIONS_FEED_MAX_AGE", "300")),
+        'PROMOTIONS_FEED_NAME': os.getenv("PROMOTIONS_FEED_NAME", "Upcoming Events"),
+        'KARAOKE_COMPACT_AFTER_HOURS': int(os.getenv("KARAOKE_COMPACT_AFTER_HOURS", "24")),
+        'JOB_WORKERS': int(os.getenv("JOB_WORKERS", "2")),  # Threads per process; 0 = enqueue only
+        'JOB_POLL_SECONDS': float(os.getenv("JOB_POLL_SECONDS", "1")),
+        'JOB_MAX_ATTEMPTS': int(os.getenv("JOB_MAX_ATTEMPTS", "5")),
+        'JOB_BACKOFF_SECONDS': float(os.getenv("JOB_BACKOFF_SECONDS", "2")),
+        'JOB_BACKOFF_MAX_SECONDS': float(os.getenv("JOB_BACKOFF_MAX_SECONDS", "300")),
+        'JOB_LEASE_SECONDS': int(os.getenv("JOB_LEASE_SECONDS", "300")),  # Running longer = worker presumed dead
+        'SCHEDULES': {**DEFAULT_SCHEDULES, **parse_schedules(os.getenv("SCHEDULES", ""))},
+        'SCHEDULER_ENABLED': os.getenv("SCHEDULER_ENABLED", "1") == "1",
+        'SCHEDULER_TICK_SECONDS': float(os.getenv("SCHEDULER_TICK_SECONDS", "15")),
+        'SCHEDULER_LEASE_SECONDS': int(os.getenv("SCHEDULER_LEASE_SECONDS", "60")),
+        'SCHEDULER_JITTER_SECONDS': float(os.getenv("SCHEDULER_JITTER_SECONDS", "30")),
+        'ROLLUP_REBUILD_DAYS': int(os.getenv("ROLLUP_REBUILD_DAYS", "7")),
+        'DJNOTES_RETENTION_DAYS': int(os.getenv("DJNOTES_RETENTION_DAYS", "7")),
+        'SHOW_SESSION_MAX_HOURS': int(os.getenv("SHOW_SESSION_MAX_HOURS", "12")),
+        'AVERAGE_SONG_SECONDS': int(os.getenv("AVERAGE_SONG_SECONDS", "240")),
+        'SINGER_CHANGEOVER_SECONDS': int(os.getenv("SINGER_CHANGEOVER_SECONDS", "30")),
+        'MUSIC_BREAK_SECONDS': int(os.getenv("MUSIC_BREAK_SECONDS", "600")),
+        'WAIT_ESTIMATOR_MAX_AGE': float(os.getenv("WAIT_ESTIMATOR_MAX_AGE", "30")),
+        'SONG_CATALOG_PATH': os.getenv("SONG_CATALOG_PATH", "song_catalog.csv"),
+        'SONG_CATALOG_MAX_AGE': float(os.getenv("SONG_CATALOG_MAX_AGE", "3600")),
+        'SONG_CATALOG_NODE_LIMIT': int(os.getenv("SONG_CATALOG_NODE_LIMIT", "100")),
+        'ROTATION_WARNING_ROUNDS': float(os.getenv("ROTATION_WARNING_ROUNDS", "1")),
+        'ROTATION_HISTORY_HOURS': float(os.getenv("ROTATION_HISTORY_HOURS", "12")),
+        'SIGNUP_GATE_ENABLED': os.getenv("SIGNUP_GATE_ENABLED", "1") == "1",
+        'SIGNUP_GATE_MAX_AGE': float(os.getenv("SIGNUP_GATE_MAX_AGE", "5")),
+        'MAX_CONTENT_LENGTH': int(os.getenv("MAX_UPLOAD_MB", "15")) * 1024 * 1024,
+    }
+
+
+def configure_engine_options(app):
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not database_uri:
+        return
+    url = make_url(database_uri)
+    profile_name = app.config['DB_PROFILE'] or ("local" if url.get_backend_name() == "sqlite" else "web")
+    if profile_name not in DB_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE '{profile_name}'. Available: {', '.join(DB_PROFILES)}")
+    profile = DB_PROFILES[profile_name]
+    app.config['DB_PROFILE'] = profile_name
+
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return  # In-memory SQLite needs its single-connection pool
+
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    options.setdefault('poolclass', InstrumentedQueuePool)
+    for key in POOL_OPTIONS:
+        options.setdefault(key, profile[key])
+    if url.get_backend_name() == "postgresql" and profile["statement_timeout_ms"]:
+        # Session default; routes decorated with @statement_timeout override it per transaction
+        options.setdefault('connect_args', {}).setdefault(
+            'options', f"-c statement_timeout={profile['statement_timeout_ms']}"
+        )
+
+
+def create_app(config=None):
+    """Build an app with the core blueprint plus every enabled subsystem."""
+    app = Flask(__name__)
+    app.config.update(config_from_env())
+    if config:
+        app.config.update(config)
+
+    CORS(app, supports_credentials=True, resources={r"/*": {"origins": app.config['CORS_ORIGINS']}})
+    if app.config['TRUSTED_PROXY_COUNT']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXY_COUNT'])
+
+    json_provider = app.config['JSON_PROVIDER']
+    if json_provider not in JSON_PROVIDERS:
+        print(f"JSON provider '{json_provider}' unavailable, using std")
+        json_provider = "std"
+    app.json = JSON_PROVIDERS[json_provider](app)
+
+    configure_engine_options(app)
+    db.init_app(app)
+    bcrypt.init_app(app)
+    migrate.init_app(app, db)
+
+    # Forked workers (gunicorn --preload) must not reuse the parent's pooled connections
+    app_ref = weakref.ref(app)
+    os.register_at_fork(after_in_child=lambda: app_ref() and dispose_engines(app_ref(), close=False))
+
+    app.extensions["rate_limiter"] = create_rate_limiter(app) if app.config['RATE_LIMITS'] else None
+    app.extensions["idempotency_store"] = create_idempotency_store(app)
+    load_restricted_words(app)
+    app.extensions["password_hasher"] = PasswordHasher(
+        app.config['BCRYPT_WORKERS'], app.config['BCRYPT_MAX_PENDING'], app.config['BCRYPT_TIMEOUT_SECONDS']
+    )
+    app.extensions["media_executor"] = ThreadPoolExecutor(
+        max_workers=app.config['MEDIA_WORKERS'], thread_name_prefix="media"
+    )
+    app.extensions["gallery_facets"] = GalleryFacetIndex(app.config['GALLERY_FACETS_MAX_AGE'])
+    app.extensions["wait_estimator"] = WaitTimeEstimator(app.config['WAIT_ESTIMATOR_MAX_AGE'])
+    app.extensions["signup_gate"] = SignupGate(app.config['SIGNUP_GATE_MAX_AGE'])
+    app.extensions["song_catalog"] = SongCatalogIndex(
+        app.config['SONG_CATALOG_MAX_AGE'], app.config['SONG_CATALOG_NODE_LIMIT']
+    )
+    app.extensions["job_queue"] = JobQueue(app, app.config['JOB_WORKERS'], app.config['JOB_POLL_SECONDS'])
+    app.extensions["scheduler"] = Scheduler(app, app.config['SCHEDULES'])
+    app.extensions["promotions_feed"] = {"lock": threading.Lock(), "body": None, "etag": None, "built_at": 0.0}
+    app.cli.add_command(sync_replica_command)
+    app.cli.add_command(migrate_instagram_posts_command)
+    app.cli.add_command(upgrade_schema_command)
+    app.cli.add_command(archive_promotions_command)
+    app.cli.add_command(compact_karaoke_command)
+    app.cli.add_command(seed_song_catalog_command)
+    app.register_blueprint(core_bp)
+    for name in app.config['ENABLED_BLUEPRINTS']:
+        name = name.strip()
+        if name not in BLUEPRINTS:
+            raise ValueError(f"Unknown blueprint '{name}'. Available: {', '.join(BLUEPRINTS)}")
+        app.register_blueprint(BLUEPRINTS[name])
+
+    return app
+
+
+# Run in each worker after the app is loaded (see gunicorn.conf.py)
+WARMUP_TASKS = []
+
+
+def warmup_task(func):
+    WARMUP_TASKS.append(func)
+    return func
+
+
+@warmup_task
+def prime_connection_pool():
+    """Open the first pooled connections now instead of on the first requests."""
+    connections = [db.engine.connect() for _ in range(current_app.config['WARMUP_POOL_CONNECTIONS'])]
+    for connection in connections:
+        connection.execute(db.text("SELECT 1"))
+        connection.close()
+
+
+@warmup_task
+def start_job_workers():
+    """Pick up jobs queued before this worker started."""
+    current_app.extensions["job_queue"].start()
+
+
+@warmup_task
+def build_song_catalog_index():
+    """Build the autocomplete trie before the first keystroke asks for it."""
+    song_catalog().warm()
+
+
+@warmup_task
+def start_scheduler():
+    if current_app.config['SCHEDULER_ENABLED']:
+        current_app.extensions["scheduler"].start()
+
+
+def warm_up(app):
+    with app.app_context():
+        for task in WARMUP_TASKS:
+            try:
+                task()
+            except Exception as e:
+                print(f"Warm-up task {task.__name__} failed: {e}")
+
+
+def __getattr__(name):
+    # `gunicorn app:app` and `from app import app` build the default app on first access
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 # Initialize database and run server
 if __name__ == "__main__":
+    app = create_app()
     with app.app_context():
         db.create_all()
+        upgrade_schema()
+        migrate_instagram_post_blob()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,70 @@
+"""
+Benchmark: ORM to_dict() vs the column-only row path used by the list endpoints.
+
+Usage: python bench_list_endpoints.py [rows]
+Runs against a throwaway SQLite file unless SQLALCHEMY_DATABASE_URI is set.
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ.setdefault("SQLALCHEMY_DATABASE_URI", f"sqlite:///{DB_PATH}")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from app import app, db, select_rows, Expense, Gallery, Karaoke  # noqa: E402
+
+
+def seed():
+    now = datetime.utcnow()
+    db.session.add_all(
+        Expense(item=f"item {i}", cost=i * 1.5, frequency="Monthly", purchase_date=now,
+                purchase_location="Store", card_used="Visa", notes="n", created_at=now)
+        for i in range(ROWS)
+    )
+    db.session.add_all(
+        Gallery(image_url=f"https://example.com/{i}.jpg", caption="c", category="events",
+                photo_type="portrait", created_at=now)
+        for i in range(ROWS)
+    )
+    db.session.add_all(
+        Karaoke(name=f"singer {i}", song="song", artist="artist", position=i, created_at=now)
+        for i in range(ROWS)
+    )
+    db.session.commit()
+
+
+def measure(fn):
+    db.session.expunge_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # Karaoke.to_dict prints every row
+        fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    with app.app_context():
+        db.create_all()
+        seed()
+        print(f"{'model':<10} {'path':<5} {'ms':>9} {'peak MiB':>9}")
+        for model in (Expense, Gallery, Karaoke):
+            orm = measure(lambda: [obj.to_dict() for obj in model.query.all()])
+            rows = measure(lambda: select_rows(model))
+            for label, (elapsed, peak) in (("orm", orm), ("rows", rows)):
+                print(f"{model.__name__:<10} {label:<5} {elapsed * 1000:>9.1f} {peak / 2**20:>9.2f}")
+            print(f"{'':<10} speedup {orm[0] / rows[0]:.1f}x, memory {orm[1] / rows[1]:.1f}x less")
+    os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import os
+import resource
+import shutil
+import time
+
+# Workers write Prometheus samples here so /metrics can aggregate across all of them
+multiproc_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/portfolio-metrics")
+
+
+def on_starting(server):
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def when_ready(server):
+    # Create missing tables once in the master, before any worker is forked
+    if os.getenv("CREATE_TABLES_ON_BOOT", "1") != "1":
+        return
+    from app import create_app, db, dispose_engines, migrate_instagram_post_blob, upgrade_schema
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        upgrade_schema()  # Columns added to existing tables
+        migrate_instagram_post_blob()
+    dispose_engines(app)  # Never hand the master's connections to forked workers
+
+
+def post_fork(server, worker):
+    worker.boot_started = time.monotonic()
+
+
+def post_worker_init(worker):
+    from app import warm_up
+
+    warm_up(worker.wsgi)
+    boot_seconds = time.monotonic() - worker.boot_started
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    worker.log.info("Worker %s booted in %.3fs, max RSS %.1f MiB", worker.pid, boot_seconds, max_rss_mb)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+import pytest
+
+from app import CronExpression, parse_cron_field
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("*/15", {0, 15, 30, 45}),
+    ("5", {5}),
+    ("5/20", {5, 25, 45}),
+    ("1-3,10", {1, 2, 3, 10}),
+])
+def test_parse_cron_field(text, expected):
+    assert parse_cron_field(text, "minute", 0, 59) == expected
+
+
+def test_weekday_seven_is_sunday():
+    assert parse_cron_field("7", "weekday", 0, 6) == {0}
+    assert parse_cron_field("5-7", "weekday", 0, 6) == {0, 5, 6}
+
+
+@pytest.mark.parametrize("expr", ["60 * * * *", "* * 0 * *", "5-1 * * * *", "* * * *"])
+def test_invalid_expressions_raise(expr):
+    with pytest.raises(ValueError):
+        CronExpression(expr)
+
+
+@pytest.mark.parametrize("expr, after, expected", [
+    ("0 9 * * *", datetime(2026, 1, 1, 9, 0), datetime(2026, 1, 2, 9, 0)),
+    ("0 9 * * *", datetime(2026, 1, 1, 8, 59, 30), datetime(2026, 1, 1, 9, 0)),
+    ("@weekly", datetime(2026, 10, 19, 12, 0), datetime(2026, 10, 25, 0, 0)),
+    ("0 0 31 * *", datetime(2026, 4, 1), datetime(2026, 5, 31)),
+    ("0 0 29 2 *", datetime(2026, 3, 1), datetime(2028, 2, 29)),
+    ("30 23 31 12 *", datetime(2026, 12, 31, 23, 30), datetime(2027, 12, 31, 23, 30)),
+])
+def test_next_after(expr, after, expected):
+    assert CronExpression(expr).next_after(after) == expected
+
+
+def test_restricted_day_fields_match_either():
+    cron = CronExpression("0 0 13 * 5")  # The 13th, or any Friday
+    assert cron.next_after(datetime(2026, 11, 1)) == datetime(2026, 11, 6)  # Friday
+    assert cron.next_after(datetime(2026, 11, 7)) == datetime(2026, 11, 13)  # Also a Friday
+    assert cron.next_after(datetime(2026, 10, 10)) == datetime(2026, 10, 13)  # Tuesday the 13th
+
+
+def test_step_day_field_counts_as_unrestricted():
+    cron = CronExpression("0 0 */2 * 1")  # Mondays that fall on an odd day
+    assert not cron.days_or_weekdays
+    assert cron.next_after(datetime(2026, 10, 1)) == datetime(2026, 10, 5)
+    assert cron.next_after(datetime(2026, 10, 5)) == datetime(2026, 10, 19)
+
+
+def test_never_matching_expression_raises():
+    with pytest.raises(ValueError):
+        CronExpression("0 0 30 2 *").next_after(datetime(2026, 1, 1))
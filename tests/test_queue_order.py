@@ -0,0 +1,93 @@
+import random
+
+import pytest
+
+from app import longest_increasing_subsequence, plan_queue_positions, queue_version
+
+
+@pytest.mark.parametrize("values, length", [
+    ([], 0),
+    ([5], 1),
+    ([1, 2, 3], 3),
+    ([3, 2, 1], 1),
+    ([2, 2, 2], 1),  # Strictly increasing
+    ([10, 1, 2, 11, 3, 4], 4),
+    ([None, 1, None, 2], 2),
+])
+def test_longest_increasing_subsequence(values, length):
+    indices = longest_increasing_subsequence(values)
+    assert len(indices) == length
+    assert indices == sorted(indices)
+    picked = [values[i] for i in indices]
+    assert None not in picked
+    assert all(a < b for a, b in zip(picked, picked[1:]))
+
+
+def apply(current, changes):
+    positions = dict(current)
+    positions.update(changes)
+    return sorted(positions, key=lambda signup_id: (positions[signup_id], signup_id))
+
+
+def test_moving_one_signup_writes_one_row():
+    current = [(1, 10), (2, 20), (3, 30), (4, 40), (5, 50)]
+    changes = plan_queue_positions(current, [1, 5, 2, 3, 4])
+    assert changes == {5: 15}
+
+
+def test_no_gap_renumbers_only_the_rows_that_move():
+    current = [(1, 1), (2, 2), (3, 3), (4, 4), (5, 5)]
+    changes = plan_queue_positions(current, [1, 5, 2, 3, 4])
+    assert changes == {5: 2, 2: 3, 3: 4, 4: 5}
+
+
+def test_move_into_a_full_gap_goes_past_the_end_instead():
+    current = [(1, 1), (2, 2), (3, 3)]
+    changes = plan_queue_positions(current, [2, 3, 1])
+    assert changes == {1: 4}
+
+
+def test_unchanged_order_writes_nothing():
+    current = [(1, 10), (2, 20), (3, 30)]
+    assert plan_queue_positions(current, [1, 2, 3]) == {}
+
+
+def test_duplicate_positions_are_moved_past_the_head():
+    current = [(1, 1), (2, 1), (3, 1)]
+    changes = plan_queue_positions(current, [3, 2, 1])
+    assert changes == {3: -1, 2: 0}  # Two writes beat renumbering all three
+    assert apply(current, changes) == [3, 2, 1]
+
+
+def test_missing_positions_are_renumbered_from_one():
+    current = [(1, None), (2, None), (3, None)]
+    assert plan_queue_positions(current, [3, 1, 2]) == {3: 1, 1: 2, 2: 3}
+
+
+def test_random_reorders_reach_the_desired_order():
+    rng = random.Random(48)
+    for _ in range(500):
+        ids = list(range(1, rng.randint(1, 12) + 1))
+        current = list(zip(ids, sorted(rng.sample(range(1, 40), len(ids)))))
+        desired = ids[:]
+        rng.shuffle(desired)
+        assert apply(current, plan_queue_positions(current, desired)) == desired
+
+
+def test_with_wide_gaps_only_rows_off_the_lis_are_written():
+    rng = random.Random(47)
+    for _ in range(500):
+        ids = list(range(1, rng.randint(1, 12) + 1))
+        current = [(signup_id, signup_id * 1000) for signup_id in ids]
+        desired = ids[:]
+        rng.shuffle(desired)
+        changes = plan_queue_positions(current, desired)
+        kept = longest_increasing_subsequence([signup_id * 1000 for signup_id in desired])
+        assert len(changes) == len(ids) - len(kept)
+        assert apply(current, changes) == desired
+
+
+def test_queue_version_tracks_ids_and_positions():
+    assert queue_version([(1, 1), (2, 2)]) == queue_version([(1, 1), (2, 2)])
+    assert queue_version([(1, 1), (2, 2)]) != queue_version([(1, 1), (2, 3)])
+    assert queue_version([(1, 1), (2, 2)]) != queue_version([(2, 1), (1, 2)])
@@ -0,0 +1,50 @@
+import pytest
+
+import app as appmod
+from app import MemoryRateLimitBackend, SQLiteRateLimitBackend, parse_rate_limits, take_token
+
+
+def test_take_token_spends_the_burst_then_refuses():
+    tokens, now = 3, 100.0
+    for _ in range(3):
+        tokens, retry_after = take_token(tokens, now, 3, 0.5, now)
+        assert retry_after == 0.0
+    tokens, retry_after = take_token(tokens, now, 3, 0.5, now)
+    assert tokens == 0
+    assert retry_after == pytest.approx(2.0)  # One token every 2s
+
+
+def test_take_token_refills_up_to_capacity():
+    tokens, retry_after = take_token(0, 100.0, 3, 0.5, 101.0)
+    assert (tokens, retry_after) == (0.5, pytest.approx(1.0))
+    tokens, retry_after = take_token(0, 100.0, 3, 0.5, 1000.0)
+    assert (tokens, retry_after) == (2, 0.0)  # Capped at 3 before taking one
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(appmod.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.mark.parametrize("make_backend", [
+    lambda tmp_path: MemoryRateLimitBackend(),
+    lambda tmp_path: SQLiteRateLimitBackend(str(tmp_path / "limits.db")),
+], ids=["memory", "sqlite"])
+def test_backend_refills_after_waiting(make_backend, tmp_path, clock):
+    backend = make_backend(tmp_path)
+    assert [backend.take("ip", 2, 1 / 30) for _ in range(2)] == [0.0, 0.0]
+    assert backend.take("ip", 2, 1 / 30) == pytest.approx(30.0)
+    assert backend.take("other-ip", 2, 1 / 30) == 0.0  # Buckets are per key
+
+    clock[0] += 30
+    assert backend.take("ip", 2, 1 / 30) == 0.0
+    assert backend.take("ip", 2, 1 / 30) == pytest.approx(30.0)
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits("POST /reviews=5/600, POST /contacts=3/60,") == {
+        "POST /reviews": (5, 600.0),
+        "POST /contacts": (3, 60.0),
+    }
@@ -0,0 +1,30 @@
+import pytest
+
+from app import RestrictedWordMatcher
+
+
+@pytest.fixture
+def matcher():
+    return RestrictedWordMatcher(["hell", "ass", "bad word"])
+
+
+@pytest.mark.parametrize("text", ["Hello", "Adele", "Glass Animals", "Class", "Shell Shocked", "Assassin", "badwordsmith"])
+def test_benign_titles_pass(matcher, text):
+    assert matcher.find(text) == []
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("hell", ["hell"]),
+    ("Highway to Hell", ["hell"]),
+    ("h3ll yeah", ["hell"]),
+    ("h e l l", ["hell"]),
+    ("what an @$$", ["ass"]),
+    ("a BAD   word here", ["bad word"]),
+])
+def test_restricted_words_match_whole_tokens(matcher, text, expected):
+    assert matcher.find(text) == expected
+
+
+def test_check_fields_reports_only_offending_fields(matcher):
+    data = {"name": "Sam", "song": "Hello", "artist": "Hell Yeah"}
+    assert matcher.check_fields(data, ["name", "song", "artist"]) == ["artist"]
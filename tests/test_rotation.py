@@ -0,0 +1,71 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from app import fair_rotation_order, rotation_singer
+
+
+@pytest.fixture(autouse=True)
+def app_context():
+    app = Flask(__name__)
+    app.config["ROTATION_WARNING_ROUNDS"] = 1
+    with app.app_context():
+        yield
+
+
+def queue(*names, **overrides):
+    """Signups in signup-time order; overrides maps an index to extra attributes."""
+    start = datetime(2026, 10, 19, 20, 0)
+    signups = []
+    for i, name in enumerate(names):
+        signup = SimpleNamespace(
+            id=i + 1, name=name, created_at=start + timedelta(minutes=i),
+            adjustment=0.0, is_warning=False, is_flagged=False,
+        )
+        for key, value in overrides.get(f"s{i}", {}).items():
+            setattr(signup, key, value)
+        signups.append(signup)
+    return signups
+
+
+def names(order):
+    return [signup.name for signup, _ in order]
+
+
+def test_singers_are_interleaved_by_round():
+    order = fair_rotation_order(queue("Ann", "Ann", "Ann", "Bo", "Cy", "Bo"), Counter(), keep_current=False)
+    assert names(order) == ["Ann", "Bo", "Cy", "Ann", "Bo", "Ann"]
+    assert [rotation_round for _, rotation_round in order] == [0, 0, 0, 1, 1, 2]
+
+
+def test_current_singer_stays_and_counts_as_their_song():
+    order = fair_rotation_order(queue("Bo", "Ann", "Bo", "Cy"), Counter(), keep_current=True)
+    assert names(order) == ["Bo", "Ann", "Cy", "Bo"]
+
+
+def test_songs_already_sung_push_a_singer_back():
+    order = fair_rotation_order(queue("Ann", "Bo"), Counter({"ann": 1}), keep_current=False)
+    assert names(order) == ["Bo", "Ann"]
+
+
+def test_singer_names_are_compared_loosely():
+    assert rotation_singer("  Mary  Jane ") == rotation_singer("mary jane")
+    order = fair_rotation_order(queue("Ann", "ANN ", "Bo"), Counter(), keep_current=False)
+    assert names(order) == ["Ann", "Bo", "ANN "]
+
+
+def test_adjustment_warning_and_flag():
+    signups = queue(
+        "Ann", "Bo", "Cy", "Di", "Ed",
+        s0={"is_flagged": True}, s1={"is_warning": True}, s3={"adjustment": -1},
+    )
+    order = fair_rotation_order(signups, Counter(), keep_current=False)
+    # Di is moved up a round, Bo's warning costs a round, flagged Ann waits at the back
+    assert names(order) == ["Di", "Cy", "Ed", "Bo", "Ann"]
+
+
+def test_empty_queue():
+    assert fair_rotation_order([], Counter()) == []
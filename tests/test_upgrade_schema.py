@@ -0,0 +1,34 @@
+import pytest
+
+from app import create_app, db, upgrade_schema
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'app.db'}",
+        "SECRET_KEY": "test-secret",
+        "RATE_LIMITS": {},
+        "IDEMPOTENCY_BACKEND": "memory",
+    })
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+def index_names(table_name):
+    return {index["name"] for index in db.inspect(db.engine).get_indexes(table_name)}
+
+
+def test_declared_indexes_are_created_on_existing_tables(app):
+    with db.engine.begin() as connection:
+        connection.execute(db.text("DROP INDEX ix_promotions_event_date"))
+        connection.execute(db.text("DROP INDEX ix_gallery_photo_type"))
+    assert "ix_promotions_event_date" not in index_names("promotions")
+
+    upgrade_schema()
+    upgrade_schema()  # Safe to re-run
+
+    assert "ix_promotions_event_date" in index_names("promotions")
+    assert "ix_gallery_photo_type" in index_names("gallery")
+